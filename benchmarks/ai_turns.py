@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Teste de carga dos turnos de jogo com o backend de IA falso
+Vários jogadores simultâneos fazem ações (com e sem streaming) contra o app em processo;
+mede turnos por segundo e a latência dos turnos de um worker
+
+Uso: python benchmarks/ai_turns.py [--players 8] [--turns 5] [--stream]
+Latência, cadência e falhas do backend falso vêm de AI_FAKE_* (ver src/ai_config.py)
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('AI_BACKEND', 'fake')
+os.environ.setdefault('AI_FAKE_LATENCY_MEDIAN', '0.3')
+
+import numpy as np
+from flask import Flask
+from src.models.user import db
+from src.models.migrations import upgrade_database
+from src.routes.auth import auth_bp
+from src.routes.character import character_bp
+from src.routes.game import game_bp
+
+def build_app(database_path):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'bench'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(character_bp, url_prefix='/api/characters')
+    app.register_blueprint(game_bp, url_prefix='/api/game')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade_database()
+    return app
+
+def start_player(app, number):
+    """Cria usuário, personagem e sessão; retorna o cliente logado e o id da sessão"""
+    client = app.test_client()
+    credentials = {'username': f'bench{number}', 'email': f'bench{number}@example.com', 'password': 'bench'}
+    client.post('/api/auth/register', json=credentials)
+    client.post('/api/auth/login', json=credentials)
+    response = client.post('/api/characters/', json={'name': f'Herói {number}', 'race': 'human',
+                                                     'character_class': 'warrior'})
+    character_id = response.get_json()['character']['id']
+    response = client.post('/api/game/sessions', json={'session_name': f'Bench {number}',
+                                                       'character_id': character_id})
+    return client, response.get_json()['session']['id']
+
+def play(client, session_id, turns, stream, latencies, errors):
+    path = f'/api/game/sessions/{session_id}/action' + ('/stream' if stream else '')
+    for turn in range(turns):
+        started = time.perf_counter()
+        response = client.post(path, json={'action': f'Exploro a estrada, passo {turn}'})
+        response.get_data()
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, default=8)
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--stream', action='store_true')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        app = build_app(os.path.join(directory, 'bench.db'))
+        players = [start_player(app, number) for number in range(args.players)]
+        
+        latencies = []
+        errors = []
+        threads = [threading.Thread(target=play, args=(client, session_id, args.turns, args.stream, latencies, errors))
+                   for client, session_id in players]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        
+        latencies_ms = np.array(latencies) * 1000
+        print(f"backend {os.environ['AI_BACKEND']}   jogadores {args.players}   turnos {len(latencies)}   "
+              f"{'streaming' if args.stream else 'sem streaming'}")
+        print(f"vazão {len(latencies) / elapsed:8.2f} turnos/s   erros {len(errors)}")
+        print(f"latência p50 {np.percentile(latencies_ms, 50):8.1f} ms   p95 {np.percentile(latencies_ms, 95):8.1f} ms   "
+              f"máx {latencies_ms.max():8.1f} ms")
+
+if __name__ == '__main__':
+    main()
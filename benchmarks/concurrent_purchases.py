@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Compras simultâneas contra uma única linha de estoque
+Vários clientes compram o mesmo item ao mesmo tempo; verifica que o estoque nunca fica negativo
+e que o ouro é debitado exatamente uma vez por compra bem-sucedida
+
+Uso: python benchmarks/concurrent_purchases.py [--buyers 20]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models.user import db
+from src.models.character import Character
+from src.models.npc import NPC
+from src.models.game_session import GameSession
+from src.models.catalog import CatalogItem
+from src.models.inventory import InventoryItem
+from src.models.shop import Shop, ShopStock
+from src.models.migrations import upgrade_database
+from src.routes.auth import auth_bp
+from src.routes.shop import shop_bp
+
+CREDENTIALS = {'username': 'bench', 'email': 'bench@example.com', 'password': 'bench'}
+
+# (nome, estoque, ouro, preço): um cenário limitado pelo estoque e outro pelo ouro
+SCENARIOS = [
+    ('estoque limita', 5, 1000, 20),
+    ('ouro limita', 50, 100, 30)
+]
+
+def build_app(database_path):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'bench'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(shop_bp, url_prefix='/api/shop')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade_database()
+    return app
+
+def logged_client(app):
+    client = app.test_client()
+    client.post('/api/auth/login', json=CREDENTIALS)
+    return client
+
+def seed(app, name, stock_quantity, gold, price):
+    """Cria personagem, item de catálogo e a linha de estoque disputada"""
+    with app.app_context():
+        client = app.test_client()
+        client.post('/api/auth/register', json=CREDENTIALS)
+        user_id = client.post('/api/auth/login', json=CREDENTIALS).get_json()['user']['id']
+        
+        character = Character(user_id=user_id, name=name, race='human', character_class='warrior', gold=gold)
+        catalog_item = CatalogItem.upsert({'name': f'Poção ({name})', 'type': 'potion', 'price': price})
+        shop = Shop(location_key=name, location=name, shop_type='alchemist')
+        db.session.add_all([character, shop])
+        db.session.flush()
+        stock = ShopStock(shop_id=shop.id, catalog_id=catalog_item.id, price=price, quantity=stock_quantity)
+        db.session.add(stock)
+        db.session.commit()
+        return character.id, stock.id, catalog_item.id
+
+def run_scenario(app, buyers, name, stock_quantity, gold, price):
+    character_id, stock_id, catalog_id = seed(app, name, stock_quantity, gold, price)
+    clients = [logged_client(app) for _ in range(buyers)]
+    barrier = threading.Barrier(buyers)
+    
+    def buy(client):
+        barrier.wait()
+        response = client.post('/api/shop/buy', json={'character_id': character_id, 'item': {'stock_id': stock_id}})
+        return response.status_code
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(buyers) as executor:
+        codes = list(executor.map(buy, clients))
+    elapsed = time.perf_counter() - started
+    
+    with app.app_context():
+        remaining_stock = db.session.get(ShopStock, stock_id).quantity
+        remaining_gold = db.session.get(Character, character_id).gold
+        stack = InventoryItem.query.filter_by(character_id=character_id, catalog_id=catalog_id).first()
+        owned = stack.quantity if stack else 0
+    
+    successes = codes.count(200)
+    expected = min(buyers, stock_quantity, gold // price)
+    print(f"{name:<16} compras {successes:3d}/{buyers}   estoque {remaining_stock:3d}   ouro {remaining_gold:5d}   "
+          f"inventário {owned:3d}   {elapsed * 1000:7.1f} ms")
+    
+    assert all(code in (200, 400, 409) for code in codes), f'Respostas inesperadas: {sorted(codes)}'
+    assert remaining_stock >= 0, 'Estoque negativo'
+    assert successes == expected, f'Esperadas {expected} compras, houve {successes}'
+    assert remaining_stock == stock_quantity - successes, 'Estoque baixado mais de uma vez por compra'
+    assert remaining_gold == gold - price * successes, 'Ouro debitado mais de uma vez por compra'
+    assert owned == successes, 'Inventário diferente do número de compras'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--buyers', type=int, default=20)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        app = build_app(os.path.join(directory, 'bench.db'))
+        for scenario in SCENARIOS:
+            run_scenario(app, args.buyers, *scenario)
+    print('ok: estoque nunca negativo e um débito por compra')
+
+if __name__ == '__main__':
+    main()
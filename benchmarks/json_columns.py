@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark das colunas JSON rastreadas
+Compara o custo antigo (json.loads/json.dumps a cada acesso) com as colunas decodificadas
+uma vez por carga da instância
+
+Uso: python benchmarks/json_columns.py
+"""
+
+import json
+import os
+import sys
+import timeit
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+from src.models.user import db, User
+from src.models.character import Character
+from src.models.npc import NPC
+from src.models.game_session import GameSession
+
+ROUNDS = 2000
+NPC_JSON_COLUMNS = ['personality_traits', 'goals_short_term', 'goals_long_term', 'fears',
+                    'relationships', 'memory_log', 'interaction_history', 'learned_skills']
+
+def build_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    return app
+
+def seed():
+    user = User(username='bench', email='bench@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    
+    character = Character(user_id=user.id, name='Bench', race='human', character_class='warrior')
+    character.set_advantages([{'id': f'adv{i}', 'name': f'Vantagem {i}'} for i in range(5)])
+    character.set_equipment({'weapon': 'Espada', 'armor': 'Couro'})
+    db.session.add(character)
+    db.session.flush()
+    for i in range(20):
+        character.add_known_npc({'id': i, 'name': f'NPC {i}'})
+    
+    game_session = GameSession(user_id=user.id, character_id=character.id, session_name='Bench')
+    db.session.add(game_session)
+    db.session.flush()
+    
+    npc = NPC(game_session_id=game_session.id, name='Mercador', race='human')
+    npc.set_personality_traits(['astuto', 'generoso', 'desconfiado'])
+    npc.set_relationships({str(i): 'neutro' for i in range(10)})
+    for i in range(200):
+        npc.add_memory(f'Lembrança número {i} sobre a cidade e seus habitantes')
+    db.session.add(npc)
+    db.session.commit()
+    return character.id, npc.id
+
+def raw_columns(table, row_id, columns):
+    row = db.session.execute(text(f'SELECT {", ".join(columns)} FROM {table} WHERE id = :id'), {'id': row_id}).one()
+    return dict(zip(columns, row))
+
+def report(label, legacy_seconds, tracked_seconds):
+    legacy_us = legacy_seconds / ROUNDS * 1e6
+    tracked_us = tracked_seconds / ROUNDS * 1e6
+    print(f"{label:<32} antigo {legacy_us:9.1f} µs   rastreado {tracked_us:9.1f} µs   ({legacy_us / tracked_us:5.1f}x)")
+
+def main():
+    app = build_app()
+    with app.app_context():
+        db.create_all()
+        character_id, npc_id = seed()
+        character = db.session.get(Character, character_id)
+        npc = db.session.get(NPC, npc_id)
+        
+        # to_dict: antes cada chamada decodificava todas as colunas JSON de novo
+        npc_raw = raw_columns('npc', npc_id, NPC_JSON_COLUMNS)
+        tracked = timeit.timeit(npc.to_dict, number=ROUNDS)
+        legacy = timeit.timeit(lambda: (npc.to_dict(), [json.loads(v) for v in npc_raw.values()]), number=ROUNDS)
+        report('NPC.to_dict', legacy, tracked)
+        
+        # O inventário vem da tabela inventory_item e fica fora da comparação
+        character_fields = [field for field in Character.FIELD_COLUMNS if field != 'inventory']
+        character_raw = raw_columns('character', character_id,
+                                    ['advantages', 'disadvantages', 'equipment', 'known_npcs'])
+        tracked = timeit.timeit(lambda: character.to_dict(character_fields), number=ROUNDS)
+        legacy = timeit.timeit(lambda: (character.to_dict(character_fields), [json.loads(v) for v in character_raw.values()]), number=ROUNDS)
+        report('Character.to_dict', legacy, tracked)
+        
+        # add_memory: antes cada chamada fazia loads + dumps do log inteiro
+        memory_log = npc_raw['memory_log']
+        def legacy_add_memory():
+            nonlocal memory_log
+            memories = json.loads(memory_log)
+            memories.append({'timestamp': '2024-01-01T00:00:00', 'event': 'nova lembrança'})
+            memory_log = json.dumps(memories)
+        legacy = timeit.timeit(legacy_add_memory, number=ROUNDS)
+        tracked = timeit.timeit(lambda: npc.add_memory('nova lembrança'), number=ROUNDS)
+        # O rastreado codifica uma única vez, no flush
+        tracked += timeit.timeit(db.session.commit, number=1)
+        report(f'NPC.add_memory x{ROUNDS} + flush', legacy, tracked)
+
+if __name__ == '__main__':
+    main()
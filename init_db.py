@@ -12,6 +12,11 @@ from src.models.user import User
 from src.models.character import Character
 from src.models.npc import NPC
 from src.models.game_session import GameSession
+from src.models.story_entry import StoryEntry
+from src.models.roll_log import RollLog
+from src.models.catalog import CatalogItem
+from src.models.inventory import InventoryItem
+from src.models.shop import Shop, ShopStock
 
 def init_database():
     """Inicializa o banco de dados criando todas as tabelas"""
@@ -33,6 +38,12 @@ def init_database():
             print("- characters") 
             print("- npcs")
             print("- game_sessions")
+            print("- story_entries")
+            print("- roll_logs")
+            print("- catalog_items")
+            print("- inventory_items")
+            print("- shops")
+            print("- shop_stock")
             
         except Exception as e:
             print(f"❌ Erro ao inicializar banco: {e}")
@@ -3,6 +3,8 @@ Configurações da IA para RPG Imersivo
 Sistema de IA sem limitações para experiência realista
 """
 
+import os
+
 # Prompts base para diferentes tipos de interação
 MASTER_SYSTEM_PROMPT = """Você é um Mestre de RPG (Dungeon Master) experiente criando uma aventura de fantasia medieval completamente imersiva e realista.
 
@@ -113,3 +115,91 @@ MAX_TOKENS = {
     'detailed_scene': 1200
 }
 
+# Execução concorrente das chamadas de IA de um turno
+AI_TURN_DEADLINE = 45         # Prazo total (segundos) para narração + ações de NPCs
+AI_MAX_CONCURRENT_CALLS = 8   # Chamadas simultâneas por worker
+
+
+# Cliente HTTP da IA (um pool de conexões keep-alive por worker)
+AI_CLIENT_SETTINGS = {
+    'api_key': os.environ.get('OPENAI_API_KEY'),
+    'base_url': os.environ.get('OPENAI_BASE_URL'),              # Servidor compatível com OpenAI (ex: stub local)
+    'connect_timeout': float(os.environ.get('AI_CONNECT_TIMEOUT', 3)),
+    'read_timeout': float(os.environ.get('AI_READ_TIMEOUT', 30)),
+    'total_timeout': float(os.environ.get('AI_TOTAL_TIMEOUT', 40)),  # Orçamento total incluindo retentativas
+    'max_retries': int(os.environ.get('AI_MAX_RETRIES', 2)),
+    'backoff_base': 0.5,                                         # Segundos, dobra a cada tentativa
+    'backoff_max': 4.0,
+    'max_connections': int(os.environ.get('AI_POOL_CONNECTIONS', 10)),
+    'keepalive_expiry': 60                                       # Segundos que uma conexão ociosa fica aberta
+}
+
+# Backend de IA: 'openai' (qualquer servidor compatível, ver OPENAI_BASE_URL) ou 'fake' (testes de carga)
+AI_BACKEND = os.environ.get('AI_BACKEND', 'openai')
+
+# Backend falso: latência log-normal até o primeiro token, pedaços de streaming e falhas sorteadas
+AI_FAKE_BACKEND_SETTINGS = {
+    'latency_median': float(os.environ.get('AI_FAKE_LATENCY_MEDIAN', 0.8)),   # Segundos
+    'latency_sigma': float(os.environ.get('AI_FAKE_LATENCY_SIGMA', 0.5)),     # Dispersão (log-normal)
+    'chunk_interval': float(os.environ.get('AI_FAKE_CHUNK_INTERVAL', 0.03)),  # Segundos entre pedaços do stream
+    'chunk_words': int(os.environ.get('AI_FAKE_CHUNK_WORDS', 3)),
+    'response_words': int(os.environ.get('AI_FAKE_RESPONSE_WORDS', 150)),
+    'failure_rate': float(os.environ.get('AI_FAKE_FAILURE_RATE', 0.0)),
+    'seed': int(os.environ.get('AI_FAKE_SEED', 0))                            # Mesma semente, mesmos sorteios
+}
+
+# Contexto da narração: resumo contínuo do histórico antigo + entradas recentes, com orçamento de tokens
+STORY_CONTEXT_TOKEN_BUDGET = 1500   # Tokens do contexto montado para cada turno
+STORY_SUMMARY_TOKEN_BUDGET = 400    # Tamanho máximo do resumo contínuo
+STORY_SCENE_TOKEN_BUDGET = 300      # Cena atual (a última narração) dentro do contexto
+STORY_MEMORY_TOKEN_BUDGET = 250     # Memórias de NPCs relevantes para a ação
+STORY_SUMMARY_INTERVAL = 12         # Entradas novas no log antes de atualizar o resumo (~4 turnos)
+STORY_RECENT_ENTRIES = 6            # Entradas mais novas que ficam fora do resumo, sempre literais
+STORY_SUMMARY_WORKERS = 2           # Threads que atualizam resumos em segundo plano
+
+# Instruções fixas de cada chamada; vão logo depois do MASTER_SYSTEM_PROMPT e antes de qualquer
+# conteúdo dinâmico, para que o início da requisição seja idêntico entre chamadas (cache de prompt)
+ACTION_INSTRUCTIONS = """Como Mestre de RPG, responda à ação do jogador:
+1. Descreva o resultado da ação
+2. Avance a narrativa
+3. Apresente a nova situação
+4. Ofereça opções ou desafios para o próximo movimento
+
+Mantenha a resposta envolvente e entre 100-200 palavras."""
+
+NPC_ACTION_INSTRUCTIONS = """Com base no contexto do NPC, gere uma ação autônoma realista que este NPC realizaria.
+
+IMPORTANTE: Este NPC é um ser humano completo com:
+- Desejos, medos, paixões e necessidades reais
+- Motivações complexas e às vezes contraditórias
+- Capacidade para todas as emoções e ações humanas
+- Relacionamentos e conflitos pessoais
+- Ambições, segredos e vulnerabilidades
+
+A ação deve ser:
+- Completamente consistente com sua personalidade e situação
+- Realista para um ser humano em um mundo medieval
+- Potencialmente surpreendente mas sempre lógica
+- Capaz de criar novas oportunidades de interação
+
+Responda apenas com a descrição da ação em 2-3 frases detalhadas."""
+
+INTRO_INSTRUCTIONS = """Crie uma introdução para uma nova aventura de RPG.
+Crie uma cena inicial interessante que estabeleça o cenário e apresente o primeiro desafio ou oportunidade."""
+
+# Camadas de modelo: respostas curtas não esperam pelo mesmo modelo das cenas completas
+AI_MODEL_TIERS = {
+    'fast': os.environ.get('AI_MODEL_FAST', 'gpt-4o-mini'),
+    'full': os.environ.get('AI_MODEL_FULL', 'gpt-4o')
+}
+
+# Roteamento por tipo de resposta: camada, prazo total da chamada (segundos, reserva incluída) e camada reserva
+AI_ROUTING = {
+    'short_response': {'tier': 'fast', 'deadline': 10, 'fallback': None},
+    'medium_response': {'tier': 'full', 'deadline': 20, 'fallback': 'fast'},
+    'long_response': {'tier': 'full', 'deadline': 30, 'fallback': 'fast'},
+    'detailed_scene': {'tier': 'full', 'deadline': 30, 'fallback': 'fast'}
+}
+AI_LATENCY_EWMA_ALPHA = 0.2    # Peso de cada chamada nova na latência média da camada
+AI_DEGRADED_RATIO = 0.6        # Camada degradada quando a latência média passa dessa fração do prazo
+AI_TIER_PROBE_INTERVAL = 10    # Com a camada degradada, 1 a cada N chamadas ainda vai para ela (medição)
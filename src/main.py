@@ -9,12 +9,18 @@ from src.models.user import db
 from src.models.character import Character
 from src.models.npc import NPC
 from src.models.game_session import GameSession
+from src.models.story_entry import StoryEntry
+from src.models.roll_log import RollLog
+from src.models.catalog import CatalogItem
+from src.models.inventory import InventoryItem
+from src.models.shop import Shop, ShopStock
+from src.models.migrations import upgrade_database
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
 from src.routes.character import character_bp
 from src.routes.game import game_bp
 from src.routes.dice import dice_bp
-from src.routes.shop import shop_bp
+from src.routes.shop import shop_bp, shop_restock_task
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -36,6 +42,10 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 with app.app_context():
     db.create_all()
+    upgrade_database()
+
+# Reposição das lojas em segundo plano
+shop_restock_task.start(app)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
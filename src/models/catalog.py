@@ -0,0 +1,93 @@
+from src.models.user import db
+from src.models.json_column import JSONDict
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+import hashlib
+import json
+
+class CatalogItem(db.Model):
+    """Item do catálogo compartilhado; cada item distinto é gravado uma única vez"""
+    __table_args__ = (
+        db.Index('ix_catalog_item_type', 'item_type'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(40), unique=True, nullable=False)  # Hash dos campos que definem o item
+    
+    name = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, default='')
+    item_type = db.Column(db.String(50), default='misc')
+    value = db.Column(db.Integer, default=0)
+    rarity = db.Column(db.String(50), default='common')
+    properties = db.Column(JSONDict, default=dict)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CatalogItem {self.name}>'
+    
+    @staticmethod
+    def make_content_hash(item):
+        """Calcula o hash de conteúdo a partir dos dados do item"""
+        identity = json.dumps([
+            item['name'],
+            item.get('description', ''),
+            item.get('type', 'misc'),
+            item.get('value', item.get('price', 0)),
+            item.get('rarity', 'common'),
+            item.get('properties', {})
+        ], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def from_item(cls, item, content_hash=None):
+        return cls(
+            content_hash=content_hash or cls.make_content_hash(item),
+            name=item['name'],
+            description=item.get('description', ''),
+            item_type=item.get('type', 'misc'),
+            value=item.get('value', item.get('price', 0)),
+            rarity=item.get('rarity', 'common'),
+            properties=item.get('properties', {})
+        )
+    
+    @classmethod
+    def upsert(cls, item):
+        """Retorna o item do catálogo com o mesmo conteúdo, criando-o se ainda não existir"""
+        content_hash = cls.make_content_hash(item)
+        catalog_item = cls.query.filter_by(content_hash=content_hash).first()
+        if catalog_item:
+            return catalog_item
+        
+        catalog_item = cls.from_item(item, content_hash)
+        try:
+            with db.session.begin_nested():
+                db.session.add(catalog_item)
+        except IntegrityError:
+            # Outro worker gravou o mesmo item ao mesmo tempo
+            catalog_item = cls.query.filter_by(content_hash=content_hash).one()
+        return catalog_item
+    
+    @classmethod
+    def upsert_many(cls, items):
+        """Versão em lote do upsert: uma consulta para todos os itens já conhecidos"""
+        hashes = [cls.make_content_hash(item) for item in items]
+        known = {catalog_item.content_hash: catalog_item
+                 for catalog_item in cls.query.filter(cls.content_hash.in_(set(hashes)))}
+        
+        catalog_items = []
+        for item, content_hash in zip(items, hashes):
+            if content_hash not in known:
+                known[content_hash] = cls.upsert(item)
+            catalog_items.append(known[content_hash])
+        return catalog_items
+    
+    def to_dict(self):
+        return {
+            'catalog_id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'type': self.item_type,
+            'value': self.value,
+            'rarity': self.rarity,
+            'properties': self.properties if self.properties is not None else {}
+        }
@@ -1,8 +1,12 @@
 from src.models.user import db
-import json
+from src.models.projection import ProjectionMixin, field_columns
+from src.models.json_column import JSONList, JSONDict, store_json
+from src.models.catalog import CatalogItem
+from src.models.inventory import InventoryItem
+from sqlalchemy import update
 from datetime import datetime
 
-class Character(db.Model):
+class Character(ProjectionMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -26,16 +30,16 @@ class Character(db.Model):
     max_mp = db.Column(db.Integer, default=10)
     
     # Vantagens e desvantagens (JSON)
-    advantages = db.Column(db.Text, default='[]')
-    disadvantages = db.Column(db.Text, default='[]')
+    advantages = db.Column(JSONList, default=list)
+    disadvantages = db.Column(JSONList, default=list)
     
     # Sistema de inventário expandido
-    equipment = db.Column(db.Text, default='{}')  # Equipamentos equipados
-    inventory = db.Column(db.Text, default='[]')  # Itens na bolsa
+    equipment = db.Column(JSONDict, default=dict)  # Equipamentos equipados
+    inventory = db.Column(JSONList, default=list)  # Legado: itens na bolsa agora ficam em inventory_item
     gold = db.Column(db.Integer, default=100)     # Moedas de ouro
     
     # NPCs conhecidos pelo personagem
-    known_npcs = db.Column(db.Text, default='[]')  # Lista de NPCs que o personagem conhece
+    known_npcs = db.Column(JSONList, default=list)  # Lista de NPCs que o personagem conhece
     
     # Biografia e notas
     background = db.Column(db.Text, default='')
@@ -47,63 +51,102 @@ class Character(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Itens da bolsa, uma linha por pilha
+    inventory_items = db.relationship('InventoryItem', backref='character', lazy='dynamic',
+                                      cascade='all, delete-orphan', order_by='InventoryItem.id')
+    
+    # Campos serializados e as colunas de que cada um precisa (inventory vem da tabela inventory_item)
+    FIELD_COLUMNS = field_columns(
+        'id', 'user_id', 'name', 'race', 'character_class', 'level', 'experience',
+        'advantages', 'disadvantages', 'equipment', 'gold', 'known_npcs',
+        'background', 'notes', 'current_location', 'created_at', 'updated_at',
+        inventory=(),
+        attributes=('strength', 'dexterity', 'constitution', 'intelligence', 'wisdom', 'charisma'),
+        health=('current_hp', 'max_hp', 'current_mp', 'max_mp')
+    )
+    
+    VIEWS = {
+        'summary': ('id', 'name', 'race', 'character_class', 'level', 'gold', 'current_location', 'updated_at')
+    }
+    
     def __repr__(self):
         return f'<Character {self.name}>'
     
     def get_advantages(self):
-        return json.loads(self.advantages) if self.advantages else []
+        return self.advantages if self.advantages is not None else []
     
     def set_advantages(self, advantages_list):
-        self.advantages = json.dumps(advantages_list)
+        store_json(self, 'advantages', advantages_list)
     
     def get_disadvantages(self):
-        return json.loads(self.disadvantages) if self.disadvantages else []
+        return self.disadvantages if self.disadvantages is not None else []
     
     def set_disadvantages(self, disadvantages_list):
-        self.disadvantages = json.dumps(disadvantages_list)
+        store_json(self, 'disadvantages', disadvantages_list)
     
     def get_equipment(self):
-        return json.loads(self.equipment) if self.equipment else {}
+        return self.equipment if self.equipment is not None else {}
     
     def set_equipment(self, equipment_dict):
-        self.equipment = json.dumps(equipment_dict)
+        store_json(self, 'equipment', equipment_dict)
     
     def get_inventory(self):
-        return json.loads(self.inventory) if self.inventory else []
+        if self.id is None:
+            return []
+        return [item.to_dict() for item in self.inventory_items]
+    
+    def get_inventory_item(self, item_id):
+        """Busca um item da bolsa pelo id (consulta indexada)"""
+        if self.id is None:
+            return None
+        return self.inventory_items.filter_by(id=item_id).first()
+    
+    def get_inventory_by_type(self, item_type):
+        """Retorna os itens da bolsa de um tipo (consulta indexada)"""
+        if self.id is None:
+            return []
+        items = self.inventory_items.join(InventoryItem.catalog_item).filter(CatalogItem.item_type == item_type)
+        return [item.to_dict() for item in items]
     
     def set_inventory(self, inventory_list):
-        self.inventory = json.dumps(inventory_list)
+        """Substitui todo o conteúdo da bolsa"""
+        for item in self.inventory_items.all():
+            db.session.delete(item)
+        for item in inventory_list:
+            self.add_item_to_inventory(item)
     
     def add_item_to_inventory(self, item):
-        """Adiciona um item ao inventário"""
-        inventory = self.get_inventory()
-        inventory.append({
-            'id': len(inventory) + 1,
-            'name': item['name'],
-            'description': item.get('description', ''),
-            'type': item.get('type', 'misc'),
-            'quantity': item.get('quantity', 1),
-            'value': item.get('value', 0),
-            'rarity': item.get('rarity', 'common'),
-            'properties': item.get('properties', {}),
-            'acquired_at': datetime.utcnow().isoformat()
-        })
-        self.set_inventory(inventory)
+        """Adiciona um item (dados completos) ao inventário, registrando-o no catálogo"""
+        return self.add_catalog_item(CatalogItem.upsert(item), item.get('quantity', 1))
+    
+    def add_catalog_item(self, catalog_item, quantity=1):
+        """Adiciona um item do catálogo ao inventário, empilhando com a pilha existente"""
+        existing = None
+        if self.id is not None:
+            existing = self.inventory_items.filter_by(catalog_id=catalog_item.id).first()
+        
+        if existing:
+            existing.quantity += quantity
+            return existing
+        
+        inventory_item = InventoryItem(catalog_item=catalog_item, quantity=quantity, acquired_at=datetime.utcnow())
+        self.inventory_items.append(inventory_item)
+        return inventory_item
     
     def remove_item_from_inventory(self, item_id, quantity=1):
-        """Remove um item do inventário"""
-        inventory = self.get_inventory()
-        for i, item in enumerate(inventory):
-            if item['id'] == item_id:
-                if item['quantity'] <= quantity:
-                    inventory.pop(i)
-                else:
-                    inventory[i]['quantity'] -= quantity
-                break
-        self.set_inventory(inventory)
+        """Remove um item do inventário; retorna o item ou None se não existir"""
+        item = self.get_inventory_item(item_id)
+        if not item:
+            return None
+        
+        if item.quantity <= quantity:
+            db.session.delete(item)
+        else:
+            item.quantity -= quantity
+        return item
     
     def get_known_npcs(self):
-        return json.loads(self.known_npcs) if self.known_npcs else []
+        return self.known_npcs if self.known_npcs is not None else []
     
     def add_known_npc(self, npc_data):
         """Adiciona um NPC à lista de conhecidos"""
@@ -114,7 +157,7 @@ class Character(db.Model):
             if npc['id'] == npc_data['id']:
                 # Atualizar informações existentes
                 npc.update(npc_data)
-                self.known_npcs = json.dumps(known_npcs)
+                store_json(self, 'known_npcs', known_npcs)
                 return
         
         # Adicionar novo NPC
@@ -130,7 +173,7 @@ class Character(db.Model):
             'met_at': datetime.utcnow().isoformat()
         }
         known_npcs.append(npc_entry)
-        self.known_npcs = json.dumps(known_npcs)
+        store_json(self, 'known_npcs', known_npcs)
     
     def update_npc_relationship(self, npc_id, relationship, notes=None):
         """Atualiza o relacionamento com um NPC"""
@@ -142,33 +185,42 @@ class Character(db.Model):
                 if notes:
                     npc['notes'] = notes
                 break
-        self.known_npcs = json.dumps(known_npcs)
+        store_json(self, 'known_npcs', known_npcs)
     
     def can_afford(self, cost):
         """Verifica se o personagem pode pagar um valor"""
         return self.gold >= cost
     
     def spend_gold(self, amount):
-        """Gasta ouro"""
-        if self.can_afford(amount):
-            self.gold -= amount
-            return True
-        return False
+        """Gasta ouro com um UPDATE condicional (gold >= amount); seguro entre requisições simultâneas"""
+        result = db.session.execute(
+            update(Character)
+            .where(Character.id == self.id, Character.gold >= amount)
+            .values(gold=Character.gold - amount)
+            .execution_options(synchronize_session='fetch')
+        )
+        return result.rowcount == 1
     
     def earn_gold(self, amount):
-        """Ganha ouro"""
-        self.gold += amount
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'name': self.name,
-            'race': self.race,
-            'character_class': self.character_class,
-            'level': self.level,
-            'experience': self.experience,
-            'attributes': {
+        """Ganha ouro com um UPDATE atômico"""
+        db.session.execute(
+            update(Character)
+            .where(Character.id == self.id)
+            .values(gold=Character.gold + amount)
+            .execution_options(synchronize_session='fetch')
+        )
+    
+    def to_dict(self, fields=None):
+        """Serializa o personagem; `fields` restringe os campos calculados"""
+        return self.project({
+            'id': lambda: self.id,
+            'user_id': lambda: self.user_id,
+            'name': lambda: self.name,
+            'race': lambda: self.race,
+            'character_class': lambda: self.character_class,
+            'level': lambda: self.level,
+            'experience': lambda: self.experience,
+            'attributes': lambda: {
                 'strength': self.strength,
                 'dexterity': self.dexterity,
                 'constitution': self.constitution,
@@ -176,22 +228,21 @@ class Character(db.Model):
                 'wisdom': self.wisdom,
                 'charisma': self.charisma
             },
-            'health': {
+            'health': lambda: {
                 'current_hp': self.current_hp,
                 'max_hp': self.max_hp,
                 'current_mp': self.current_mp,
                 'max_mp': self.max_mp
             },
-            'advantages': self.get_advantages(),
-            'disadvantages': self.get_disadvantages(),
-            'equipment': self.get_equipment(),
-            'inventory': self.get_inventory(),
-            'gold': self.gold,
-            'known_npcs': self.get_known_npcs(),
-            'background': self.background,
-            'notes': self.notes,
-            'current_location': self.current_location,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
-
+            'advantages': lambda: self.get_advantages(),
+            'disadvantages': lambda: self.get_disadvantages(),
+            'equipment': lambda: self.get_equipment(),
+            'inventory': lambda: self.get_inventory(),
+            'gold': lambda: self.gold,
+            'known_npcs': lambda: self.get_known_npcs(),
+            'background': lambda: self.background,
+            'notes': lambda: self.notes,
+            'current_location': lambda: self.current_location,
+            'created_at': lambda: self.created_at.isoformat() if self.created_at else None,
+            'updated_at': lambda: self.updated_at.isoformat() if self.updated_at else None
+        }, fields)
@@ -1,8 +1,14 @@
 from src.models.user import db
-import json
+from src.models.story_entry import StoryEntry
+from src.models.roll_log import RollLog
+from src.models.projection import ProjectionMixin, field_columns
+from src.models.json_column import JSONList, JSONDict, store_json
+from src.services.session_rng import TurnRandom, new_session_seed
+from sqlalchemy import func, update
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime
 
-class GameSession(db.Model):
+class GameSession(ProjectionMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     character_id = db.Column(db.Integer, db.ForeignKey('character.id'), nullable=False)
@@ -18,18 +24,25 @@ class GameSession(db.Model):
     story_context = db.Column(db.Text, default='')
     
     # Histórico da aventura
-    story_log = db.Column(db.Text, default='[]')           # JSON array de eventos da história
-    player_actions = db.Column(db.Text, default='[]')      # JSON array de ações do jogador
+    story_log = db.Column(db.Text, default='[]')           # Legado: JSON array migrado para a tabela story_entry
+    story_seq = db.Column(db.Integer, default=0)           # Última sequência usada em story_entry
+    story_summary = db.Column(db.Text, default='')         # Resumo contínuo das entradas até summary_seq
+    summary_seq = db.Column(db.Integer, default=0)         # Última entrada já incorporada ao resumo
+    player_actions = db.Column(JSONList, default=list)     # JSON array de ações do jogador
     
     # Estado do mundo
-    world_state = db.Column(db.Text, default='{}')         # JSON object com estado geral do mundo
-    active_quests = db.Column(db.Text, default='[]')       # JSON array de missões ativas
-    completed_quests = db.Column(db.Text, default='[]')    # JSON array de missões completadas
+    world_state = db.Column(JSONDict, default=dict)        # JSON object com estado geral do mundo
+    active_quests = db.Column(JSONList, default=list)      # JSON array de missões ativas
+    completed_quests = db.Column(JSONList, default=list)   # JSON array de missões completadas
     
     # Configurações da IA
     ai_personality = db.Column(db.String(50), default='balanced')  # creative, balanced, logical
     ai_difficulty = db.Column(db.String(20), default='normal')
     
+    # Fluxo aleatório da sessão: cada turno deriva um gerador de (rng_seed, rng_turn)
+    rng_seed = db.Column(db.BigInteger, default=new_session_seed)
+    rng_turn = db.Column(db.Integer, default=0)            # Último turno do fluxo já usado
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -37,26 +50,106 @@ class GameSession(db.Model):
     
     # Relacionamentos
     npcs = db.relationship('NPC', backref='game_session', lazy=True, cascade='all, delete-orphan')
+    story_entries = db.relationship('StoryEntry', backref='game_session', lazy='dynamic',
+                                    cascade='all, delete-orphan', order_by='StoryEntry.seq')
+    roll_logs = db.relationship('RollLog', backref='game_session', lazy='dynamic',
+                                cascade='all, delete-orphan', order_by='[RollLog.turn, RollLog.seq]')
+    
+    # Campos serializados e as colunas de que cada um precisa (story_log vem da tabela story_entry)
+    FIELD_COLUMNS = field_columns(
+        'id', 'user_id', 'character_id', 'session_name', 'world_setting', 'difficulty_level',
+        'current_scene', 'current_location', 'story_context', 'story_seq', 'story_summary', 'player_actions',
+        'world_state', 'active_quests', 'completed_quests', 'rng_turn', 'created_at', 'updated_at',
+        'last_played',
+        story_log=(),
+        ai_settings=('ai_personality', 'ai_difficulty')
+    )
+    
+    VIEWS = {
+        'default': tuple(field for field in FIELD_COLUMNS if field not in ('story_log', 'player_actions')),
+        'summary': ('id', 'session_name', 'character_id', 'world_setting', 'difficulty_level',
+                    'current_location', 'story_seq', 'last_played')
+    }
     
     def __repr__(self):
         return f'<GameSession {self.session_name}>'
     
     def get_story_log(self):
-        return json.loads(self.story_log) if self.story_log else []
+        return [entry.to_dict() for entry in self.story_entries]
+    
+    def get_recent_story_entries(self, limit=5, after=0):
+        """Retorna as últimas entradas do log (seq > `after`) em ordem cronológica (consulta indexada)"""
+        if self.id is None:
+            return []
+        entries = (StoryEntry.query
+                   .filter(StoryEntry.game_session_id == self.id, StoryEntry.seq > after)
+                   .order_by(StoryEntry.seq.desc())
+                   .limit(limit)
+                   .all())
+        return [entry.to_dict() for entry in reversed(entries)]
+    
+    def get_story_page(self, after=0, limit=50):
+        """Retorna uma página do log a partir do cursor `after` (seq exclusivo)"""
+        entries = (StoryEntry.query
+                   .filter(StoryEntry.game_session_id == self.id, StoryEntry.seq > after)
+                   .order_by(StoryEntry.seq)
+                   .limit(limit + 1)
+                   .all())
+        has_more = len(entries) > limit
+        return [entry.to_dict() for entry in entries[:limit]], has_more
     
     def add_story_entry(self, entry_type, content, character_name=None):
-        """Adiciona uma entrada ao log da história"""
-        story_entries = self.get_story_log()
-        story_entries.append({
-            'timestamp': datetime.utcnow().isoformat(),
-            'type': entry_type,  # 'narration', 'player_action', 'npc_dialogue', 'system'
-            'content': content,
-            'character': character_name
-        })
-        self.story_log = json.dumps(story_entries)
+        """Adiciona uma entrada ao log da história; a sequência vem de um UPDATE atômico no banco"""
+        # Incremento em Python faria duas requisições simultâneas usarem a mesma sequência
+        seq = db.session.execute(
+            update(GameSession)
+            .where(GameSession.id == self.id)
+            .values(story_seq=func.coalesce(GameSession.story_seq, 0) + 1)
+            .returning(GameSession.story_seq)
+            .execution_options(synchronize_session=False)
+        ).scalar_one()
+        set_committed_value(self, 'story_seq', seq)
+        entry = StoryEntry(
+            seq=seq,
+            entry_type=entry_type,  # 'narration', 'player_action', 'npc_dialogue', 'system'
+            content=content,
+            character=character_name,
+            timestamp=datetime.utcnow()
+        )
+        self.story_entries.append(entry)
+        return entry
+    
+    @classmethod
+    def store_summary(cls, session_id, expected_seq, summary, summary_seq):
+        """Grava o resumo só se ninguém o atualizou desde `expected_seq` (UPDATE condicional)"""
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id == session_id, func.coalesce(cls.summary_seq, 0) == expected_seq)
+            .values(story_summary=summary, summary_seq=summary_seq)
+            .execution_options(synchronize_session='fetch')
+        )
+        return result.rowcount == 1
+    
+    def start_rng_turn(self, context):
+        """Reserva o próximo turno do fluxo aleatório com um UPDATE atômico e retorna seu TurnRandom"""
+        if self.rng_seed is None:
+            # Sessões criadas antes do fluxo por sessão recebem a semente no primeiro uso
+            db.session.execute(
+                update(GameSession)
+                .where(GameSession.id == self.id, GameSession.rng_seed.is_(None))
+                .values(rng_seed=new_session_seed())
+                .execution_options(synchronize_session='fetch')
+            )
+        db.session.execute(
+            update(GameSession)
+            .where(GameSession.id == self.id)
+            .values(rng_turn=func.coalesce(GameSession.rng_turn, 0) + 1)
+            .execution_options(synchronize_session='fetch')
+        )
+        return TurnRandom(self.rng_seed, self.rng_turn, context)
     
     def get_player_actions(self):
-        return json.loads(self.player_actions) if self.player_actions else []
+        return self.player_actions if self.player_actions is not None else []
     
     def add_player_action(self, action_description, result=None):
         """Adiciona uma ação do jogador"""
@@ -66,19 +159,19 @@ class GameSession(db.Model):
             'action': action_description,
             'result': result
         })
-        self.player_actions = json.dumps(actions)
+        store_json(self, 'player_actions', actions)
     
     def get_world_state(self):
-        return json.loads(self.world_state) if self.world_state else {}
+        return self.world_state if self.world_state is not None else {}
     
     def update_world_state(self, key, value):
         """Atualiza um aspecto do estado do mundo"""
         world_state = self.get_world_state()
         world_state[key] = value
-        self.world_state = json.dumps(world_state)
+        store_json(self, 'world_state', world_state)
     
     def get_active_quests(self):
-        return json.loads(self.active_quests) if self.active_quests else []
+        return self.active_quests if self.active_quests is not None else []
     
     def add_quest(self, quest_data):
         """Adiciona uma nova missão"""
@@ -86,12 +179,12 @@ class GameSession(db.Model):
         quest_data['id'] = len(quests) + 1
         quest_data['created_at'] = datetime.utcnow().isoformat()
         quests.append(quest_data)
-        self.active_quests = json.dumps(quests)
+        store_json(self, 'active_quests', quests)
     
     def complete_quest(self, quest_id):
         """Move uma missão para completadas"""
         active_quests = self.get_active_quests()
-        completed_quests = json.loads(self.completed_quests) if self.completed_quests else []
+        completed_quests = self.get_completed_quests()
         
         for i, quest in enumerate(active_quests):
             if quest.get('id') == quest_id:
@@ -100,34 +193,37 @@ class GameSession(db.Model):
                 active_quests.pop(i)
                 break
         
-        self.active_quests = json.dumps(active_quests)
-        self.completed_quests = json.dumps(completed_quests)
+        store_json(self, 'active_quests', active_quests)
+        store_json(self, 'completed_quests', completed_quests)
     
     def get_completed_quests(self):
-        return json.loads(self.completed_quests) if self.completed_quests else []
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'character_id': self.character_id,
-            'session_name': self.session_name,
-            'world_setting': self.world_setting,
-            'difficulty_level': self.difficulty_level,
-            'current_scene': self.current_scene,
-            'current_location': self.current_location,
-            'story_context': self.story_context,
-            'story_log': self.get_story_log(),
-            'player_actions': self.get_player_actions(),
-            'world_state': self.get_world_state(),
-            'active_quests': self.get_active_quests(),
-            'completed_quests': self.get_completed_quests(),
-            'ai_settings': {
+        return self.completed_quests if self.completed_quests is not None else []
+    
+    def to_dict(self, fields=None):
+        """Serializa a sessão; sem `fields`, o histórico completo fica de fora (use ?view=full)"""
+        return self.project({
+            'id': lambda: self.id,
+            'user_id': lambda: self.user_id,
+            'character_id': lambda: self.character_id,
+            'session_name': lambda: self.session_name,
+            'world_setting': lambda: self.world_setting,
+            'difficulty_level': lambda: self.difficulty_level,
+            'current_scene': lambda: self.current_scene,
+            'current_location': lambda: self.current_location,
+            'story_context': lambda: self.story_context,
+            'story_seq': lambda: self.story_seq or 0,
+            'story_summary': lambda: self.story_summary or '',
+            'story_log': lambda: self.get_story_log(),
+            'player_actions': lambda: self.get_player_actions(),
+            'world_state': lambda: self.get_world_state(),
+            'active_quests': lambda: self.get_active_quests(),
+            'completed_quests': lambda: self.get_completed_quests(),
+            'rng_turn': lambda: self.rng_turn or 0,
+            'ai_settings': lambda: {
                 'personality': self.ai_personality,
                 'difficulty': self.ai_difficulty
             },
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'last_played': self.last_played.isoformat() if self.last_played else None
-        }
-
+            'created_at': lambda: self.created_at.isoformat() if self.created_at else None,
+            'updated_at': lambda: self.updated_at.isoformat() if self.updated_at else None,
+            'last_played': lambda: self.last_played.isoformat() if self.last_played else None
+        }, fields)
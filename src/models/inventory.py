@@ -0,0 +1,86 @@
+from src.models.user import db
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+
+class InventoryItem(db.Model):
+    """Pilha de um item do catálogo na bolsa de um personagem"""
+    __table_args__ = (
+        # Uma pilha por item do catálogo; o índice também atende às buscas por personagem
+        db.UniqueConstraint('character_id', 'catalog_id', name='uq_inventory_item_character_catalog'),
+        {'sqlite_autoincrement': True},                          # Ids removidos nunca são reaproveitados
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    character_id = db.Column(db.Integer, db.ForeignKey('character.id'), nullable=False)
+    catalog_id = db.Column(db.Integer, db.ForeignKey('catalog_item.id'), nullable=False)
+    quantity = db.Column(db.Integer, default=1)
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1)  # Incrementada a cada alteração (concorrência otimista)
+    
+    # Flushes do ORM passam a exigir a versão lida (UPDATE ... WHERE version = :lida)
+    __mapper_args__ = {'version_id_col': version}
+    
+    # Carregado no mesmo SELECT da bolsa (um único join)
+    catalog_item = db.relationship('CatalogItem', lazy='joined', innerjoin=True)
+    
+    def __repr__(self):
+        return f'<InventoryItem {self.catalog_id} x{self.quantity}>'
+    
+    @classmethod
+    def add_to_stack(cls, character_id, catalog_id, quantity):
+        """Soma à pilha do personagem com um UPDATE atômico, criando a pilha se ela ainda não existir"""
+        for attempt in range(2):
+            result = db.session.execute(
+                update(cls)
+                .where(cls.character_id == character_id, cls.catalog_id == catalog_id)
+                .values(quantity=cls.quantity + quantity, version=cls.version + 1)
+                .execution_options(synchronize_session='fetch')
+            )
+            if result.rowcount:
+                return
+            
+            try:
+                with db.session.begin_nested():
+                    db.session.add(cls(character_id=character_id, catalog_id=catalog_id,
+                                       quantity=quantity, acquired_at=datetime.utcnow()))
+                return
+            except IntegrityError:
+                # Outra requisição criou a pilha ao mesmo tempo; a próxima volta soma nela
+                continue
+        
+        raise IntegrityError('Não foi possível atualizar a pilha do inventário', None, None)
+    
+    @classmethod
+    def take_from_stack(cls, character_id, item_id, quantity, expected_version=None):
+        """Retira itens da pilha com um UPDATE condicional; retorna False se a quantidade ou a versão não batem"""
+        conditions = [cls.id == item_id, cls.character_id == character_id, cls.quantity >= quantity]
+        if expected_version is not None:
+            conditions.append(cls.version == expected_version)
+        
+        result = db.session.execute(
+            update(cls)
+            .where(*conditions)
+            .values(quantity=cls.quantity - quantity, version=cls.version + 1)
+            .execution_options(synchronize_session='fetch')
+        )
+        if result.rowcount != 1:
+            return False
+        
+        # Pilha esvaziada sai da bolsa
+        db.session.execute(
+            delete(cls)
+            .where(cls.id == item_id, cls.quantity <= 0)
+            .execution_options(synchronize_session='fetch')
+        )
+        return True
+    
+    def to_dict(self):
+        item_dict = self.catalog_item.to_dict()
+        item_dict.update({
+            'id': self.id,
+            'quantity': self.quantity,
+            'version': self.version,
+            'acquired_at': self.acquired_at.isoformat() if self.acquired_at else None
+        })
+        return item_dict
@@ -0,0 +1,34 @@
+"""
+Colunas JSON com rastreamento de mutações
+O texto é decodificado uma vez quando a linha é carregada e só é codificado de novo no flush
+das colunas que foram alteradas
+"""
+
+from sqlalchemy.ext.mutable import MutableDict, MutableList
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.types import Text, TypeDecorator
+import json
+
+class JSONText(TypeDecorator):
+    """JSON armazenado em coluna TEXT, compatível com os dados já gravados"""
+    impl = Text
+    cache_ok = True
+    
+    def __init__(self, empty=list):
+        super().__init__()
+        self.empty = empty  # Valor usado para NULL ou texto vazio
+    
+    def process_bind_param(self, value, dialect):
+        return json.dumps(self.empty() if value is None else value)
+    
+    def process_result_value(self, value, dialect):
+        return json.loads(value) if value else self.empty()
+
+# Listas e objetos: append/remove/atribuição de chave marcam a coluna como alterada
+JSONList = MutableList.as_mutable(JSONText(list))
+JSONDict = MutableDict.as_mutable(JSONText(dict))
+
+def store_json(instance, key, value):
+    """Atribui o valor e marca a coluna como alterada (cobre mutações em itens aninhados)"""
+    setattr(instance, key, value)
+    flag_modified(instance, key)
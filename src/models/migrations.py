@@ -0,0 +1,170 @@
+"""
+Atualização de bancos existentes para o esquema atual
+O db.create_all() cria apenas tabelas novas; colunas novas e dados legados são tratados aqui
+"""
+
+from src.models.user import db
+from src.models.character import Character
+from src.models.game_session import GameSession
+from src.models.story_entry import StoryEntry
+from src.models.catalog import CatalogItem
+from src.models.inventory import InventoryItem
+from sqlalchemy import inspect, text, type_coerce
+from sqlalchemy.exc import IntegrityError, OperationalError
+import json
+from datetime import datetime
+
+# Colunas adicionadas depois da criação das tabelas: (tabela, coluna, DDL)
+ADDED_COLUMNS = [
+    ('game_session', 'story_seq', 'INTEGER DEFAULT 0'),
+    ('inventory_item', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+    ('game_session', 'rng_seed', 'BIGINT'),
+    ('game_session', 'rng_turn', 'INTEGER DEFAULT 0'),
+    ('game_session', 'story_summary', "TEXT DEFAULT ''"),
+    ('game_session', 'summary_seq', 'INTEGER DEFAULT 0'),
+]
+
+def upgrade_schema():
+    """Adiciona às tabelas existentes as colunas que ainda não existem"""
+    inspector = inspect(db.engine)
+    for table, column, ddl in ADDED_COLUMNS:
+        if not inspector.has_table(table):
+            continue
+        
+        columns = {c['name'] for c in inspector.get_columns(table)}
+        if column in columns:
+            continue
+        
+        try:
+            db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+            db.session.commit()
+        except OperationalError:
+            # Outro worker pode ter adicionado a coluna ao mesmo tempo
+            db.session.rollback()
+
+def parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def migrate_story_logs():
+    """Move o story_log JSON legado de cada sessão para a tabela story_entry"""
+    session_ids = [row.id for row in GameSession.query
+                   .with_entities(GameSession.id)
+                   .filter(GameSession.story_log.notin_(['', '[]']))]
+    
+    for session_id in session_ids:
+        game_session = GameSession.query.get(session_id)
+        try:
+            legacy_entries = json.loads(game_session.story_log)
+        except ValueError:
+            legacy_entries = []
+        
+        try:
+            base_seq = game_session.story_seq or 0
+            for offset, entry in enumerate(legacy_entries, start=1):
+                db.session.add(StoryEntry(
+                    game_session_id=game_session.id,
+                    seq=base_seq + offset,
+                    entry_type=entry.get('type', 'system'),
+                    content=entry.get('content', ''),
+                    character=entry.get('character'),
+                    timestamp=parse_timestamp(entry.get('timestamp'))
+                ))
+            
+            game_session.story_seq = base_seq + len(legacy_entries)
+            game_session.story_log = '[]'
+            db.session.commit()
+        except IntegrityError:
+            # Sessão migrada em paralelo por outro worker
+            db.session.rollback()
+
+def migrate_inventories():
+    """Move o inventário JSON legado de cada personagem para a tabela inventory_item"""
+    legacy_inventory = type_coerce(Character.inventory, db.Text)
+    character_ids = [row.id for row in Character.query
+                     .with_entities(Character.id)
+                     .filter(legacy_inventory.isnot(None), legacy_inventory.notin_(['', '[]']))]
+    
+    for character_id in character_ids:
+        character = Character.query.get(character_id)
+        legacy_items = [item for item in character.inventory or [] if isinstance(item, dict) and item.get('name')]
+        
+        # Itens idênticos do blob antigo acabam empilhados na mesma linha
+        for item in legacy_items:
+            inventory_item = character.add_item_to_inventory(item)
+            acquired_at = parse_timestamp(item.get('acquired_at'))
+            if acquired_at and (inventory_item.acquired_at is None or acquired_at < inventory_item.acquired_at):
+                inventory_item.acquired_at = acquired_at
+        
+        character.inventory = []
+        db.session.commit()
+
+def upgrade_inventory_table():
+    """Renomeia a tabela inventory_item que copiava os itens e cria a versão que referencia o catálogo"""
+    inspector = inspect(db.engine)
+    if not inspector.has_table('inventory_item'):
+        return
+    
+    columns = {c['name'] for c in inspector.get_columns('inventory_item')}
+    if 'catalog_id' not in columns:
+        try:
+            db.session.execute(text('ALTER TABLE inventory_item RENAME TO inventory_item_legacy'))
+            db.session.commit()
+        except OperationalError:
+            # Outro worker pode ter renomeado a tabela ao mesmo tempo
+            db.session.rollback()
+    
+    InventoryItem.__table__.create(db.engine, checkfirst=True)
+
+def migrate_legacy_inventory_items():
+    """Move as linhas da tabela inventory_item antiga para o catálogo e as novas pilhas"""
+    if not inspect(db.engine).has_table('inventory_item_legacy'):
+        return
+    
+    rows = db.session.execute(text('SELECT * FROM inventory_item_legacy ORDER BY id')).mappings().all()
+    try:
+        for row in rows:
+            try:
+                properties = json.loads(row['properties'] or '{}')
+            except ValueError:
+                properties = {}
+            
+            catalog_item = CatalogItem.upsert({
+                'name': row['name'],
+                'description': row['description'] or '',
+                'type': row['item_type'] or 'misc',
+                'value': row['value'] or 0,
+                'rarity': row['rarity'] or 'common',
+                'properties': properties
+            })
+            
+            existing = InventoryItem.query.filter_by(character_id=row['character_id'], catalog_id=catalog_item.id).first()
+            if existing:
+                existing.quantity += row['quantity'] or 0
+                continue
+            
+            # O id antigo é mantido para não invalidar referências dos clientes
+            db.session.add(InventoryItem(
+                id=row['id'],
+                character_id=row['character_id'],
+                catalog_id=catalog_item.id,
+                quantity=row['quantity'] or 0,
+                acquired_at=parse_timestamp(row['acquired_at'])
+            ))
+            db.session.flush()
+        
+        db.session.execute(text('DROP TABLE inventory_item_legacy'))
+        db.session.commit()
+    except (IntegrityError, OperationalError):
+        # Tabela migrada em paralelo por outro worker
+        db.session.rollback()
+
+def upgrade_database():
+    """Executa todas as etapas de atualização; seguro para rodar a cada inicialização"""
+    upgrade_schema()
+    upgrade_inventory_table()
+    migrate_story_logs()
+    migrate_legacy_inventory_items()
+    migrate_inventories()
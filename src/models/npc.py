@@ -1,8 +1,9 @@
 from src.models.user import db
-import json
+from src.models.projection import ProjectionMixin, field_columns
+from src.models.json_column import JSONList, JSONDict, store_json
 from datetime import datetime
 
-class NPC(db.Model):
+class NPC(ProjectionMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     game_session_id = db.Column(db.Integer, db.ForeignKey('game_session.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -18,15 +19,15 @@ class NPC(db.Model):
     charisma = db.Column(db.Integer, default=10)
     
     # Personalidade e IA
-    personality_traits = db.Column(db.Text, default='[]')  # JSON array
-    goals_short_term = db.Column(db.Text, default='[]')    # JSON array
-    goals_long_term = db.Column(db.Text, default='[]')     # JSON array
-    fears = db.Column(db.Text, default='[]')               # JSON array
-    relationships = db.Column(db.Text, default='{}')       # JSON object
+    personality_traits = db.Column(JSONList, default=list)  # JSON array
+    goals_short_term = db.Column(JSONList, default=list)   # JSON array
+    goals_long_term = db.Column(JSONList, default=list)    # JSON array
+    fears = db.Column(JSONList, default=list)              # JSON array
+    relationships = db.Column(JSONDict, default=dict)      # JSON object
     
     # Histórico e memórias
-    memory_log = db.Column(db.Text, default='[]')          # JSON array de eventos
-    interaction_history = db.Column(db.Text, default='[]') # JSON array de interações
+    memory_log = db.Column(JSONList, default=list)         # JSON array de eventos
+    interaction_history = db.Column(JSONList, default=list)  # JSON array de interações
     
     # Status atual
     current_location = db.Column(db.String(200), default='')
@@ -35,7 +36,7 @@ class NPC(db.Model):
     
     # Evolução e aprendizado
     skill_points = db.Column(db.Integer, default=0)
-    learned_skills = db.Column(db.Text, default='[]')      # JSON array
+    learned_skills = db.Column(JSONList, default=list)     # JSON array
     reputation = db.Column(db.Integer, default=0)          # -100 a +100
     
     # Aparência e descrição
@@ -46,41 +47,55 @@ class NPC(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_interaction = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Campos serializados e as colunas de que cada um precisa
+    FIELD_COLUMNS = field_columns(
+        'id', 'game_session_id', 'name', 'race', 'occupation', 'memory_log', 'interaction_history',
+        'learned_skills', 'skill_points', 'created_at', 'updated_at', 'last_interaction',
+        attributes=('strength', 'dexterity', 'constitution', 'intelligence', 'wisdom', 'charisma'),
+        personality=('personality_traits', 'goals_short_term', 'goals_long_term', 'fears', 'relationships'),
+        status=('current_location', 'current_activity', 'mood', 'reputation'),
+        appearance=('physical_description', 'clothing_description')
+    )
+    
+    VIEWS = {
+        'summary': ('id', 'name', 'race', 'occupation', 'status')
+    }
+    
     def __repr__(self):
         return f'<NPC {self.name}>'
     
     def get_personality_traits(self):
-        return json.loads(self.personality_traits) if self.personality_traits else []
+        return self.personality_traits if self.personality_traits is not None else []
     
     def set_personality_traits(self, traits_list):
-        self.personality_traits = json.dumps(traits_list)
+        store_json(self, 'personality_traits', traits_list)
     
     def get_goals_short_term(self):
-        return json.loads(self.goals_short_term) if self.goals_short_term else []
+        return self.goals_short_term if self.goals_short_term is not None else []
     
     def set_goals_short_term(self, goals_list):
-        self.goals_short_term = json.dumps(goals_list)
+        store_json(self, 'goals_short_term', goals_list)
     
     def get_goals_long_term(self):
-        return json.loads(self.goals_long_term) if self.goals_long_term else []
+        return self.goals_long_term if self.goals_long_term is not None else []
     
     def set_goals_long_term(self, goals_list):
-        self.goals_long_term = json.dumps(goals_list)
+        store_json(self, 'goals_long_term', goals_list)
     
     def get_fears(self):
-        return json.loads(self.fears) if self.fears else []
+        return self.fears if self.fears is not None else []
     
     def set_fears(self, fears_list):
-        self.fears = json.dumps(fears_list)
+        store_json(self, 'fears', fears_list)
     
     def get_relationships(self):
-        return json.loads(self.relationships) if self.relationships else {}
+        return self.relationships if self.relationships is not None else {}
     
     def set_relationships(self, relationships_dict):
-        self.relationships = json.dumps(relationships_dict)
+        store_json(self, 'relationships', relationships_dict)
     
     def get_memory_log(self):
-        return json.loads(self.memory_log) if self.memory_log else []
+        return self.memory_log if self.memory_log is not None else []
     
     def add_memory(self, memory_entry):
         memories = self.get_memory_log()
@@ -88,10 +103,10 @@ class NPC(db.Model):
             'timestamp': datetime.utcnow().isoformat(),
             'event': memory_entry
         })
-        self.memory_log = json.dumps(memories)
+        store_json(self, 'memory_log', memories)
     
     def get_interaction_history(self):
-        return json.loads(self.interaction_history) if self.interaction_history else []
+        return self.interaction_history if self.interaction_history is not None else []
     
     def add_interaction(self, interaction_entry):
         interactions = self.get_interaction_history()
@@ -99,25 +114,26 @@ class NPC(db.Model):
             'timestamp': datetime.utcnow().isoformat(),
             'interaction': interaction_entry
         })
-        self.interaction_history = json.dumps(interactions)
+        store_json(self, 'interaction_history', interactions)
     
     def get_learned_skills(self):
-        return json.loads(self.learned_skills) if self.learned_skills else []
+        return self.learned_skills if self.learned_skills is not None else []
     
     def add_skill(self, skill_name):
         skills = self.get_learned_skills()
         if skill_name not in skills:
             skills.append(skill_name)
-            self.learned_skills = json.dumps(skills)
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'game_session_id': self.game_session_id,
-            'name': self.name,
-            'race': self.race,
-            'occupation': self.occupation,
-            'attributes': {
+            store_json(self, 'learned_skills', skills)
+    
+    def to_dict(self, fields=None):
+        """Serializa o NPC; `fields` restringe os campos calculados"""
+        return self.project({
+            'id': lambda: self.id,
+            'game_session_id': lambda: self.game_session_id,
+            'name': lambda: self.name,
+            'race': lambda: self.race,
+            'occupation': lambda: self.occupation,
+            'attributes': lambda: {
                 'strength': self.strength,
                 'dexterity': self.dexterity,
                 'constitution': self.constitution,
@@ -125,29 +141,28 @@ class NPC(db.Model):
                 'wisdom': self.wisdom,
                 'charisma': self.charisma
             },
-            'personality': {
+            'personality': lambda: {
                 'traits': self.get_personality_traits(),
                 'goals_short_term': self.get_goals_short_term(),
                 'goals_long_term': self.get_goals_long_term(),
                 'fears': self.get_fears(),
                 'relationships': self.get_relationships()
             },
-            'status': {
+            'status': lambda: {
                 'current_location': self.current_location,
                 'current_activity': self.current_activity,
                 'mood': self.mood,
                 'reputation': self.reputation
             },
-            'appearance': {
+            'appearance': lambda: {
                 'physical_description': self.physical_description,
                 'clothing_description': self.clothing_description
             },
-            'memory_log': self.get_memory_log(),
-            'interaction_history': self.get_interaction_history(),
-            'learned_skills': self.get_learned_skills(),
-            'skill_points': self.skill_points,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'last_interaction': self.last_interaction.isoformat() if self.last_interaction else None
-        }
-
+            'memory_log': lambda: self.get_memory_log(),
+            'interaction_history': lambda: self.get_interaction_history(),
+            'learned_skills': lambda: self.get_learned_skills(),
+            'skill_points': lambda: self.skill_points,
+            'created_at': lambda: self.created_at.isoformat() if self.created_at else None,
+            'updated_at': lambda: self.updated_at.isoformat() if self.updated_at else None,
+            'last_interaction': lambda: self.last_interaction.isoformat() if self.last_interaction else None
+        }, fields)
@@ -0,0 +1,58 @@
+"""
+Projeções de campos para os to_dict dos modelos (?fields=a,b ou ?view=summary)
+As colunas não usadas pela projeção nem chegam a ser lidas do banco
+"""
+
+from sqlalchemy.orm import load_only
+
+def field_columns(*plain_fields, **composite_fields):
+    """Mapeia cada campo serializado para as colunas de que ele precisa"""
+    mapping = {field: (field,) for field in plain_fields}
+    mapping.update(composite_fields)
+    return mapping
+
+class ProjectionMixin:
+    """Seleção de campos compartilhada por Character, GameSession e NPC"""
+    
+    # Campo serializado -> colunas necessárias; define também os campos válidos
+    FIELD_COLUMNS = {}
+    
+    # Visões nomeadas; 'default' é usada quando nada é pedido
+    VIEWS = {}
+    
+    @classmethod
+    def default_fields(cls):
+        return cls.VIEWS.get('default', tuple(cls.FIELD_COLUMNS))
+    
+    @classmethod
+    def resolve_fields(cls, view=None, fields=None):
+        """Traduz os parâmetros ?view= e ?fields= na lista de campos a serializar"""
+        if fields:
+            requested = [field.strip() for field in fields.split(',') if field.strip()]
+            unknown = [field for field in requested if field not in cls.FIELD_COLUMNS]
+            if unknown:
+                raise ValueError(f"Campos inválidos: {', '.join(unknown)}")
+            return tuple(requested)
+        
+        if view:
+            if view == 'full':
+                return tuple(cls.FIELD_COLUMNS)
+            if view not in cls.VIEWS:
+                raise ValueError(f'Visão inválida: {view}')
+            return cls.VIEWS[view]
+        
+        return cls.default_fields()
+    
+    @classmethod
+    def apply_projection(cls, query, fields):
+        """Restringe a consulta às colunas usadas pelos campos pedidos"""
+        columns = {'id'}
+        for field in fields:
+            columns.update(cls.FIELD_COLUMNS[field])
+        return query.options(load_only(*[getattr(cls, column) for column in sorted(columns)]))
+    
+    def project(self, serializers, fields=None):
+        """Monta o dicionário avaliando apenas os campos pedidos"""
+        if fields is None:
+            fields = self.default_fields()
+        return {field: serializers[field]() for field in fields}
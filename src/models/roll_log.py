@@ -0,0 +1,49 @@
+from src.models.user import db
+from src.models.json_column import JSONDict
+from sqlalchemy import insert
+from datetime import datetime
+
+class RollLog(db.Model):
+    """Sorteio registrado de um turno da sessão; o log só recebe inserções"""
+    __table_args__ = (
+        db.UniqueConstraint('game_session_id', 'turn', 'seq', name='uq_roll_log_session_turn_seq'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    game_session_id = db.Column(db.Integer, db.ForeignKey('game_session.id'), nullable=False)
+    turn = db.Column(db.Integer, nullable=False)            # Turno do fluxo aleatório da sessão
+    seq = db.Column(db.Integer, nullable=False)             # Ordem do sorteio dentro do turno
+    
+    context = db.Column(db.String(50), nullable=False)      # 'player_action', 'npc_update', 'dice'
+    kind = db.Column(db.String(20), nullable=False)         # 'chance', 'choice', 'roll'
+    label = db.Column(db.String(100))
+    params = db.Column(JSONDict, default=dict)
+    result = db.Column(JSONDict, default=dict)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RollLog {self.game_session_id}:{self.turn}#{self.seq}>'
+    
+    @classmethod
+    def append_turn(cls, game_session_id, turn_random):
+        """Grava todos os sorteios do turno num único INSERT em lote (sem ida ao banco por rolagem)"""
+        if not turn_random.records:
+            return
+        now = datetime.utcnow()
+        db.session.execute(insert(cls), [
+            dict(record, game_session_id=game_session_id, turn=turn_random.turn,
+                 context=turn_random.context, created_at=now)
+            for record in turn_random.records
+        ])
+    
+    def to_dict(self):
+        return {
+            'turn': self.turn,
+            'seq': self.seq,
+            'context': self.context,
+            'kind': self.kind,
+            'label': self.label,
+            'params': self.params if self.params is not None else {},
+            'result': self.result if self.result is not None else {},
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,87 @@
+from src.models.user import db
+from sqlalchemy import or_, update
+from datetime import datetime, timedelta
+
+class Shop(db.Model):
+    """Loja persistida por localização e tipo; o estoque é reposto em segundo plano"""
+    __table_args__ = (
+        db.UniqueConstraint('location_key', 'shop_type', name='uq_shop_location_type'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    location_key = db.Column(db.String(200), nullable=False)     # Localização normalizada (sem acentos/caixa)
+    location = db.Column(db.String(200), nullable=False)         # Nome exibido
+    shop_type = db.Column(db.String(50), nullable=False)
+    level = db.Column(db.Integer, default=1)                     # Maior nível de visitante; usado na próxima reposição
+    
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    restocked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    next_restock_at = db.Column(db.DateTime, index=True)
+    restock_claimed_until = db.Column(db.DateTime)               # Reserva do worker que está repondo a loja
+    
+    stock = db.relationship('ShopStock', backref='shop', lazy='dynamic',
+                            cascade='all, delete-orphan', order_by='ShopStock.id')
+    
+    def __repr__(self):
+        return f'<Shop {self.shop_type} @ {self.location}>'
+    
+    @classmethod
+    def claim_restock(cls, shop_id, now, lease_seconds):
+        """Reserva a reposição da loja com um UPDATE condicional; só um worker ganha"""
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id == shop_id,
+                   cls.next_restock_at <= now,
+                   or_(cls.restock_claimed_until.is_(None), cls.restock_claimed_until < now))
+            .values(restock_claimed_until=now + timedelta(seconds=lease_seconds))
+            .execution_options(synchronize_session='fetch')
+        )
+        return result.rowcount == 1
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'location': self.location,
+            'type': self.shop_type,
+            'items': [stock.to_dict() for stock in self.stock.filter(ShopStock.quantity > 0)],
+            'generated_at': self.generated_at.isoformat() if self.generated_at else None,
+            'restocked_at': self.restocked_at.isoformat() if self.restocked_at else None,
+            'next_restock_at': self.next_restock_at.isoformat() if self.next_restock_at else None
+        }
+
+class ShopStock(db.Model):
+    """Item à venda numa loja, com preço e quantidade em estoque"""
+    __table_args__ = (
+        db.UniqueConstraint('shop_id', 'catalog_id', name='uq_shop_stock_shop_catalog'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey('shop.id'), nullable=False)
+    catalog_id = db.Column(db.Integer, db.ForeignKey('catalog_item.id'), nullable=False)
+    price = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, default=0)
+    
+    catalog_item = db.relationship('CatalogItem', lazy='joined', innerjoin=True)
+    
+    def __repr__(self):
+        return f'<ShopStock {self.catalog_id} x{self.quantity}>'
+    
+    @classmethod
+    def take(cls, stock_id, quantity):
+        """Retira unidades do estoque com um UPDATE condicional; retorna False se não houver o bastante"""
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id == stock_id, cls.quantity >= quantity)
+            .values(quantity=cls.quantity - quantity)
+            .execution_options(synchronize_session='fetch')
+        )
+        return result.rowcount == 1
+    
+    def to_dict(self):
+        item_dict = self.catalog_item.to_dict()
+        item_dict.update({
+            'stock_id': self.id,
+            'price': self.price,
+            'stock': self.quantity
+        })
+        return item_dict
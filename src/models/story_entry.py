@@ -0,0 +1,30 @@
+from src.models.user import db
+from datetime import datetime
+
+class StoryEntry(db.Model):
+    """Entrada do log da história, gravada uma linha por evento"""
+    __table_args__ = (
+        # Índice único que também atende às consultas de cauda do log
+        db.UniqueConstraint('game_session_id', 'seq', name='uq_story_entry_session_seq'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    game_session_id = db.Column(db.Integer, db.ForeignKey('game_session.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)                 # Posição da entrada na sessão (1, 2, 3...)
+    
+    entry_type = db.Column(db.String(50), nullable=False)       # 'narration', 'player_action', 'npc_action', 'system'
+    content = db.Column(db.Text, default='')
+    character = db.Column(db.String(100))
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StoryEntry {self.game_session_id}#{self.seq}>'
+    
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'type': self.entry_type,
+            'content': self.content,
+            'character': self.character
+        }
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, session
 from src.models.user import db
 from src.models.character import Character
 from src.routes.auth import require_auth
+from sqlalchemy.orm.exc import StaleDataError
 
 character_bp = Blueprint('character', __name__)
 
@@ -317,12 +318,18 @@ def get_characters():
     """Lista todos os personagens do usuário"""
     try:
         user_id = session['user_id']
-        characters = Character.query.filter_by(user_id=user_id).all()
+        fields = Character.resolve_fields(request.args.get('view'), request.args.get('fields'))
+        
+        # Carrega apenas as colunas usadas pela projeção (ex: ?view=summary)
+        query = Character.query.filter_by(user_id=user_id)
+        characters = Character.apply_projection(query, fields).all()
         
         return jsonify({
-            'characters': [char.to_dict() for char in characters]
+            'characters': [char.to_dict(fields) for char in characters]
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
 
@@ -476,6 +483,10 @@ def update_character(character_id):
             'character': character.to_dict()
         }), 200
         
+    except StaleDataError:
+        # Uma pilha do inventário mudou (compra/venda) entre a leitura e a gravação
+        db.session.rollback()
+        return jsonify({'error': 'O inventário foi alterado por outra requisição; tente novamente'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
@@ -1,36 +1,91 @@
 from flask import Blueprint, request, jsonify
-import random
-import re
+from src.services.dice_expression import compile_notation, pin_notation, plan_cache_stats, DiceSyntaxError, DiceBudget
+from src.services.combat_simulator import (
+    Combatant, simulate_combat, DEFAULT_TRIALS, MAX_TRIALS, DEFAULT_MAX_ROUNDS, MAX_ROUNDS
+)
+from src.services.dice_distribution import get_distribution, distribution_for_normalized, DistributionError, PERCENTILES
 
 dice_bp = Blueprint('dice', __name__)
 
-def parse_dice_notation(notation):
-    """
-    Analisa notação de dados (ex: 3d6+2, 1d20, 2d10-1)
-    Retorna (quantidade, lados, modificador)
-    """
-    # Padrão para notação de dados: XdY+Z ou XdY-Z ou XdY
-    pattern = r'^(\d+)d(\d+)([+-]\d+)?$'
-    match = re.match(pattern, notation.lower().replace(' ', ''))
-    
-    if not match:
-        return None
-    
-    quantity = int(match.group(1))
-    sides = int(match.group(2))
-    modifier = int(match.group(3)) if match.group(3) else 0
-    
-    return quantity, sides, modifier
+NOTATION_HELP = 'Use formato como: 3d6+2, 1d20, 4d6kh3, 1d6!, 2d6ro1, 2d8+1d6+3, 1d20+5>=15'
+MAX_DISTRIBUTION_POINTS = 5000     # Acima disso PMF e CDF não voltam na resposta, só os percentis
+
+# Presets comuns de dados
+DICE_PRESETS = {
+    'common': [
+        {'name': 'D4', 'notation': '1d4', 'description': 'Dado de 4 lados'},
+        {'name': 'D6', 'notation': '1d6', 'description': 'Dado comum de 6 lados'},
+        {'name': 'D8', 'notation': '1d8', 'description': 'Dado de 8 lados'},
+        {'name': 'D10', 'notation': '1d10', 'description': 'Dado de 10 lados'},
+        {'name': 'D12', 'notation': '1d12', 'description': 'Dado de 12 lados'},
+        {'name': 'D20', 'notation': '1d20', 'description': 'Dado de 20 lados (mais comum em RPGs)'},
+        {'name': 'D100', 'notation': '1d100', 'description': 'Dado percentual'}
+    ],
+    'combat': [
+        {'name': 'Ataque Básico', 'notation': '1d20+5', 'description': 'Rolagem de ataque com bônus +5'},
+        {'name': 'Dano de Espada', 'notation': '1d8+3', 'description': 'Dano de espada longa'},
+        {'name': 'Dano de Arco', 'notation': '1d6+2', 'description': 'Dano de arco curto'},
+        {'name': 'Dano Crítico', 'notation': '2d8+6', 'description': 'Dano crítico dobrado'}
+    ],
+    'attributes': [
+        {'name': 'Atributo 3D6', 'notation': '3d6', 'description': 'Geração de atributo padrão'},
+        {'name': 'Atributo 4D6', 'notation': '4d6kh3', 'description': 'Geração de atributo (descartar menor)'},
+        {'name': 'Teste de Atributo', 'notation': '1d20', 'description': 'Teste contra atributo'}
+    ],
+    'magic': [
+        {'name': 'Bola de Fogo', 'notation': '8d6', 'description': 'Dano de bola de fogo'},
+        {'name': 'Míssil Mágico', 'notation': '1d4+1', 'description': 'Dano de míssil mágico'},
+        {'name': 'Cura Menor', 'notation': '1d8+1', 'description': 'Cura de poção menor'}
+    ]
+}
+
+# Presets são compilados uma vez e nunca saem do cache de planos; a distribuição já fica pronta
+for preset_group in DICE_PRESETS.values():
+    for preset in preset_group:
+        pin_notation(preset['notation'])
+        get_distribution(preset['notation'])
+
+# Nome do preset -> notação (a simulação aceita os dois)
+PRESET_NOTATIONS = {
+    preset['name'].lower(): preset['notation']
+    for preset_group in DICE_PRESETS.values()
+    for preset in preset_group
+}
+
+def resolve_preset(value):
+    """Troca o nome de um preset (ex: 'Dano de Espada') pela notação correspondente"""
+    if isinstance(value, str):
+        return PRESET_NOTATIONS.get(value.strip().lower(), value)
+    return value
 
-def roll_dice(quantity, sides):
-    """Rola uma quantidade de dados com número específico de lados"""
-    if quantity <= 0 or sides <= 0:
-        return []
+def format_evaluation(plan, evaluation):
+    """Monta a resposta a partir da avaliação; rolagens grandes voltam como resumo em vez da lista"""
+    response = {
+        'modifier': evaluation['modifier'],
+        'total': evaluation['total'],
+        'details': {
+            'terms': evaluation['terms'],
+            'sum_of_rolls': evaluation['dice_total'],
+            'modifier': evaluation['modifier'],
+            'final_total': evaluation['total']
+        }
+    }
+    
+    term = plan.single_term
+    if term:
+        response['details']['quantity'] = term.quantity
+        response['details']['sides'] = term.sides
+        if 'summary' in evaluation['terms'][0]:
+            response['summary'] = evaluation['terms'][0]['summary']
     
-    if quantity > 100:  # Limite de segurança
-        return []
+    if 'rolls' in evaluation:
+        response['rolls'] = evaluation['rolls']
+        response['details']['individual_rolls'] = evaluation['rolls']
     
-    return [random.randint(1, sides) for _ in range(quantity)]
+    if 'comparison' in evaluation:
+        response['comparison'] = evaluation['comparison']
+        response['success'] = evaluation['comparison']['success']
+    return response
 
 @dice_bp.route('/roll', methods=['POST'])
 def roll():
@@ -43,42 +98,22 @@ def roll():
         
         notation = data['notation'].strip()
         
-        # Analisar notação
-        parsed = parse_dice_notation(notation)
-        if not parsed:
-            return jsonify({'error': 'Notação de dados inválida. Use formato como: 3d6+2, 1d20, 2d10-1'}), 400
+        # Compilar notação (planos ficam em cache)
+        try:
+            plan = compile_notation(notation)
+        except DiceSyntaxError as e:
+            return jsonify({'error': f'{e}. {NOTATION_HELP}'}), 400
         
-        quantity, sides, modifier = parsed
+        # Rolar dados (explosões e rerrolagens contam no limite de dados)
+        try:
+            evaluation = plan.evaluate(summary=data.get('summary', False))
+        except DiceSyntaxError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Validações
-        if quantity > 100:
-            return jsonify({'error': 'Máximo de 100 dados por rolagem'}), 400
+        response = format_evaluation(plan, evaluation)
+        response['notation'] = notation
         
-        if sides > 1000:
-            return jsonify({'error': 'Máximo de 1000 lados por dado'}), 400
-        
-        # Rolar dados
-        rolls = roll_dice(quantity, sides)
-        if not rolls:
-            return jsonify({'error': 'Erro ao rolar dados'}), 500
-        
-        # Calcular resultado
-        total = sum(rolls) + modifier
-        
-        return jsonify({
-            'notation': notation,
-            'rolls': rolls,
-            'modifier': modifier,
-            'total': total,
-            'details': {
-                'quantity': quantity,
-                'sides': sides,
-                'individual_rolls': rolls,
-                'sum_of_rolls': sum(rolls),
-                'modifier': modifier,
-                'final_total': total
-            }
-        }), 200
+        return jsonify(response), 200
         
     except Exception as e:
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
@@ -97,39 +132,25 @@ def roll_simple():
         modifier = data.get('modifier', 0)
         
         # Validações
-        if not isinstance(quantity, int) or not isinstance(sides, int):
-            return jsonify({'error': 'Quantidade e lados devem ser números inteiros'}), 400
+        if not isinstance(quantity, int) or not isinstance(sides, int) or not isinstance(modifier, int):
+            return jsonify({'error': 'Quantidade, lados e modificador devem ser números inteiros'}), 400
         
         if quantity <= 0 or sides <= 0:
-            return jsonify({'error': 'Quantidade e lados devem ser positivos'}), 400
-        
-        if quantity > 100:
-            return jsonify({'error': 'Máximo de 100 dados por rolagem'}), 400
+            return jsonify({'error': 'Quantidade e lados devem ser maiores que zero'}), 400
         
-        if sides > 1000:
-            return jsonify({'error': 'Máximo de 1000 lados por dado'}), 400
+        # Mesma engine da notação: XdY±Z compilado e em cache
+        try:
+            plan = compile_notation(f'{quantity}d{sides}{modifier:+d}')
+        except DiceSyntaxError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Rolar dados
-        rolls = roll_dice(quantity, sides)
-        if not rolls:
-            return jsonify({'error': 'Erro ao rolar dados'}), 500
+        try:
+            evaluation = plan.evaluate(summary=data.get('summary', False))
+        except DiceSyntaxError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Calcular resultado
-        total = sum(rolls) + modifier
-        
-        return jsonify({
-            'rolls': rolls,
-            'modifier': modifier,
-            'total': total,
-            'details': {
-                'quantity': quantity,
-                'sides': sides,
-                'individual_rolls': rolls,
-                'sum_of_rolls': sum(rolls),
-                'modifier': modifier,
-                'final_total': total
-            }
-        }), 200
+        return jsonify(format_evaluation(plan, evaluation)), 200
         
     except Exception as e:
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
@@ -152,6 +173,7 @@ def roll_multiple():
             return jsonify({'error': 'Máximo de 20 rolagens por vez'}), 400
         
         results = []
+        dice_budget = DiceBudget()
         
         for i, roll_request in enumerate(roll_requests):
             if not isinstance(roll_request, dict) or 'notation' not in roll_request:
@@ -165,55 +187,44 @@ def roll_multiple():
             notation = roll_request['notation'].strip()
             label = roll_request.get('label', f'Rolagem {i+1}')
             
-            # Analisar notação
-            parsed = parse_dice_notation(notation)
-            if not parsed:
-                results.append({
-                    'index': i,
-                    'label': label,
-                    'notation': notation,
-                    'error': 'Notação inválida',
-                    'success': False
-                })
-                continue
-            
-            quantity, sides, modifier = parsed
-            
-            # Validações
-            if quantity > 100 or sides > 1000:
+            # Compilar notação (planos ficam em cache)
+            try:
+                plan = compile_notation(notation)
+            except DiceSyntaxError as e:
                 results.append({
                     'index': i,
                     'label': label,
                     'notation': notation,
-                    'error': 'Limites excedidos',
+                    'error': str(e),
                     'success': False
                 })
                 continue
             
-            # Rolar dados
-            rolls = roll_dice(quantity, sides)
-            if not rolls:
+            # O limite de dados vale para a soma de todas as rolagens, explosões e rerrolagens incluídas
+            try:
+                evaluation = plan.evaluate(summary=roll_request.get('summary', False), budget=dice_budget)
+            except DiceSyntaxError as e:
                 results.append({
                     'index': i,
                     'label': label,
                     'notation': notation,
-                    'error': 'Erro ao rolar',
+                    'error': str(e),
                     'success': False
                 })
                 continue
-            
-            # Calcular resultado
-            total = sum(rolls) + modifier
-            
-            results.append({
+            response = format_evaluation(plan, evaluation)
+            result = {
                 'index': i,
                 'label': label,
                 'notation': notation,
-                'rolls': rolls,
-                'modifier': modifier,
-                'total': total,
+                'modifier': response['modifier'],
+                'total': response['total'],
                 'success': True
-            })
+            }
+            for key in ('rolls', 'summary', 'comparison'):
+                if key in response:
+                    result[key] = response[key]
+            results.append(result)
         
         return jsonify({
             'results': results,
@@ -224,36 +235,156 @@ def roll_multiple():
     except Exception as e:
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
 
+@dice_bp.route('/distribution', methods=['GET', 'POST'])
+def get_dice_distribution():
+    """
+    Retorna a distribuição exata (PMF, CDF, média e variância) de uma notação
+    Aceita ?notation=1d20%2B5&dc=15 (o '+' precisa ir codificado na URL) ou JSON no corpo
+    """
+    try:
+        data = request.get_json(silent=True) if request.method == 'POST' else None
+        data = data or request.args
+        
+        notation = str(data.get('notation', '')).strip()
+        if not notation:
+            return jsonify({'error': 'Notação de dados é obrigatória'}), 400
+        
+        dc = data.get('dc')
+        if dc is not None:
+            try:
+                dc = int(dc)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'DC deve ser um número inteiro'}), 400
+        
+        try:
+            plan = compile_notation(notation)
+            distribution = get_distribution(notation)
+        except DiceSyntaxError as e:
+            return jsonify({'error': f'{e}. {NOTATION_HELP}'}), 400
+        except DistributionError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = {
+            'notation': notation,
+            'min': distribution.min_value,
+            'max': distribution.max_value,
+            'mean': distribution.mean,
+            'variance': distribution.variance,
+            'std_dev': distribution.variance ** 0.5,
+            'percentiles': {str(p): distribution.percentile(p) for p in PERCENTILES}
+        }
+        if len(distribution.values) <= MAX_DISTRIBUTION_POINTS:
+            response['values'] = distribution.values.tolist()
+            response['pmf'] = distribution.pmf.tolist()
+            response['cdf'] = distribution.cdf.tolist()
+        else:
+            response['truncated'] = True
+        
+        if dc is not None:
+            response['dc'] = dc
+            response['probability_at_least_dc'] = distribution.probability_at_least(dc)
+        
+        if plan.comparison:
+            operator, target = plan.comparison
+            response['comparison'] = {
+                'operator': operator,
+                'target': target,
+                'probability': distribution.probability(operator, target)
+            }
+        
+        return jsonify(response), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@dice_bp.route('/simulate', methods=['POST'])
+def simulate():
+    """Simula lutas atacante x defensor (Monte Carlo) e retorna chance de vitória, rodadas e dano"""
+    try:
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('defender'), dict):
+            return jsonify({'error': 'Dados do defensor (ac e hp) são obrigatórios'}), 400
+        
+        attacker_data = data.get('attacker') or {}
+        defender_data = data['defender']
+        if not isinstance(attacker_data, dict):
+            return jsonify({'error': 'Dados do atacante inválidos'}), 400
+        
+        trials = data.get('trials', DEFAULT_TRIALS)
+        max_rounds = data.get('max_rounds', DEFAULT_MAX_ROUNDS)
+        if not isinstance(trials, int) or not 1 <= trials <= MAX_TRIALS:
+            return jsonify({'error': f'Tentativas devem ser um inteiro entre 1 e {MAX_TRIALS}'}), 400
+        if not isinstance(max_rounds, int) or not 1 <= max_rounds <= MAX_ROUNDS:
+            return jsonify({'error': f'Rodadas devem ser um inteiro entre 1 e {MAX_ROUNDS}'}), 400
+        
+        if not isinstance(defender_data.get('ac'), int) or not isinstance(defender_data.get('hp'), int) \
+                or defender_data['hp'] <= 0:
+            return jsonify({'error': 'CA e PV do defensor devem ser inteiros (PV maior que zero)'}), 400
+        
+        # O defensor só revida se tiver ataque e dano e o atacante tiver CA e PV
+        defender_attacks = bool(defender_data.get('attack') or defender_data.get('damage'))
+        attacker_hp = attacker_data.get('hp')
+        attacker_ac = attacker_data.get('ac')
+        if defender_attacks:
+            if not isinstance(attacker_ac, int) or not isinstance(attacker_hp, int) or attacker_hp <= 0:
+                return jsonify({'error': 'CA e PV do atacante são obrigatórios quando o defensor ataca'}), 400
+        else:
+            attacker_hp = None
+        
+        # Sem notação informada, o atacante usa os presets de combate
+        try:
+            attacker = Combatant(
+                attacker_ac,
+                attacker_hp,
+                resolve_preset(attacker_data.get('attack') or 'Ataque Básico'),
+                resolve_preset(attacker_data.get('damage') or 'Dano de Espada')
+            )
+            defender = Combatant(
+                defender_data['ac'],
+                defender_data['hp'],
+                resolve_preset(defender_data.get('attack')),
+                resolve_preset(defender_data.get('damage'))
+            )
+            result = simulate_combat(attacker, defender, trials, max_rounds)
+        except DiceSyntaxError as e:
+            return jsonify({'error': f'{e}. {NOTATION_HELP}'}), 400
+        
+        result['attacker'] = {
+            'attack': attacker.attack_plan.notation,
+            'damage': attacker.damage_plan.notation,
+            'ac': attacker.ac,
+            'hp': attacker.hp
+        }
+        result['defender'] = {
+            'attack': defender.attack_plan.notation if defender.can_attack else None,
+            'damage': defender.damage_plan.notation if defender.can_attack else None,
+            'ac': defender.ac,
+            'hp': defender.hp
+        }
+        result['max_rounds'] = max_rounds
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@dice_bp.route('/cache/stats', methods=['GET'])
+def get_plan_cache_stats():
+    """Retorna os contadores do cache de expressões compiladas deste worker"""
+    info = distribution_for_normalized.cache_info()
+    return jsonify({
+        'plan_cache': plan_cache_stats(),
+        'distribution_cache': {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize
+        }
+    }), 200
+
 @dice_bp.route('/presets', methods=['GET'])
 def get_presets():
     """Retorna presets comuns de dados"""
-    presets = {
-        'common': [
-            {'name': 'D4', 'notation': '1d4', 'description': 'Dado de 4 lados'},
-            {'name': 'D6', 'notation': '1d6', 'description': 'Dado comum de 6 lados'},
-            {'name': 'D8', 'notation': '1d8', 'description': 'Dado de 8 lados'},
-            {'name': 'D10', 'notation': '1d10', 'description': 'Dado de 10 lados'},
-            {'name': 'D12', 'notation': '1d12', 'description': 'Dado de 12 lados'},
-            {'name': 'D20', 'notation': '1d20', 'description': 'Dado de 20 lados (mais comum em RPGs)'},
-            {'name': 'D100', 'notation': '1d100', 'description': 'Dado percentual'}
-        ],
-        'combat': [
-            {'name': 'Ataque Básico', 'notation': '1d20+5', 'description': 'Rolagem de ataque com bônus +5'},
-            {'name': 'Dano de Espada', 'notation': '1d8+3', 'description': 'Dano de espada longa'},
-            {'name': 'Dano de Arco', 'notation': '1d6+2', 'description': 'Dano de arco curto'},
-            {'name': 'Dano Crítico', 'notation': '2d8+6', 'description': 'Dano crítico dobrado'}
-        ],
-        'attributes': [
-            {'name': 'Atributo 3D6', 'notation': '3d6', 'description': 'Geração de atributo padrão'},
-            {'name': 'Atributo 4D6', 'notation': '4d6', 'description': 'Geração de atributo (descartar menor)'},
-            {'name': 'Teste de Atributo', 'notation': '1d20', 'description': 'Teste contra atributo'}
-        ],
-        'magic': [
-            {'name': 'Bola de Fogo', 'notation': '8d6', 'description': 'Dano de bola de fogo'},
-            {'name': 'Míssil Mágico', 'notation': '1d4+1', 'description': 'Dano de míssil mágico'},
-            {'name': 'Cura Menor', 'notation': '1d8+1', 'description': 'Cura de poção menor'}
-        ]
-    }
-    
-    return jsonify({'presets': presets}), 200
+    return jsonify({'presets': DICE_PRESETS}), 200
 
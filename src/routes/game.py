@@ -1,52 +1,133 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, current_app, request, jsonify, session, stream_with_context
 from src.models.user import db
 from src.models.character import Character
 from src.models.game_session import GameSession
 from src.models.npc import NPC
+from src.models.roll_log import RollLog
 from src.routes.auth import require_auth
 from src.ai_config import MASTER_SYSTEM_PROMPT, INTERACTION_PROMPT, AI_TEMPERATURES, MAX_TOKENS
-import openai
+from src.ai_config import AI_TURN_DEADLINE, AI_MAX_CONCURRENT_CALLS
+from src.ai_config import ACTION_INSTRUCTIONS, NPC_ACTION_INSTRUCTIONS, INTRO_INSTRUCTIONS
+from src.ai_config import STORY_SUMMARY_INTERVAL, STORY_RECENT_ENTRIES, STORY_SUMMARY_WORKERS, STORY_SUMMARY_TOKEN_BUDGET
+from src.services.ai_client import get_ai_client
+from src.services.singleflight import SingleFlight, request_key
+from src.services.session_rng import replay_turn
+from src.services.story_context import build_story_context, build_summary_prompt, summary_due, truncate_to_tokens
+from src.services.story_context import estimate_tokens, SUMMARY_INSTRUCTIONS
+from src.services.token_usage import token_usage
+from src.services.model_router import model_router
+from src.services.npc_memory import relevant_memories, MEMORY_TOP_K
+from src.services.dice_expression import DiceSyntaxError
+from concurrent.futures import ThreadPoolExecutor, wait
 import json
-import random
+import threading
+import time
 from datetime import datetime
 
 game_bp = Blueprint('game', __name__)
 
+# Pool de threads compartilhado para as chamadas de IA de cada turno
+ai_executor = ThreadPoolExecutor(max_workers=AI_MAX_CONCURRENT_CALLS, thread_name_prefix='ai-call')
+
+# Paginação do log da história
+STORY_LOG_PAGE_SIZE = 50
+STORY_LOG_MAX_PAGE_SIZE = 200
+
+# Tamanho máximo de cada memória de NPC citada no prompt
+MEMORY_LINE_TOKENS = 80
+
+# Resumos contínuos da história são atualizados fora da requisição, um por sessão de cada vez
+summary_executor = ThreadPoolExecutor(max_workers=STORY_SUMMARY_WORKERS, thread_name_prefix='story-summary')
+summaries_in_flight = set()
+summaries_lock = threading.Lock()
+
+# Requisições idênticas simultâneas (duplo clique, retentativa do cliente) viram uma só chamada
+ai_flights = SingleFlight()
+
 # Configuração da IA
-def get_ai_response(prompt, context="", response_type="medium_response", personality="balanced"):
-    """Gera resposta da IA usando OpenAI com configurações realistas"""
+def build_ai_request(prompt, context="", response_type="medium_response", personality="balanced", instructions=""):
+    """Monta os parâmetros da chamada ao modelo com configurações realistas"""
+    # Prefixo fixo (prompt do sistema + instruções da chamada) idêntico byte a byte entre chamadas,
+    # para o cache de prompt do provedor; personalidade, contexto e ação só vêm depois dele
+    messages = [{"role": "system", "content": MASTER_SYSTEM_PROMPT}]
+    if instructions:
+        messages.append({"role": "system", "content": instructions})
+    messages.append({"role": "system", "content": f"Personalidade atual: {personality}\nContexto: {context}"})
+    messages.append({"role": "user", "content": prompt})
+    
+    # Selecionar temperatura baseada no tipo de resposta
+    temperature = AI_TEMPERATURES.get('narrative', 0.8)
+    if 'dialogue' in response_type:
+        temperature = AI_TEMPERATURES['dialogue']
+    elif 'consequences' in response_type:
+        temperature = AI_TEMPERATURES['consequences']
+    
+    # Selecionar tokens máximos
+    max_tokens = MAX_TOKENS.get(response_type, MAX_TOKENS['medium_response'])
+    
+    return {
+        'messages': messages,
+        'max_tokens': max_tokens,
+        'temperature': temperature
+    }
+
+def get_ai_response(prompt, context="", response_type="medium_response", personality="balanced",
+                    instructions="", route=None, deadline=None):
+    """Gera resposta da IA usando OpenAI com configurações realistas; os tokens entram na conta de `route`"""
     try:
-        # Usar o prompt do sistema configurado para máximo realismo
-        system_prompt = MASTER_SYSTEM_PROMPT + f"\n\nPersonalidade atual: {personality}\nContexto: {context}"
-        
-        # Selecionar temperatura baseada no tipo de resposta
-        temperature = AI_TEMPERATURES.get('narrative', 0.8)
-        if 'dialogue' in response_type:
-            temperature = AI_TEMPERATURES['dialogue']
-        elif 'consequences' in response_type:
-            temperature = AI_TEMPERATURES['consequences']
-        
-        # Selecionar tokens máximos
-        max_tokens = MAX_TOKENS.get(response_type, MAX_TOKENS['medium_response'])
-
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
-        
-        return response.choices[0].message.content.strip()
+        ai_request = build_ai_request(prompt, context, response_type, personality, instructions)
+        key = request_key(dict(ai_request, response_type=response_type))
+        return ai_flights.do(key, model_router.complete, response_type, get_ai_client().chat, route=route,
+                             deadline=deadline, **ai_request)
     except Exception as e:
         return f"A IA está temporariamente indisponível. Erro: {str(e)}"
 
-def generate_npc_action(npc, game_session):
-    """Gera uma ação autônoma para um NPC"""
-    try:
-        npc_context = f"""
+def stream_ai_response(prompt, context="", response_type="medium_response", personality="balanced",
+                       instructions="", route=None):
+    """Gera a resposta da IA em partes, à medida que os tokens chegam"""
+    ai_request = build_ai_request(prompt, context, response_type, personality, instructions)
+    yield from model_router.stream(response_type, get_ai_client().stream_chat, route=route, **ai_request)
+
+def format_sse(event, data):
+    """Formata um evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def format_memory(memory, npc_names):
+    """Linha de prompt para uma memória recuperada do índice"""
+    return truncate_to_tokens(f"{npc_names.get(memory['npc_id'], 'NPC')}: {memory['text']}", MEMORY_LINE_TOKENS)
+
+def build_action_prompt(game_session, player_action_text, npcs=()):
+    """Monta o prompt e o contexto da IA para uma ação do jogador"""
+    # Só as entradas fora do resumo; o orçamento de tokens decide quantas entram
+    recent_entries = game_session.get_recent_story_entries(
+        STORY_SUMMARY_INTERVAL + STORY_RECENT_ENTRIES, after=game_session.summary_seq or 0
+    )
+    
+    # Memórias dos NPCs da sessão mais próximas da ação e da cena atual
+    memories = []
+    if npcs:
+        query = f"{player_action_text} {game_session.current_location or ''} {game_session.current_scene or ''}"
+        npc_names = {npc.id: npc.name for npc in npcs}
+        memories = [format_memory(memory, npc_names)
+                    for memory in relevant_memories(game_session.id, npcs, query)]
+    
+    context = build_story_context(game_session, recent_entries, memories)
+    
+    # As instruções fixas vão em ACTION_INSTRUCTIONS, no prefixo da requisição
+    ai_prompt = f'O jogador realizou a seguinte ação: "{player_action_text}"'
+    
+    return ai_prompt, context
+
+def build_npc_action_prompt(npc, game_session):
+    """Monta o prompt e o contexto para a ação autônoma de um NPC"""
+    # Só as memórias do NPC ligadas ao que ele faz agora e à cena atual (top-k do índice da sessão)
+    query = f"{npc.current_activity or ''} {npc.current_location or ''} {game_session.current_scene or ''}"
+    memories = relevant_memories(game_session.id, [npc], query, MEMORY_TOP_K)
+    memory_lines = '\n        '.join(
+        '- ' + truncate_to_tokens(memory['text'], MEMORY_LINE_TOKENS) for memory in memories
+    )
+    
+    npc_context = f"""
         NPC: {npc.name} ({npc.race}, {npc.occupation})
         Personalidade: {', '.join(npc.get_personality_traits())}
         Objetivos de curto prazo: {', '.join(npc.get_goals_short_term())}
@@ -55,37 +136,136 @@ def generate_npc_action(npc, game_session):
         Atividade atual: {npc.current_activity}
         Humor: {npc.mood}
         Relacionamentos: {json.dumps(npc.get_relationships())}
+        Memórias relevantes:
+        {memory_lines or 'Nenhuma memória relevante'}
         
         Contexto do jogo: {game_session.story_context}
         Localização atual da história: {game_session.current_location}
         """
-        
-        prompt = f"""Baseado no contexto do NPC acima, gere uma ação autônoma realista que este NPC realizaria. 
-        
-        IMPORTANTE: Este NPC é um ser humano completo com:
-        - Desejos, medos, paixões e necessidades reais
-        - Motivações complexas e às vezes contraditórias  
-        - Capacidade para todas as emoções e ações humanas
-        - Relacionamentos e conflitos pessoais
-        - Ambições, segredos e vulnerabilidades
-        
-        A ação deve ser:
-        - Completamente consistente com sua personalidade e situação
-        - Realista para um ser humano em um mundo medieval
-        - Potencialmente surpreendente mas sempre lógica
-        - Capaz de criar novas oportunidades de interação
-        
-        Responda apenas com a descrição da ação em 2-3 frases detalhadas."""
-        
-        action = get_ai_response(prompt, npc_context, "detailed_scene", "creative")
-        
-        # Registrar a ação na memória do NPC
-        npc.add_memory(f"Ação autônoma: {action}")
-        npc.last_interaction = datetime.utcnow()
-        
-        return action
-    except Exception as e:
-        return f"{npc.name} continua suas atividades normais, perdido em pensamentos sobre seus próprios desejos e preocupações."
+    
+    prompt = f"Próxima ação autônoma de {npc.name}."
+    
+    return prompt, npc_context
+
+def npc_action_fallback(npc):
+    """Ação padrão quando a IA não responde a tempo para um NPC"""
+    return f"{npc.name} continua suas atividades normais, perdido em pensamentos sobre seus próprios desejos e preocupações."
+
+def record_npc_action(npc, action):
+    """Registra a ação na memória do NPC"""
+    npc.add_memory(f"Ação autônoma: {action}")
+    npc.last_interaction = datetime.utcnow()
+
+def record_player_interactions(npcs, player_action_text):
+    """Registra a ação no histórico de interações dos NPCs citados pelo nome"""
+    action = player_action_text.lower()
+    for npc in npcs:
+        if npc.name and npc.name.lower() in action:
+            npc.add_interaction(f"Jogador: {player_action_text}")
+
+def select_acting_npcs(npcs, turn_random):
+    """Sorteia os NPCs que agem de forma autônoma neste turno (com o fluxo aleatório da sessão)"""
+    acting_npcs = []
+    
+    # Processar ações autônomas dos NPCs (chance de 30%)
+    if turn_random.chance(0.3, 'npc_turn'):
+        for npc in npcs[:2]:  # Máximo 2 NPCs por turno
+            if turn_random.chance(0.5, f'npc_acts:{npc.id}'):  # 50% de chance para cada NPC
+                acting_npcs.append(npc)
+    
+    return acting_npcs
+
+def submit_npc_actions(npcs, game_session, deadline):
+    """Dispara as chamadas de IA dos NPCs em paralelo; cada uma desiste no prazo do turno"""
+    futures = []
+    for npc in npcs:
+        prompt, npc_context = build_npc_action_prompt(npc, game_session)
+        futures.append(ai_executor.submit(get_ai_response, prompt, npc_context, "short_response", "creative",
+                                          instructions=NPC_ACTION_INSTRUCTIONS, route='game.npc_action',
+                                          deadline=deadline))
+    return futures
+
+def collect_ai_results(futures, fallbacks, deadline):
+    """Aguarda as chamadas até o prazo do turno e devolve os resultados na ordem original"""
+    done, _ = wait(futures, timeout=max(deadline - time.monotonic(), 0))
+    
+    results = []
+    for future, fallback in zip(futures, fallbacks):
+        if future in done and future.exception() is None:
+            results.append(future.result())
+        else:
+            # cancel() só tira da fila o que nem começou; a chamada em andamento desiste sozinha,
+            # porque o backend recebeu o mesmo prazo do turno
+            future.cancel()
+            results.append(fallback)
+    return results
+
+def save_streamed_turn(session_id, user_id, ai_response, npc_ids, npc_futures, npc_fallbacks, turn_deadline):
+    """Grava a narração transmitida e as ações dos NPCs do turno; retorna a sessão e as ações"""
+    game_session = GameSession.query.filter_by(id=session_id, user_id=user_id).first()
+    # Stream interrompido antes do primeiro token não deixa narração vazia no log
+    if ai_response:
+        game_session.add_story_entry("narration", ai_response)
+        game_session.current_scene = ai_response
+    game_session.last_played = datetime.utcnow()
+    
+    # Registrar as ações dos NPCs, que rodaram em paralelo ao stream
+    npc_actions = []
+    npc_results = collect_ai_results(npc_futures, npc_fallbacks, turn_deadline)
+    for npc_id, npc_action in zip(npc_ids, npc_results):
+        npc = NPC.query.get(npc_id)
+        record_npc_action(npc, npc_action)
+        npc_actions.append({
+            'npc_name': npc.name,
+            'action': npc_action
+        })
+        game_session.add_story_entry("npc_action", npc_action, npc.name)
+    
+    db.session.commit()
+    schedule_story_summary(game_session)
+    return game_session, npc_actions
+
+def schedule_story_summary(game_session):
+    """Agenda em segundo plano a atualização do resumo quando entradas suficientes saíram da janela recente"""
+    if not summary_due(game_session):
+        return
+    with summaries_lock:
+        if game_session.id in summaries_in_flight:
+            return
+        summaries_in_flight.add(game_session.id)
+    summary_executor.submit(update_story_summary, current_app._get_current_object(), game_session.id)
+
+def update_story_summary(app, session_id):
+    """Incorpora ao resumo contínuo as entradas antigas da sessão (roda fora da requisição)"""
+    try:
+        with app.app_context():
+            try:
+                game_session = GameSession.query.get(session_id)
+                base_seq = game_session.summary_seq or 0
+                target_seq = (game_session.story_seq or 0) - STORY_RECENT_ENTRIES
+                entries, _ = game_session.get_story_page(base_seq, target_seq - base_seq)
+                if not entries:
+                    return
+                
+                # Erros da IA sobem como exceção: o resumo antigo fica e a próxima jogada tenta de novo
+                prompt = build_summary_prompt(game_session.story_summary, entries)
+                ai_request = build_ai_request(prompt, response_type="short_response", personality="logical",
+                                              instructions=SUMMARY_INSTRUCTIONS)
+                summary = model_router.complete("short_response", get_ai_client().chat,
+                                                route='game.story_summary', **ai_request)
+                
+                GameSession.store_summary(
+                    session_id, base_seq,
+                    truncate_to_tokens(summary, STORY_SUMMARY_TOKEN_BUDGET),
+                    entries[-1]['seq']
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao atualizar o resumo da sessão {session_id}: {str(e)}")
+    finally:
+        with summaries_lock:
+            summaries_in_flight.discard(session_id)
 
 @game_bp.route('/sessions', methods=['GET'])
 @require_auth
@@ -93,12 +273,18 @@ def get_game_sessions():
     """Lista todas as sessões de jogo do usuário"""
     try:
         user_id = session['user_id']
-        sessions = GameSession.query.filter_by(user_id=user_id).all()
+        fields = GameSession.resolve_fields(request.args.get('view'), request.args.get('fields'))
+        
+        # Carrega apenas as colunas usadas pela projeção (ex: ?view=summary)
+        query = GameSession.query.filter_by(user_id=user_id)
+        sessions = GameSession.apply_projection(query, fields).all()
         
         return jsonify({
-            'sessions': [s.to_dict() for s in sessions]
+            'sessions': [s.to_dict(fields) for s in sessions]
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
 
@@ -119,6 +305,11 @@ def create_game_session():
         if not character:
             return jsonify({'error': 'Personagem não encontrado'}), 404
         
+        # Semente fixa deixa a sessão reproduzível (depuração e benchmarks)
+        rng_seed = data.get('rng_seed')
+        if rng_seed is not None and (not isinstance(rng_seed, int) or not 0 <= rng_seed < 2 ** 63):
+            return jsonify({'error': 'rng_seed deve ser um inteiro entre 0 e 2^63 - 1'}), 400
+        
         # Criar sessão
         game_session = GameSession(
             user_id=user_id,
@@ -129,19 +320,21 @@ def create_game_session():
             ai_personality=data.get('ai_personality', 'balanced'),
             ai_difficulty=data.get('ai_difficulty', 'normal')
         )
+        if rng_seed is not None:
+            game_session.rng_seed = rng_seed
         
         db.session.add(game_session)
         db.session.commit()
         
         # Gerar introdução inicial
-        intro_prompt = f"""Crie uma introdução para uma nova aventura de RPG.
-        Personagem: {character.name} (Nível {character.level} {character.race} {character.character_class})
-        Configuração: {game_session.world_setting}
-        Dificuldade: {game_session.difficulty_level}
-        
-        Crie uma cena inicial interessante que estabeleça o cenário e apresente o primeiro desafio ou oportunidade."""
+        intro_prompt = (
+            f"Personagem: {character.name} (Nível {character.level} {character.race} {character.character_class})\n"
+            f"Configuração: {game_session.world_setting}\n"
+            f"Dificuldade: {game_session.difficulty_level}"
+        )
         
-        intro_story = get_ai_response(intro_prompt, "", game_session.ai_personality)
+        intro_story = get_ai_response(intro_prompt, "", "detailed_scene", game_session.ai_personality,
+                                      instructions=INTRO_INSTRUCTIONS, route='game.session_intro')
         
         # Atualizar sessão com a introdução
         game_session.current_scene = intro_story
@@ -170,7 +363,42 @@ def get_game_session(session_id):
         if not game_session:
             return jsonify({'error': 'Sessão não encontrada'}), 404
         
-        return jsonify({'session': game_session.to_dict()}), 200
+        # O histórico completo só vai na resposta com ?view=full; use /log para paginar
+        fields = GameSession.resolve_fields(request.args.get('view'), request.args.get('fields'))
+        
+        return jsonify({'session': game_session.to_dict(fields)}), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@game_bp.route('/sessions/<int:session_id>/log', methods=['GET'])
+@require_auth
+def get_story_log(session_id):
+    """Retorna o log da história paginado por cursor (?after=<seq>&limit=<n>)"""
+    try:
+        user_id = session['user_id']
+        game_session = GameSession.query.filter_by(id=session_id, user_id=user_id).first()
+        
+        if not game_session:
+            return jsonify({'error': 'Sessão não encontrada'}), 404
+        
+        after = request.args.get('after', 0, type=int)
+        limit = request.args.get('limit', STORY_LOG_PAGE_SIZE, type=int)
+        
+        if after < 0 or limit <= 0:
+            return jsonify({'error': 'Parâmetros after e limit devem ser positivos'}), 400
+        
+        limit = min(limit, STORY_LOG_MAX_PAGE_SIZE)
+        entries, has_more = game_session.get_story_page(after, limit)
+        
+        return jsonify({
+            'entries': entries,
+            'next_cursor': entries[-1]['seq'] if entries else after,
+            'has_more': has_more,
+            'latest_seq': game_session.story_seq or 0
+        }), 200
         
     except Exception as e:
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
@@ -178,7 +406,7 @@ def get_game_session(session_id):
 @game_bp.route('/sessions/<int:session_id>/action', methods=['POST'])
 @require_auth
 def player_action(session_id):
-    """Processa uma ação do jogador"""
+    """Processa uma ação do jogador e retorna apenas o que o turno produziu"""
     try:
         data = request.get_json()
         user_id = session['user_id']
@@ -186,6 +414,11 @@ def player_action(session_id):
         if not data.get('action'):
             return jsonify({'error': 'Ação é obrigatória'}), 400
         
+        # Cliente que perdeu atualizações informa ?since=<seq> para recuperar o que faltou
+        since = request.args.get('since', type=int)
+        if since is not None and since < 0:
+            return jsonify({'error': 'Parâmetro since deve ser positivo'}), 400
+        
         game_session = GameSession.query.filter_by(id=session_id, user_id=user_id).first()
         if not game_session:
             return jsonify({'error': 'Sessão não encontrada'}), 404
@@ -194,58 +427,156 @@ def player_action(session_id):
         
         # Registrar ação do jogador
         game_session.add_player_action(player_action_text)
-        game_session.add_story_entry("player_action", player_action_text, "Jogador")
-        
-        # Gerar resposta da IA
-        context = f"""
-        Contexto da história: {game_session.story_context}
-        Cena atual: {game_session.current_scene}
-        Localização: {game_session.current_location}
-        Últimas entradas do log: {json.dumps(game_session.get_story_log()[-5:])}
-        """
-        
-        ai_prompt = f"""O jogador realizou a seguinte ação: "{player_action_text}"
-        
-        Como Mestre de RPG, responda a esta ação:
-        1. Descreva o resultado da ação
-        2. Avance a narrativa
-        3. Apresente a nova situação
-        4. Ofereça opções ou desafios para o próximo movimento
+        turn_entries = [game_session.add_story_entry("player_action", player_action_text, "Jogador")]
+        
+        # Gerar a narração e as ações dos NPCs em paralelo, com prazo único para o turno
+        turn_deadline = time.monotonic() + AI_TURN_DEADLINE
+        npcs = NPC.query.filter_by(game_session_id=session_id).order_by(NPC.id).all()
+        ai_prompt, context = build_action_prompt(game_session, player_action_text, npcs)
+        record_player_interactions(npcs, player_action_text)
+        turn_random = game_session.start_rng_turn('player_action')
+        acting_npcs = select_acting_npcs(npcs, turn_random)
+        
+        # A ação e os sorteios são gravados antes de esperar pela IA: a transação não fica aberta
+        # (travando a escrita do SQLite para as outras sessões) durante as chamadas
+        RollLog.append_turn(game_session.id, turn_random)
+        db.session.commit()
         
-        Mantenha a resposta envolvente e entre 100-200 palavras."""
+        futures = [ai_executor.submit(get_ai_response, ai_prompt, context, "medium_response",
+                                      game_session.ai_personality, instructions=ACTION_INSTRUCTIONS,
+                                      route='game.player_action', deadline=turn_deadline)]
+        futures += submit_npc_actions(acting_npcs, game_session, turn_deadline)
+        fallbacks = ["A IA está temporariamente indisponível. Erro: tempo limite do turno excedido"]
+        fallbacks += [npc_action_fallback(npc) for npc in acting_npcs]
         
-        ai_response = get_ai_response(ai_prompt, context, game_session.ai_personality)
+        ai_response, *npc_results = collect_ai_results(futures, fallbacks, turn_deadline)
         
         # Registrar resposta da IA
-        game_session.add_story_entry("narration", ai_response)
+        turn_entries.append(game_session.add_story_entry("narration", ai_response))
         game_session.current_scene = ai_response
         game_session.last_played = datetime.utcnow()
         
-        # Processar ações autônomas dos NPCs (chance de 30%)
+        # Registrar as ações dos NPCs sempre na mesma ordem
         npc_actions = []
-        if random.random() < 0.3:
-            npcs = NPC.query.filter_by(game_session_id=session_id).all()
-            for npc in npcs[:2]:  # Máximo 2 NPCs por turno
-                if random.random() < 0.5:  # 50% de chance para cada NPC
-                    npc_action = generate_npc_action(npc, game_session)
-                    npc_actions.append({
-                        'npc_name': npc.name,
-                        'action': npc_action
-                    })
-                    game_session.add_story_entry("npc_action", npc_action, npc.name)
+        for npc, npc_action in zip(acting_npcs, npc_results):
+            record_npc_action(npc, npc_action)
+            npc_actions.append({
+                'npc_name': npc.name,
+                'action': npc_action
+            })
+            turn_entries.append(game_session.add_story_entry("npc_action", npc_action, npc.name))
+        
+        # Serializar antes do commit evita recarregar as entradas do banco
+        delta = {
+            'ai_response': ai_response,
+            'npc_actions': npc_actions,
+            'entries': [entry.to_dict() for entry in turn_entries],
+            'seq': game_session.story_seq,
+            'current_scene': game_session.current_scene,
+            'last_played': game_session.last_played.isoformat()
+        }
         
         db.session.commit()
+        schedule_story_summary(game_session)
         
-        return jsonify({
-            'ai_response': ai_response,
-            'npc_actions': npc_actions,
-            'session': game_session.to_dict()
-        }), 200
+        if since is not None:
+            delta['entries'], delta['has_more'] = game_session.get_story_page(since, STORY_LOG_MAX_PAGE_SIZE)
+        
+        return jsonify(delta), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
 
+@game_bp.route('/sessions/<int:session_id>/action/stream', methods=['POST'])
+@require_auth
+def player_action_stream(session_id):
+    """Processa uma ação do jogador enviando a narração via Server-Sent Events"""
+    try:
+        data = request.get_json()
+        user_id = session['user_id']
+        
+        if not data.get('action'):
+            return jsonify({'error': 'Ação é obrigatória'}), 400
+        
+        game_session = GameSession.query.filter_by(id=session_id, user_id=user_id).first()
+        if not game_session:
+            return jsonify({'error': 'Sessão não encontrada'}), 404
+        
+        player_action_text = data['action']
+        
+        # Registrar ação do jogador antes de abrir o stream
+        game_session.add_player_action(player_action_text)
+        game_session.add_story_entry("player_action", player_action_text, "Jogador")
+        
+        turn_deadline = time.monotonic() + AI_TURN_DEADLINE
+        npcs = NPC.query.filter_by(game_session_id=session_id).order_by(NPC.id).all()
+        ai_prompt, context = build_action_prompt(game_session, player_action_text, npcs)
+        record_player_interactions(npcs, player_action_text)
+        personality = game_session.ai_personality
+        turn_random = game_session.start_rng_turn('player_action')
+        acting_npcs = select_acting_npcs(npcs, turn_random)
+        npc_ids = [npc.id for npc in acting_npcs]
+        npc_fallbacks = [npc_action_fallback(npc) for npc in acting_npcs]
+        
+        # Os sorteios do turno são gravados junto com a ação, antes de abrir o stream
+        RollLog.append_turn(game_session.id, turn_random)
+        db.session.commit()
+        
+        # Com a ação gravada, as ações dos NPCs rodam em paralelo enquanto a narração é transmitida
+        npc_futures = submit_npc_actions(acting_npcs, game_session, turn_deadline)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+    
+    def save_turn(ai_response):
+        return save_streamed_turn(session_id, user_id, ai_response, npc_ids, npc_futures, npc_fallbacks, turn_deadline)
+    
+    def generate():
+        tokens = []
+        try:
+            for token in stream_ai_response(ai_prompt, context, personality=personality,
+                                            instructions=ACTION_INSTRUCTIONS, route='game.player_action_stream'):
+                tokens.append(token)
+                yield format_sse('token', {'content': token})
+        except GeneratorExit:
+            # Cliente desconectou no meio do stream: o que já foi narrado e as ações dos NPCs ainda são gravados
+            try:
+                save_turn(''.join(tokens).strip())
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao salvar a narração interrompida da sessão {session_id}: {str(e)}")
+            raise
+        except Exception as e:
+            # Mantém o que já foi narrado; sem nenhum token, usa a mensagem padrão
+            if not tokens:
+                tokens.append(f"A IA está temporariamente indisponível. Erro: {str(e)}")
+                yield format_sse('token', {'content': tokens[0]})
+        
+        ai_response = ''.join(tokens).strip()
+        
+        # Persistir a narração completa quando o stream termina
+        try:
+            game_session, npc_actions = save_turn(ai_response)
+        except Exception as e:
+            db.session.rollback()
+            yield format_sse('error', {'error': f'Erro ao salvar a narração: {str(e)}'})
+            return
+        
+        yield format_sse('done', {
+            'ai_response': ai_response,
+            'npc_actions': npc_actions,
+            'seq': game_session.story_seq,
+            'last_played': game_session.last_played.isoformat()
+        })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @game_bp.route('/sessions/<int:session_id>/npcs', methods=['GET'])
 @require_auth
 def get_session_npcs(session_id):
@@ -257,10 +588,44 @@ def get_session_npcs(session_id):
         if not game_session:
             return jsonify({'error': 'Sessão não encontrada'}), 404
         
-        npcs = NPC.query.filter_by(game_session_id=session_id).all()
+        fields = NPC.resolve_fields(request.args.get('view'), request.args.get('fields'))
+        query = NPC.query.filter_by(game_session_id=session_id)
+        npcs = NPC.apply_projection(query, fields).all()
         
         return jsonify({
-            'npcs': [npc.to_dict() for npc in npcs]
+            'npcs': [npc.to_dict(fields) for npc in npcs]
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@game_bp.route('/sessions/<int:session_id>/npcs/<int:npc_id>/memories', methods=['GET'])
+@require_auth
+def search_npc_memories(session_id, npc_id):
+    """Busca as memórias de um NPC mais relevantes para um texto (?q=<texto>&k=<n>)"""
+    try:
+        user_id = session['user_id']
+        game_session = GameSession.query.filter_by(id=session_id, user_id=user_id).first()
+        
+        if not game_session:
+            return jsonify({'error': 'Sessão não encontrada'}), 404
+        
+        npc = NPC.query.filter_by(id=npc_id, game_session_id=session_id).first()
+        if not npc:
+            return jsonify({'error': 'NPC não encontrado'}), 404
+        
+        query = request.args.get('q', '').strip()
+        k = request.args.get('k', MEMORY_TOP_K, type=int)
+        if not query:
+            return jsonify({'error': 'Parâmetro q é obrigatório'}), 400
+        if not 1 <= k <= 50:
+            return jsonify({'error': 'Parâmetro k deve estar entre 1 e 50'}), 400
+        
+        return jsonify({
+            'npc_id': npc.id,
+            'memories': relevant_memories(session_id, [npc], query, k)
         }), 200
         
     except Exception as e:
@@ -356,28 +721,30 @@ def update_all_npcs(session_id):
         if not game_session:
             return jsonify({'error': 'Sessão não encontrada'}), 404
         
-        npcs = NPC.query.filter_by(game_session_id=session_id).all()
+        npcs = NPC.query.filter_by(game_session_id=session_id).order_by(NPC.id).all()
         updates = []
+        turn_random = game_session.start_rng_turn('npc_update')
         
         for npc in npcs:
             # Simular evolução do NPC
-            if random.random() < 0.1:  # 10% de chance de ganhar skill points
+            if turn_random.chance(0.1, f'skill_points:{npc.id}'):  # 10% de chance de ganhar skill points
                 npc.skill_points += 1
             
-            if random.random() < 0.05:  # 5% de chance de aprender nova habilidade
+            if turn_random.chance(0.05, f'learn_skill:{npc.id}'):  # 5% de chance de aprender nova habilidade
                 new_skills = ["Observação", "Persuasão", "Furtividade", "Combate", "Magia", "Artesanato"]
                 available_skills = [s for s in new_skills if s not in npc.get_learned_skills()]
                 if available_skills:
-                    new_skill = random.choice(available_skills)
+                    new_skill = turn_random.choice(available_skills, f'new_skill:{npc.id}')
                     npc.add_skill(new_skill)
                     updates.append(f"{npc.name} aprendeu {new_skill}")
             
             # Atualizar humor baseado em eventos recentes
             moods = ["feliz", "neutro", "triste", "irritado", "animado", "pensativo"]
-            if random.random() < 0.2:  # 20% de chance de mudança de humor
-                npc.mood = random.choice(moods)
+            if turn_random.chance(0.2, f'mood_change:{npc.id}'):  # 20% de chance de mudança de humor
+                npc.mood = turn_random.choice(moods, f'mood:{npc.id}')
                 updates.append(f"{npc.name} está se sentindo {npc.mood}")
         
+        RollLog.append_turn(game_session.id, turn_random)
         db.session.commit()
         
         return jsonify({
@@ -389,3 +756,106 @@ def update_all_npcs(session_id):
         db.session.rollback()
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
 
+@game_bp.route('/sessions/<int:session_id>/roll', methods=['POST'])
+@require_auth
+def session_roll(session_id):
+    """Rola dados com o fluxo aleatório da sessão; a rolagem fica no log e pode ser reproduzida"""
+    try:
+        data = request.get_json()
+        user_id = session['user_id']
+        
+        if not data or not data.get('notation'):
+            return jsonify({'error': 'Notação de dados é obrigatória'}), 400
+        
+        game_session = GameSession.query.filter_by(id=session_id, user_id=user_id).first()
+        if not game_session:
+            return jsonify({'error': 'Sessão não encontrada'}), 404
+        
+        turn_random = game_session.start_rng_turn('dice')
+        try:
+            evaluation = turn_random.roll(data['notation'].strip(), data.get('label'))
+        except DiceSyntaxError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        
+        RollLog.append_turn(game_session.id, turn_random)
+        db.session.commit()
+        
+        evaluation['turn'] = turn_random.turn
+        return jsonify(evaluation), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@game_bp.route('/sessions/<int:session_id>/rolls', methods=['GET'])
+@require_auth
+def get_roll_log(session_id):
+    """Lista o log de rolagens da sessão (?turn=<n> filtra um turno)"""
+    try:
+        user_id = session['user_id']
+        game_session = GameSession.query.filter_by(id=session_id, user_id=user_id).first()
+        
+        if not game_session:
+            return jsonify({'error': 'Sessão não encontrada'}), 404
+        
+        query = game_session.roll_logs
+        turn = request.args.get('turn', type=int)
+        if turn is not None:
+            query = query.filter(RollLog.turn == turn)
+        else:
+            # Sem filtro, só os turnos mais recentes
+            query = query.filter(RollLog.turn > (game_session.rng_turn or 0) - STORY_LOG_PAGE_SIZE)
+        
+        return jsonify({
+            'rolls': [roll.to_dict() for roll in query],
+            'rng_turn': game_session.rng_turn or 0
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@game_bp.route('/sessions/<int:session_id>/rolls/<int:turn>/replay', methods=['GET'])
+@require_auth
+def replay_roll_turn(session_id, turn):
+    """Reproduz os sorteios de um turno a partir da semente da sessão e compara com o log"""
+    try:
+        user_id = session['user_id']
+        game_session = GameSession.query.filter_by(id=session_id, user_id=user_id).first()
+        
+        if not game_session:
+            return jsonify({'error': 'Sessão não encontrada'}), 404
+        
+        rolls = [roll.to_dict() for roll in game_session.roll_logs.filter(RollLog.turn == turn)]
+        if not rolls or game_session.rng_seed is None:
+            return jsonify({'error': 'Nenhuma rolagem registrada neste turno'}), 404
+        
+        replayed = replay_turn(game_session.rng_seed, turn, rolls[0]['context'], rolls)
+        
+        return jsonify({
+            'turn': turn,
+            'context': rolls[0]['context'],
+            'rolls': replayed,
+            'deterministic': all(roll['matches'] for roll in replayed)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@game_bp.route('/ai/usage', methods=['GET'])
+@require_auth
+def get_ai_usage():
+    """Retorna os tokens gastos por rota, a latência das camadas de modelo e o tamanho estimado dos prefixos fixos"""
+    prefixes = {
+        'game.player_action': ACTION_INSTRUCTIONS,
+        'game.npc_action': NPC_ACTION_INSTRUCTIONS,
+        'game.session_intro': INTRO_INSTRUCTIONS,
+        'game.story_summary': SUMMARY_INSTRUCTIONS
+    }
+    return jsonify({
+        'backend': get_ai_client().name,
+        'routes': token_usage.snapshot(),
+        'tiers': model_router.stats(),
+        'static_prefix_tokens': {route: estimate_tokens(MASTER_SYSTEM_PROMPT) + estimate_tokens(instructions)
+                                 for route, instructions in prefixes.items()}
+    }), 200
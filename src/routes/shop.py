@@ -1,23 +1,37 @@
 from flask import Blueprint, request, jsonify, session
 from src.models.user import db
 from src.models.character import Character
+from src.models.catalog import CatalogItem
+from src.models.inventory import InventoryItem
+from src.models.shop import Shop, ShopStock
 from src.routes.auth import require_auth
-import openai
+from src.services.ai_client import get_ai_client
+from src.services.cache import TTLCache
+from src.services.item_generator import generate_items
+from src.services.model_router import model_router
+from src.services.scheduler import PeriodicTask
+from src.services.singleflight import SingleFlight
+from sqlalchemy.exc import IntegrityError
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+import copy
 import json
 import random
+import unicodedata
 
 shop_bp = Blueprint('shop', __name__)
 
-def generate_shop_items(location, character_level, shop_type="general"):
-    """Gera itens para a loja baseado na localização e nível do personagem"""
-    try:
-        prompt = f"""Você é um mestre de RPG criando uma loja em um mundo de fantasia medieval.
+# Cache das lojas geradas pela IA
+SHOP_CACHE_TTL = 600       # Segundos até a loja ser gerada novamente
+SHOP_CACHE_SIZE = 512      # Lojas mantidas por worker
+SHOP_LEVEL_BUCKET = 3      # Níveis agrupados na mesma entrada (1-3, 4-6, ...)
+SHOP_AI_DEADLINE = 8       # Segundos de espera pela IA antes de usar o gerador procedural
 
-Localização: {location}
-Nível do personagem: {character_level}
-Tipo de loja: {shop_type}
+# Instruções fixas da geração de itens (idênticas entre chamadas, para o cache de prompt do provedor)
+SHOP_ITEMS_PROMPT = """Você é um mestre de RPG especialista em criar itens, criando uma loja em um mundo de fantasia medieval.
+Responda sempre com JSON válido.
 
-Crie 8-12 itens únicos e interessantes para esta loja. Os itens devem ser apropriados para:
+Crie 8-12 itens únicos e interessantes para a loja descrita pelo usuário. Os itens devem ser apropriados para:
 - A localização (ex: itens mágicos em torres de magos, armas em forges, poções em alquimistas)
 - O nível do personagem (itens mais poderosos para níveis maiores)
 - O ambiente medieval fantástico
@@ -31,34 +45,102 @@ Para cada item, forneça:
 - Propriedades especiais (se houver)
 
 Responda APENAS com um JSON válido no formato:
-{{
+{
   "items": [
-    {{
+    {
       "name": "Nome do Item",
       "description": "Descrição detalhada do item",
       "type": "weapon",
       "price": 150,
       "rarity": "uncommon",
-      "properties": {{
+      "properties": {
         "damage": "+2",
         "special": "Brilha na escuridão"
-      }}
-    }}
+      }
+    }
   ]
-}}"""
+}"""
+
+# Lojas de itens baratos usam só o gerador procedural (sem custo nem latência de IA)
+PROCEDURAL_SHOP_TYPES = ('general', 'tavern')
+
+# Estoque persistido e reposição em segundo plano
+SHOP_RESTOCK_INTERVAL = 3600   # Segundos entre reposições de uma loja
+SHOP_RESTOCK_POLL = 60         # Segundos entre verificações de lojas vencidas
+SHOP_RESTOCK_LEASE = 300       # Reserva de um worker sobre a reposição de uma loja
+SHOP_RESTOCK_BATCH = 20        # Lojas repostas por verificação
+SHOP_STOCK_BY_RARITY = {
+    'common': 10,
+    'uncommon': 5,
+    'rare': 3,
+    'epic': 2,
+    'legendary': 1
+}
+
+shop_cache = TTLCache(maxsize=SHOP_CACHE_SIZE, ttl=SHOP_CACHE_TTL)
+shop_flights = SingleFlight()
+shop_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='shop-ai')
+
+def normalize_location(location):
+    """Normaliza o nome da localização (sem acentos, caixa ou espaços extras)"""
+    text = unicodedata.normalize('NFKD', location or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
+
+def shop_cache_key(location, character_level, shop_type):
+    """Chave do cache: localização normalizada, faixa de nível e tipo de loja"""
+    level_bucket = (max(character_level or 1, 1) - 1) // SHOP_LEVEL_BUCKET
+    return (normalize_location(location), level_bucket, shop_type)
+
+def generate_shop_items(location, character_level, shop_type="general"):
+    """Gera itens para a loja baseado na localização e nível do personagem"""
+    if shop_type in PROCEDURAL_SHOP_TYPES:
+        return generate_procedural_items(location, character_level, shop_type)
+    
+    key = shop_cache_key(location, character_level, shop_type)
+    
+    cached = shop_cache.get(key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+    
+    # Gerações simultâneas da mesma loja compartilham uma única chamada à IA
+    future = shop_executor.submit(shop_flights.do, key, fetch_shop_items, key, location, character_level, shop_type)
+    done, _ = wait([future], timeout=SHOP_AI_DEADLINE)
+    shop_data = future.result() if done else None
+    if shop_data is None:
+        # IA falhou ou está lenta: itens procedurais (uma resposta atrasada ainda chega ao cache)
+        return generate_procedural_items(location, character_level, shop_type)
+    
+    return copy.deepcopy(shop_data)
+
+def generate_procedural_items(location, character_level, shop_type):
+    """Itens do gerador procedural, reprodutíveis por localização, tipo de loja e dia"""
+    return generate_items(normalize_location(location), shop_type, character_level)
 
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
+def fetch_shop_items(key, location, character_level, shop_type):
+    """Chama a IA e guarda no cache as respostas válidas"""
+    shop_data = request_shop_items(location, character_level, shop_type)
+    if shop_data is not None:
+        shop_cache.set(key, shop_data)
+    return shop_data
+
+def request_shop_items(location, character_level, shop_type):
+    """Pede os itens da loja à IA; retorna None se a resposta não puder ser usada"""
+    try:
+        # Só a loja pedida muda entre chamadas; as instruções ficam no prefixo fixo da requisição
+        prompt = f"Localização: {location}\nNível do personagem: {character_level}\nTipo de loja: {shop_type}"
+        
+        content = model_router.complete(
+            "long_response", get_ai_client().chat,
+            route='shop.generate_items',
             messages=[
-                {"role": "system", "content": "Você é um especialista em criar itens de RPG medieval fantástico. Responda sempre com JSON válido."},
+                {"role": "system", "content": SHOP_ITEMS_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=1500,
             temperature=0.8
         )
         
-        content = response.choices[0].message.content.strip()
-        
         # Tentar extrair JSON da resposta
         try:
             # Procurar por JSON na resposta
@@ -70,87 +152,90 @@ Responda APENAS com um JSON válido no formato:
         except:
             pass
         
-        # Fallback: itens padrão se a IA falhar
-        return generate_fallback_items(location, character_level, shop_type)
+        return None
         
     except Exception as e:
         print(f"Erro ao gerar itens da loja: {e}")
-        return generate_fallback_items(location, character_level, shop_type)
+        return None
 
-def generate_fallback_items(location, character_level, shop_type):
-    """Gera itens padrão caso a IA falhe"""
-    base_items = [
-        {
-            "name": "Espada de Ferro",
-            "description": "Uma espada bem forjada de ferro puro. Confiável e afiada.",
-            "type": "weapon",
-            "price": 50 + (character_level * 10),
-            "rarity": "common",
-            "properties": {"damage": "+1", "durability": "Alta"}
-        },
-        {
-            "name": "Poção de Cura Menor",
-            "description": "Uma poção vermelha que restaura vitalidade. Sabor de frutas vermelhas.",
-            "type": "potion",
-            "price": 25 + (character_level * 5),
-            "rarity": "common",
-            "properties": {"healing": "1d8+2", "uses": "1"}
-        },
-        {
-            "name": "Armadura de Couro",
-            "description": "Armadura leve feita de couro curtido. Oferece proteção básica.",
-            "type": "armor",
-            "price": 75 + (character_level * 15),
-            "rarity": "common",
-            "properties": {"defense": "+2", "weight": "Leve"}
-        },
-        {
-            "name": "Pergaminho de Luz",
-            "description": "Um pergaminho que emite uma luz suave quando ativado.",
-            "type": "scroll",
-            "price": 30 + (character_level * 8),
-            "rarity": "uncommon",
-            "properties": {"spell": "Luz", "duration": "1 hora"}
-        },
-        {
-            "name": "Anel de Proteção",
-            "description": "Um anel simples que oferece proteção mágica contra ataques menores.",
-            "type": "accessory",
-            "price": 100 + (character_level * 20),
-            "rarity": "uncommon",
-            "properties": {"defense": "+1", "magic_resistance": "5%"}
-        },
-        {
-            "name": "Corda Élfica",
-            "description": "Corda leve e resistente feita pelos elfos. Nunca se desgasta.",
-            "type": "misc",
-            "price": 40 + (character_level * 5),
-            "rarity": "uncommon",
-            "properties": {"length": "15 metros", "special": "Indestrutível"}
-        }
-    ]
+def fill_shop_stock(shop, shop_data, now):
+    """Substitui o estoque da loja pelos itens gerados, com a quantidade cheia"""
+    items = [item for item in shop_data.get('items', []) if isinstance(item, dict) and item.get('name')]
+    existing = {stock.catalog_id: stock for stock in shop.stock}
     
-    # Adicionar variação baseada na localização
-    location_modifiers = {
-        "vila": 0.8,
-        "cidade": 1.0,
-        "capital": 1.5,
-        "torre": 1.3,
-        "dungeon": 1.2,
-        "floresta": 0.9
-    }
+    listed = set()
+    for item, catalog_item in zip(items, CatalogItem.upsert_many(items)):
+        if catalog_item.id in listed:
+            continue
+        listed.add(catalog_item.id)
+        
+        quantity = SHOP_STOCK_BY_RARITY.get(catalog_item.rarity, 1)
+        stock = existing.get(catalog_item.id)
+        if stock:
+            stock.price = catalog_item.value
+            stock.quantity = quantity
+        else:
+            shop.stock.append(ShopStock(catalog_id=catalog_item.id, price=catalog_item.value, quantity=quantity))
     
-    modifier = 1.0
-    for loc_key, mod_value in location_modifiers.items():
-        if loc_key.lower() in location.lower():
-            modifier = mod_value
-            break
+    # Itens que saíram da lista deixam a loja
+    for catalog_id, stock in existing.items():
+        if catalog_id not in listed:
+            db.session.delete(stock)
     
-    # Aplicar modificador de preço
-    for item in base_items:
-        item["price"] = int(item["price"] * modifier)
+    shop.restocked_at = now
+    shop.next_restock_at = now + timedelta(seconds=SHOP_RESTOCK_INTERVAL)
+    shop.restock_claimed_until = None
+
+def get_or_create_shop(location, character_level, shop_type):
+    """Busca a loja persistida; só a primeira visita gera os itens no caminho da requisição"""
+    location_key = normalize_location(location)
+    shop = Shop.query.filter_by(location_key=location_key, shop_type=shop_type).first()
+    if shop:
+        if (character_level or 1) > (shop.level or 1):
+            shop.level = character_level
+        return shop
     
-    return {"items": base_items}
+    # Gera antes de abrir a escrita para não segurar o banco durante a chamada à IA
+    shop_data = generate_shop_items(location, character_level, shop_type)
+    now = datetime.utcnow()
+    shop = Shop(location_key=location_key, location=location, shop_type=shop_type,
+                level=character_level, generated_at=now)
+    try:
+        with db.session.begin_nested():
+            db.session.add(shop)
+            fill_shop_stock(shop, shop_data, now)
+    except IntegrityError:
+        # Outra requisição criou a mesma loja ao mesmo tempo
+        shop = Shop.query.filter_by(location_key=location_key, shop_type=shop_type).one()
+    return shop
+
+def restock_due_shops():
+    """Repõe as lojas vencidas; roda na thread de reposição, fora das requisições"""
+    now = datetime.utcnow()
+    due_ids = [row.id for row in Shop.query
+               .with_entities(Shop.id)
+               .filter(Shop.next_restock_at <= now)
+               .order_by(Shop.next_restock_at)
+               .limit(SHOP_RESTOCK_BATCH)]
+    
+    for shop_id in due_ids:
+        # Com vários workers, só quem ganhar a reserva repõe a loja
+        if not Shop.claim_restock(shop_id, now, SHOP_RESTOCK_LEASE):
+            db.session.rollback()
+            continue
+        db.session.commit()
+        
+        shop = db.session.get(Shop, shop_id)
+        try:
+            shop_data = generate_shop_items(shop.location, shop.level, shop.shop_type)
+            fill_shop_stock(shop, shop_data, datetime.utcnow())
+            db.session.commit()
+        except Exception as e:
+            # A reserva expira e a loja volta a ser tentada depois
+            db.session.rollback()
+            print(f"Erro ao repor a loja {shop_id}: {e}")
+
+shop_restock_task = PeriodicTask('shop-restock', SHOP_RESTOCK_POLL, restock_due_shops)
 
 @shop_bp.route('/generate', methods=['POST'])
 @require_auth
@@ -171,23 +256,14 @@ def generate_shop():
         if not character:
             return jsonify({'error': 'Personagem não encontrado'}), 404
         
-        # Gerar itens da loja
-        shop_data = generate_shop_items(
-            character.current_location, 
-            character.level, 
-            shop_type
-        )
+        # Buscar (ou criar na primeira visita) a loja persistida
+        shop = get_or_create_shop(character.current_location, character.level, shop_type)
+        db.session.commit()
         
-        return jsonify({
-            'shop': {
-                'location': character.current_location,
-                'type': shop_type,
-                'items': shop_data.get('items', []),
-                'generated_at': 'now'
-            }
-        }), 200
+        return jsonify({'shop': shop.to_dict()}), 200
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
 
 @shop_bp.route('/buy', methods=['POST'])
@@ -205,29 +281,43 @@ def buy_item():
         if not character_id or not item_data:
             return jsonify({'error': 'ID do personagem e dados do item são obrigatórios'}), 400
         
+        if not isinstance(quantity, int) or quantity < 1:
+            return jsonify({'error': 'Quantidade inválida'}), 400
+        
         # Buscar personagem
         character = Character.query.filter_by(id=character_id, user_id=user_id).first()
         if not character:
             return jsonify({'error': 'Personagem não encontrado'}), 404
         
-        total_cost = item_data['price'] * quantity
+        # Preço e estoque vêm do banco, não do item enviado pelo cliente
+        stock_id = item_data.get('stock_id')
+        if not stock_id:
+            return jsonify({'error': 'O item precisa vir do estoque de uma loja (stock_id)'}), 400
         
-        # Verificar se tem ouro suficiente
-        if not character.can_afford(total_cost):
-            return jsonify({'error': f'Ouro insuficiente. Necessário: {total_cost}, Disponível: {character.gold}'}), 400
+        stock = db.session.get(ShopStock, stock_id)
+        if not stock:
+            return jsonify({'error': 'Item não encontrado no estoque da loja'}), 404
+        
+        item_name = stock.catalog_item.name
+        total_cost = stock.price * quantity
+        
+        # Baixa condicional do estoque
+        if not ShopStock.take(stock.id, quantity):
+            db.session.rollback()
+            return jsonify({'error': f'Estoque insuficiente de {item_name}'}), 409
         
-        # Realizar compra
-        character.spend_gold(total_cost)
+        # Débito condicional: duas compras simultâneas nunca deixam o saldo negativo
+        if not character.spend_gold(total_cost):
+            db.session.rollback()
+            return jsonify({'error': f'Ouro insuficiente. Necessário: {total_cost}, Disponível: {character.gold}'}), 400
         
         # Adicionar item ao inventário
-        purchase_item = item_data.copy()
-        purchase_item['quantity'] = quantity
-        character.add_item_to_inventory(purchase_item)
+        InventoryItem.add_to_stack(character.id, stock.catalog_id, quantity)
         
         db.session.commit()
         
         return jsonify({
-            'message': f'Item {item_data["name"]} comprado com sucesso!',
+            'message': f'Item {item_name} comprado com sucesso!',
             'character': character.to_dict()
         }), 200
         
@@ -250,38 +340,37 @@ def sell_item():
         if not character_id or not item_id:
             return jsonify({'error': 'ID do personagem e ID do item são obrigatórios'}), 400
         
+        if not isinstance(quantity, int) or quantity < 1:
+            return jsonify({'error': 'Quantidade inválida'}), 400
+        
         # Buscar personagem
         character = Character.query.filter_by(id=character_id, user_id=user_id).first()
         if not character:
             return jsonify({'error': 'Personagem não encontrado'}), 404
         
         # Encontrar item no inventário
-        inventory = character.get_inventory()
-        item_to_sell = None
-        
-        for item in inventory:
-            if item['id'] == item_id:
-                item_to_sell = item
-                break
-        
+        item_to_sell = character.get_inventory_item(item_id)
         if not item_to_sell:
             return jsonify({'error': 'Item não encontrado no inventário'}), 404
         
-        if item_to_sell['quantity'] < quantity:
+        if item_to_sell.quantity < quantity:
             return jsonify({'error': 'Quantidade insuficiente no inventário'}), 400
         
         # Calcular valor de venda (50% do valor original)
-        sell_price = int(item_to_sell.get('value', item_to_sell.get('price', 0)) * 0.5)
+        sell_price = int((item_to_sell.catalog_item.value or 0) * 0.5)
         total_earned = sell_price * quantity
+        item_name = item_to_sell.catalog_item.name
         
-        # Realizar venda
-        character.remove_item_from_inventory(item_id, quantity)
+        # Realizar venda: a retirada só acontece se a pilha ainda tiver a quantidade (e a versão, se enviada)
+        if not InventoryItem.take_from_stack(character.id, item_to_sell.id, quantity, data.get('version')):
+            db.session.rollback()
+            return jsonify({'error': 'O item foi alterado por outra requisição; atualize o inventário e tente novamente'}), 409
         character.earn_gold(total_earned)
         
         db.session.commit()
         
         return jsonify({
-            'message': f'Item {item_to_sell["name"]} vendido por {total_earned} moedas de ouro!',
+            'message': f'Item {item_name} vendido por {total_earned} moedas de ouro!',
             'character': character.to_dict()
         }), 200
         
@@ -289,6 +378,15 @@ def sell_item():
         db.session.rollback()
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
 
+@shop_bp.route('/cache/stats', methods=['GET'])
+@require_auth
+def get_shop_cache_stats():
+    """Retorna os contadores do cache e da coalescência de lojas deste worker"""
+    return jsonify({
+        'cache': shop_cache.stats(),
+        'single_flight': shop_flights.stats()
+    }), 200
+
 @shop_bp.route('/types', methods=['GET'])
 def get_shop_types():
     """Retorna os tipos de loja disponíveis"""
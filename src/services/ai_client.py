@@ -0,0 +1,27 @@
+"""
+Cliente de IA compartilhado pelas rotas
+Um backend por worker, escolhido por AI_BACKEND (servidor compatível com OpenAI ou backend falso)
+"""
+
+import os
+import threading
+
+from src.ai_config import AI_BACKEND
+from src.services.llm_backends import create_backend
+
+# Um cliente por processo: workers do gunicorn criados via fork não compartilham conexões
+clients_by_pid = {}
+clients_lock = threading.Lock()
+
+def get_ai_client():
+    """Retorna o backend de IA do processo atual, criando-o na primeira chamada"""
+    pid = os.getpid()
+    client = clients_by_pid.get(pid)
+    if client is None:
+        with clients_lock:
+            client = clients_by_pid.get(pid)
+            if client is None:
+                client = create_backend(AI_BACKEND)
+                clients_by_pid.clear()
+                clients_by_pid[pid] = client
+    return client
@@ -0,0 +1,76 @@
+"""
+Cache em memória com política LRU e expiração por tempo
+Cada worker mantém o seu próprio cache
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+class TTLCache:
+    """Cache LRU com expiração (TTL), limite de tamanho e contadores de acertos/erros"""
+    
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # chave -> (expira_em, valor)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key, default=None):
+        """Retorna o valor em cache ou `default` se ausente/expirado"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key, MISSING)
+            if entry is MISSING:
+                self.misses += 1
+                return default
+            
+            expires_at, value = entry
+            if expires_at <= now:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key, value, ttl=None):
+        """Armazena um valor, removendo o menos usado se o cache estiver cheio"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+    
+    def stats(self):
+        """Contadores do cache para monitoramento"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
@@ -0,0 +1,177 @@
+"""
+Simulador de combate Monte Carlo vetorizado
+Cada tentativa é uma luta completa (ataque contra CA, dano contra PV, crítico no 20 natural);
+as tentativas rodam em lotes NumPy até acabarem ou até estourar o orçamento de tempo
+"""
+
+import time
+import numpy as np
+from src.services.dice_expression import compile_notation, DiceSyntaxError
+from src.services.dice_engine import get_generator
+
+DEFAULT_TRIALS = 100_000
+MAX_TRIALS = 1_000_000
+DEFAULT_MAX_ROUNDS = 20
+MAX_ROUNDS = 100
+SIMULATION_BATCH = 100_000        # Tentativas por lote (limita a memória de cada rodada)
+SIMULATION_DEADLINE = 2.0         # Segundos; lotes que não couberem no orçamento não são rodados
+MAX_DICE_PER_ATTACK = 100         # Dados por notação de ataque ou dano (cada lote rola todos eles)
+DAMAGE_PERCENTILES = (5, 25, 50, 75, 95)
+
+class Combatant:
+    """Lado de uma luta: rolagem de ataque (um d20), dano, CA e PV; sem ataque o lado só apanha"""
+    
+    def __init__(self, ac, hp, attack=None, damage=None):
+        self.ac = ac
+        self.hp = hp
+        self.attack_plan = compile_notation(attack) if attack else None
+        self.damage_plan = compile_notation(damage) if damage else None
+        if (self.attack_plan is None) != (self.damage_plan is None):
+            raise DiceSyntaxError('Ataque e dano devem ser informados juntos')
+        if self.attack_plan is None:
+            return
+        if max(self.attack_plan.dice_count, self.damage_plan.dice_count) > MAX_DICE_PER_ATTACK:
+            raise DiceSyntaxError(f'Máximo de {MAX_DICE_PER_ATTACK} dados por ataque ou dano na simulação')
+        
+        d20 = self.attack_plan.terms[0]
+        kept = d20.quantity
+        if d20.keep:
+            mode, count = d20.keep
+            kept = d20.quantity - count if mode in ('dh', 'dl') else count
+        if d20.sign < 0 or d20.sides != 20 or kept != 1 or d20.explode:
+            raise DiceSyntaxError('O ataque precisa começar com um único d20 mantido (ex: 1d20+5 ou 2d20kh1+5)')
+        self.d20 = d20
+        self.attack_extra = self.attack_plan.terms[1:]
+    
+    @property
+    def can_attack(self):
+        return self.attack_plan is not None
+    
+    def attack(self, trials, generator):
+        """Retorna (d20 natural, total do ataque) de `trials` ataques"""
+        natural = self.d20.sample(trials, generator)
+        total = natural + self.attack_plan.modifier
+        for term in self.attack_extra:
+            total += term.sign * term.sample(trials, generator)
+        return natural, total
+    
+    def damage(self, trials, critical, generator):
+        """Dano de `trials` acertos; críticos rolam os dados de dano duas vezes"""
+        damage = self.damage_plan.sample_dice(trials, generator) + self.damage_plan.modifier
+        crit_count = int(critical.sum())
+        if crit_count:
+            damage[critical] += self.damage_plan.sample_dice(crit_count, generator)
+        return np.maximum(damage, 0)
+
+def resolve_attacks(attacker, defender, trials, generator):
+    """Dano causado pelo atacante em cada tentativa; 20 natural sempre acerta (crítico) e 1 sempre erra"""
+    natural, total = attacker.attack(trials, generator)
+    critical = natural == 20
+    hits = critical | ((natural != 1) & (total >= defender.ac))
+    damage = np.zeros(trials, dtype=np.int64)
+    hit_count = int(hits.sum())
+    if hit_count:
+        damage[hits] = attacker.damage(hit_count, critical[hits], generator)
+    return damage, hits, critical
+
+def simulate_batch(attacker, defender, trials, max_rounds, generator):
+    """Roda `trials` lutas; o atacante age primeiro em cada rodada e o defensor só revida se tiver ataque"""
+    fights_back = defender.can_attack and attacker.hp is not None
+    attacker_hp = np.full(trials, attacker.hp or 0, dtype=np.int64)
+    defender_hp = np.full(trials, defender.hp, dtype=np.int64)
+    rounds = np.zeros(trials, dtype=np.int64)
+    winner = np.zeros(trials, dtype=np.int8)        # 1 atacante, -1 defensor, 0 sem vencedor
+    dealt = np.zeros(trials, dtype=np.int64)
+    taken = np.zeros(trials, dtype=np.int64)
+    attacks = hits = crits = 0
+    
+    active = np.arange(trials)
+    for round_number in range(1, max_rounds + 1):
+        if not active.size:
+            break
+        rounds[active] = round_number
+        
+        damage, round_hits, round_crits = resolve_attacks(attacker, defender, active.size, generator)
+        attacks += active.size
+        hits += int(round_hits.sum())
+        crits += int(round_crits.sum())
+        dealt[active] += damage
+        defender_hp[active] -= damage
+        defeated = defender_hp[active] <= 0
+        winner[active[defeated]] = 1
+        active = active[~defeated]
+        
+        if fights_back and active.size:
+            damage, _, _ = resolve_attacks(defender, attacker, active.size, generator)
+            taken[active] += damage
+            attacker_hp[active] -= damage
+            defeated = attacker_hp[active] <= 0
+            winner[active[defeated]] = -1
+            active = active[~defeated]
+    
+    return {
+        'winner': winner,
+        'rounds': rounds,
+        'dealt': dealt,
+        'taken': taken,
+        'attacks': attacks,
+        'hits': hits,
+        'crits': crits
+    }
+
+def percentiles(values):
+    return {str(p): float(v) for p, v in zip(DAMAGE_PERCENTILES, np.percentile(values, DAMAGE_PERCENTILES))}
+
+def simulate_combat(attacker, defender, trials=DEFAULT_TRIALS, max_rounds=DEFAULT_MAX_ROUNDS,
+                    deadline=SIMULATION_DEADLINE, generator=None):
+    """
+    Simula `trials` lutas entre atacante e defensor em lotes vetorizados
+    Se o orçamento de tempo acabar, devolve o resultado das tentativas já concluídas
+    """
+    generator = generator or get_generator()
+    started = time.perf_counter()
+    batches = []
+    completed = 0
+    while completed < trials:
+        size = min(SIMULATION_BATCH, trials - completed)
+        batches.append(simulate_batch(attacker, defender, size, max_rounds, generator))
+        completed += size
+        
+        # Estima o custo do próximo lote pelo tempo médio dos anteriores
+        elapsed = time.perf_counter() - started
+        if completed < trials and elapsed + elapsed / len(batches) > deadline:
+            break
+    
+    winner = np.concatenate([batch['winner'] for batch in batches])
+    rounds = np.concatenate([batch['rounds'] for batch in batches])
+    dealt = np.concatenate([batch['dealt'] for batch in batches])
+    taken = np.concatenate([batch['taken'] for batch in batches])
+    attacks = sum(batch['attacks'] for batch in batches)
+    hits = sum(batch['hits'] for batch in batches)
+    crits = sum(batch['crits'] for batch in batches)
+    
+    attacker_wins = winner == 1
+    finished = winner != 0
+    result = {
+        'trials': completed,
+        'requested_trials': trials,
+        'truncated': completed < trials,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        'attacker_win_probability': float(attacker_wins.mean()),
+        'defender_win_probability': float((winner == -1).mean()),
+        'unresolved_probability': float((~finished).mean()),
+        'expected_rounds': float(rounds[finished].mean()) if finished.any() else None,
+        'expected_rounds_to_win': float(rounds[attacker_wins].mean()) if attacker_wins.any() else None,
+        'hit_rate': hits / attacks if attacks else 0.0,
+        'crit_rate': crits / attacks if attacks else 0.0,
+        'damage_dealt': {
+            'mean': float(dealt.mean()),
+            'percentiles': percentiles(dealt)
+        }
+    }
+    if defender.can_attack and attacker.hp is not None:
+        result['damage_taken'] = {
+            'mean': float(taken.mean()),
+            'percentiles': percentiles(taken)
+        }
+    return result
@@ -0,0 +1,261 @@
+"""
+Distribuição exata de probabilidade das expressões de dados
+PMF por convolução (FFT para dados em grande quantidade), com resultado memorizado por expressão
+"""
+
+import math
+from functools import lru_cache
+import numpy as np
+from src.services.dice_expression import compile_notation, normalize_notation, COMPARATORS
+
+MAX_SUPPORT = 2_000_000        # Valores possíveis numa distribuição
+MAX_KEEP_DICE = 200            # Dados num termo com keep/drop (DP de estatística de ordem)
+MAX_KEEP_SIDES = 100           # Lados num termo com keep/drop (a DP percorre cada face)
+MAX_KEEP_WORK = 250_000_000    # Custo estimado da DP de keep/drop (ver keep_work), ~100 ms
+KEEP_STEP_COST = 8000          # Custo fixo de cada passo NumPy da DP, em elementos equivalentes
+EXPLODE_EPSILON = 1e-12        # Massa de probabilidade desprezada no fim da cauda de explosões
+FFT_THRESHOLD = 1_000_000      # Acima de len(a) * len(b) a convolução usa FFT
+FFT_NOISE_FLOOR = 1e-14        # Valores da FFT abaixo disso (relativo ao pico) são ruído numérico
+DISTRIBUTION_CACHE_SIZE = 256
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+class DistributionError(ValueError):
+    """Expressão sem distribuição exata disponível"""
+
+def convolve(a, b):
+    """Convolução de duas PMFs; FFT quando o produto dos tamanhos é grande"""
+    if len(a) * len(b) <= FFT_THRESHOLD:
+        return np.convolve(a, b)
+    size = len(a) + len(b) - 1
+    fft_size = 1 << (size - 1).bit_length()
+    result = np.fft.irfft(np.fft.rfft(a, fft_size) * np.fft.rfft(b, fft_size), fft_size)[:size]
+    # Ruído numérico da FFT aparece como valores minúsculos (até negativos) nas caudas
+    result[result < FFT_NOISE_FLOOR * result.max()] = 0.0
+    return result / result.sum()
+
+def convolve_power(pmf, times):
+    """PMF da soma de `times` cópias independentes (exponenciação por quadrados)"""
+    result = np.ones(1)
+    base = pmf
+    while times:
+        if times & 1:
+            result = convolve(result, base)
+        times >>= 1
+        if times:
+            base = convolve(base, base)
+    return result
+
+def die_face_probabilities(term):
+    """Probabilidade de cada face (1..lados) no primeiro lançamento, já com a rerrolagem"""
+    sides = term.sides
+    probabilities = np.full(sides, 1.0 / sides)
+    if not term.reroll:
+        return probabilities
+    
+    faces = np.arange(1, sides + 1)
+    rerolled = COMPARATORS[term.reroll[0]](faces, term.reroll[1])
+    if term.reroll_once:
+        # Face final = primeira rolagem aceita, ou uma segunda rolagem qualquer
+        probabilities = np.where(rerolled, 0.0, 1.0 / sides) + rerolled.sum() / sides / sides
+    else:
+        probabilities = np.where(rerolled, 0.0, 1.0 / (sides - rerolled.sum()))
+    return probabilities
+
+def single_die_pmf(term):
+    """PMF de um dado do termo (índice 0 = valor 0), incluindo explosões"""
+    face_probabilities = die_face_probabilities(term)
+    pmf = np.concatenate(([0.0], face_probabilities))
+    if not term.explode:
+        return pmf
+    
+    faces = np.arange(1, term.sides + 1)
+    exploding = np.concatenate(([False], COMPARATORS[term.explode[0]](faces, term.explode[1])))
+    
+    # Dados extras da explosão são lançamentos comuns (sem rerrolagem): G = A / (1 - B)
+    raw = np.concatenate(([0.0], np.full(term.sides, 1.0 / term.sides)))
+    raw_stop = np.where(exploding, 0.0, raw)
+    raw_explode = np.where(exploding, raw, 0.0)
+    extra = raw_stop
+    chain = raw_stop
+    while True:
+        chain = convolve(chain, raw_explode)
+        extra = np.pad(extra, (0, len(chain) - len(extra)))
+        extra = extra + chain
+        if chain.sum() < EXPLODE_EPSILON or len(extra) > MAX_SUPPORT:
+            break
+    
+    first_stop = np.where(exploding, 0.0, pmf)
+    first_explode = np.where(exploding, pmf, 0.0)
+    result = convolve(first_explode, extra)
+    result[:len(first_stop)] += first_stop
+    return result / result.sum()
+
+def keep_highest_pmf(face_probabilities, dice, keep):
+    """PMF da soma dos `keep` maiores de `dice` dados (DP sobre as faces, da maior para a menor)"""
+    sides = len(face_probabilities)
+    max_sum = keep * sides
+    finished = np.zeros(max_sum + 1)
+    if keep == 0:
+        finished[0] = 1.0
+        return finished
+    
+    # Massa das faces abaixo de cada valor: os dados que sobram depois dos mantidos caem nelas
+    below_mass = np.concatenate(([0.0], np.cumsum(face_probabilities)))
+    # states[i] = distribuição da soma mantida com i < keep dados já atribuídos às faces acima da atual;
+    # ao completar os `keep` mantidos a soma não muda mais, e o caminho vai direto para `finished`
+    states = [np.zeros(max_sum + 1) for _ in range(keep)]
+    states[0][0] = 1.0
+    for value in range(sides, 0, -1):
+        p = face_probabilities[value - 1]
+        below = below_mass[value - 1]
+        next_states = [np.zeros(max_sum + 1) for _ in range(keep)]
+        for assigned, distribution in enumerate(states):
+            if not distribution.any():
+                continue
+            remaining = dice - assigned
+            missing = keep - assigned
+            incomplete = 0.0
+            for count in range(missing):
+                weight = math.comb(remaining, count) * p ** count
+                incomplete += weight * below ** (remaining - count)
+                if weight == 0.0:
+                    continue
+                gained = count * value
+                if gained:
+                    next_states[assigned + count][gained:] += weight * distribution[:-gained]
+                else:
+                    next_states[assigned + count] += weight * distribution
+            
+            # Todas as contagens que completam os mantidos somam o mesmo valor: um único passo
+            completing = max((p + below) ** remaining - incomplete, 0.0)
+            if completing:
+                gained = missing * value
+                finished[gained:] += completing * distribution[:-gained]
+        states = next_states
+    return finished
+
+def keep_work(sides, keep):
+    """Custo estimado da DP de keep/drop: um passo por (face, dados atribuídos, contagem), cada um sobre o suporte"""
+    steps = sides * (keep + 1) * (keep + 2) // 2
+    return steps * (keep * sides + 1 + KEEP_STEP_COST)
+
+def term_pmf(term):
+    """PMF de um termo de dados (índice = valor da soma)"""
+    if term.keep:
+        if term.explode:
+            raise DistributionError('Distribuição exata não disponível para keep/drop com explosão')
+        if term.quantity > MAX_KEEP_DICE:
+            raise DistributionError(f'Distribuição exata de keep/drop limitada a {MAX_KEEP_DICE} dados')
+        if term.sides > MAX_KEEP_SIDES:
+            raise DistributionError(f'Distribuição exata de keep/drop limitada a dados de {MAX_KEEP_SIDES} lados')
+        
+        mode, count = term.keep
+        if mode in ('dh', 'dl'):
+            count = term.quantity - count
+            mode = 'kl' if mode == 'dh' else 'kh'
+        count = max(0, min(count, term.quantity))
+        if count * term.sides > MAX_SUPPORT:
+            raise DistributionError('Expressão grande demais para a distribuição exata')
+        if keep_work(term.sides, count) > MAX_KEEP_WORK:
+            raise DistributionError('Keep/drop custoso demais para a distribuição exata; mantenha ou descarte menos dados')
+        
+        face_probabilities = die_face_probabilities(term)
+        if mode == 'kh':
+            return keep_highest_pmf(face_probabilities, term.quantity, count)
+        # Menores = maiores com as faces espelhadas (v -> lados + 1 - v)
+        mirrored = keep_highest_pmf(face_probabilities[::-1], term.quantity, count)
+        pmf = np.zeros(len(mirrored))
+        offset = count * (term.sides + 1)
+        sums = np.nonzero(mirrored)[0]
+        pmf[offset - sums] = mirrored[sums]
+        return pmf
+    
+    if term.quantity * term.sides > MAX_SUPPORT:
+        raise DistributionError('Expressão grande demais para a distribuição exata')
+    die_pmf = single_die_pmf(term)
+    if term.quantity * (len(die_pmf) - 1) > MAX_SUPPORT:
+        raise DistributionError('Expressão grande demais para a distribuição exata')
+    return convolve_power(die_pmf, term.quantity)
+
+def term_bounds(term):
+    """Menor e maior soma possíveis do termo (maior = None quando a explosão não tem limite)"""
+    faces = np.flatnonzero(die_face_probabilities(term)) + 1
+    count = term.quantity
+    if term.keep:
+        mode, kept = term.keep
+        count = term.quantity - kept if mode in ('dh', 'dl') else kept
+        count = max(0, min(count, term.quantity))
+    highest = None if term.explode else count * int(faces[-1])
+    return count * int(faces[0]), highest
+
+class Distribution:
+    """Distribuição de uma expressão: valores, PMF, CDF e P(X >= v) pré-calculados"""
+    
+    def __init__(self, notation, offset, pmf, min_value=None, max_value=None):
+        # PMF e CDF cobrem só os valores com probabilidade representável; mín/máx são os exatos
+        nonzero = np.nonzero(pmf > 0)[0]
+        pmf = pmf[nonzero[0]:nonzero[-1] + 1]
+        self.notation = notation
+        first_value = offset + int(nonzero[0])
+        last_value = offset + int(nonzero[-1])
+        self.min_value = first_value if min_value is None else min_value
+        self.max_value = last_value if max_value is None else max_value
+        self.first_value = first_value
+        self.values = np.arange(first_value, last_value + 1)
+        self.pmf = pmf / pmf.sum()
+        self.cdf = np.minimum(np.cumsum(self.pmf), 1.0)
+        # at_least[i] = P(X >= values[i])
+        self.at_least = np.minimum(np.cumsum(self.pmf[::-1])[::-1], 1.0)
+        self.mean = float(np.dot(self.values, self.pmf))
+        self.variance = float(np.dot((self.values - self.mean) ** 2, self.pmf))
+    
+    def probability_at_least(self, target):
+        """P(X >= target) em tempo constante"""
+        if target <= self.first_value:
+            return 1.0
+        if target > self.values[-1]:
+            return 0.0
+        return float(self.at_least[target - self.first_value])
+    
+    def probability(self, operator, target):
+        """Probabilidade de (X operador target)"""
+        if operator == '>=':
+            return self.probability_at_least(target)
+        if operator == '>':
+            return self.probability_at_least(target + 1)
+        if operator == '<':
+            return 1.0 - self.probability_at_least(target)
+        if operator == '<=':
+            return 1.0 - self.probability_at_least(target + 1)
+        if self.first_value <= target <= self.values[-1]:
+            return float(self.pmf[target - self.first_value])
+        return 0.0
+    
+    def percentile(self, percent):
+        index = int(np.searchsorted(self.cdf, percent / 100.0 - 1e-12))
+        return int(self.values[min(index, len(self.values) - 1)])
+
+@lru_cache(maxsize=DISTRIBUTION_CACHE_SIZE)
+def distribution_for_normalized(notation):
+    plan = compile_notation(notation)
+    offset = plan.modifier
+    min_value = max_value = plan.modifier
+    pmf = np.ones(1)
+    for term in plan.terms:
+        term_distribution = term_pmf(term)
+        lowest, highest = term_bounds(term)
+        if term.sign < 0:
+            # Termo subtraído: valores de -max a 0
+            term_distribution = term_distribution[::-1]
+            offset -= len(term_distribution) - 1
+            lowest, highest = (None if highest is None else -highest), -lowest
+        min_value = None if min_value is None or lowest is None else min_value + lowest
+        max_value = None if max_value is None or highest is None else max_value + highest
+        pmf = convolve(pmf, term_distribution)
+        if len(pmf) > MAX_SUPPORT:
+            raise DistributionError('Expressão grande demais para a distribuição exata')
+    return Distribution(notation, offset, pmf, min_value, max_value)
+
+def get_distribution(notation):
+    """Distribuição exata da notação, calculada uma vez por expressão normalizada"""
+    return distribution_for_normalized(normalize_notation(notation))
@@ -0,0 +1,99 @@
+"""
+Motor de rolagem de dados vetorizado (NumPy)
+Rolagens enormes são feitas em blocos e devolvidas como resumo (soma, histograma, mín/máx, média)
+"""
+
+import threading
+import numpy as np
+
+MAX_DICE_PER_REQUEST = 5_000_000   # Dados somados de todas as rolagens de uma requisição
+MAX_SIDES = 1_000_000
+SUMMARY_THRESHOLD = 1000           # Acima disso as rolagens individuais não voltam na resposta
+ROLL_CHUNK = 1_000_000             # Dados gerados por vez (limita a memória de rolagens enormes)
+HISTOGRAM_BINS = 100               # Dados com até esse número de lados têm uma barra por face
+
+# numpy.random.Generator não é thread-safe: um gerador por thread
+thread_state = threading.local()
+
+def get_generator():
+    generator = getattr(thread_state, 'generator', None)
+    if generator is None:
+        generator = thread_state.generator = np.random.default_rng()
+    return generator
+
+def histogram_edges(sides):
+    """Limites das barras do histograma; [edges[i], edges[i+1]) para cada barra"""
+    if sides <= HISTOGRAM_BINS:
+        return np.arange(1, sides + 2)
+    return np.unique(np.linspace(1, sides + 1, HISTOGRAM_BINS + 1).astype(np.int64))
+
+def roll_array(quantity, sides, generator=None):
+    """Rola `quantity` dados de `sides` lados e retorna o array de resultados"""
+    generator = generator or get_generator()
+    return generator.integers(1, sides, size=quantity, endpoint=True, dtype=np.int64)
+
+def summarize(values, sides):
+    """Resumo (mín/máx, média e histograma) de resultados já rolados"""
+    edges = histogram_edges(sides)
+    if sides <= HISTOGRAM_BINS:
+        counts = np.bincount(values - 1, minlength=sides)
+    else:
+        counts = np.histogram(values, bins=edges)[0]
+    
+    return {
+        'min': int(values.min()) if len(values) else None,
+        'max': int(values.max()) if len(values) else None,
+        'mean': float(values.mean()) if len(values) else None,
+        'histogram': {
+            'edges': edges.tolist(),
+            'counts': counts.tolist()
+        }
+    }
+
+def roll_dice(quantity, sides, summary=False, generator=None):
+    """
+    Rola os dados e retorna soma e estatísticas
+    Com `summary` (ou acima de SUMMARY_THRESHOLD dados) as rolagens individuais são omitidas
+    """
+    generator = generator or get_generator()
+    keep_rolls = not summary and quantity <= SUMMARY_THRESHOLD
+    
+    if keep_rolls:
+        rolls = roll_array(quantity, sides, generator)
+        return {
+            'rolls': rolls.tolist(),
+            'sum': int(rolls.sum()),
+            'count': quantity
+        }
+    
+    edges = histogram_edges(sides)
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+    total = 0
+    lowest = sides
+    highest = 1
+    
+    remaining = quantity
+    while remaining > 0:
+        chunk = roll_array(min(remaining, ROLL_CHUNK), sides, generator)
+        remaining -= len(chunk)
+        total += int(chunk.sum())
+        lowest = min(lowest, int(chunk.min()))
+        highest = max(highest, int(chunk.max()))
+        if sides <= HISTOGRAM_BINS:
+            counts += np.bincount(chunk - 1, minlength=sides)
+        else:
+            counts += np.histogram(chunk, bins=edges)[0]
+    
+    return {
+        'sum': total,
+        'count': quantity,
+        'summary': {
+            'min': lowest,
+            'max': highest,
+            'mean': total / quantity,
+            'histogram': {
+                'edges': edges.tolist(),
+                'counts': counts.tolist()
+            }
+        }
+    }
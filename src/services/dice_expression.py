@@ -0,0 +1,369 @@
+"""
+Linguagem de expressões de dados
+Notações como 4d6kh3, 1d6!, 2d6ro1, 2d8+1d6+3 e 1d20+5>=15 são compiladas uma vez num plano
+de avaliação; os planos ficam num cache LRU indexado pela notação normalizada
+"""
+
+import re
+from functools import lru_cache
+import numpy as np
+from src.services.dice_engine import (
+    roll_array, roll_dice, summarize, get_generator,
+    MAX_DICE_PER_REQUEST, MAX_SIDES, SUMMARY_THRESHOLD
+)
+
+MAX_TERMS = 20             # Termos por expressão (2d8+1d6+3 tem 3)
+MAX_EXPLOSIONS = 100       # Rodadas de explosão por termo
+MAX_REROLLS = 100          # Rodadas de rerrolagem por termo
+PLAN_CACHE_SIZE = 1024
+
+DICE_RE = re.compile(r'(\d*)d(\d+|%)')
+NUMBER_RE = re.compile(r'\d+')
+COMPARE_RE = re.compile(r'(>=|<=|>|<|=)')
+KEEP_RE = re.compile(r'(kh|kl|dh|dl|k)(\d+)')
+EXPLODE_RE = re.compile(r'!(?:(>=|<=|>|<|=)?(\d+))?')
+REROLL_RE = re.compile(r'(ro|r)(>=|<=|>|<|=)?(\d+)')
+
+COMPARATORS = {
+    '>=': np.greater_equal,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '<': np.less,
+    '=': np.equal,
+}
+
+class DiceSyntaxError(ValueError):
+    """Notação de dados inválida"""
+
+class DiceBudgetExceeded(DiceSyntaxError):
+    """A rolagem geraria mais dados do que o limite da requisição"""
+
+class DiceBudget:
+    """Dados que ainda podem ser gerados numa requisição: base, rerrolagens e explosões"""
+    
+    def __init__(self, limit=MAX_DICE_PER_REQUEST):
+        self.limit = limit
+        self.remaining = limit
+    
+    def spend(self, count):
+        """Reserva `count` dados antes de rolá-los; estoura com DiceBudgetExceeded"""
+        if count > self.remaining:
+            raise DiceBudgetExceeded(f'Máximo de {self.limit} dados por requisição (contando explosões e rerrolagens)')
+        self.remaining -= count
+
+def normalize_notation(notation):
+    return ''.join(notation.lower().split())
+
+def faces_matching(sides, condition):
+    """Quantas faces de 1..sides satisfazem (operador, valor)"""
+    operator, value = condition
+    return int(COMPARATORS[operator](np.arange(1, sides + 1), value).sum())
+
+class DiceTerm:
+    """Um termo de dados (ex: 4d6kh3) com seus modificadores"""
+    
+    def __init__(self, sign, quantity, sides, keep=None, explode=None, reroll=None, reroll_once=False):
+        self.sign = sign
+        self.quantity = quantity
+        self.sides = sides
+        self.keep = keep                # ('kh' | 'kl' | 'dh' | 'dl', n)
+        self.explode = explode          # (operador, valor)
+        self.reroll = reroll            # (operador, valor)
+        self.reroll_once = reroll_once
+    
+    @property
+    def is_plain(self):
+        return not (self.keep or self.explode or self.reroll)
+    
+    def roll_pool(self, generator, budget):
+        """Rola o termo e retorna (todos os dados, dados mantidos); cada lote de dados sai de `budget`"""
+        budget.spend(self.quantity)
+        values = roll_array(self.quantity, self.sides, generator)
+        
+        if self.reroll:
+            compare = COMPARATORS[self.reroll[0]]
+            pending = np.flatnonzero(compare(values, self.reroll[1]))
+            for _ in range(1 if self.reroll_once else MAX_REROLLS):
+                if not pending.size:
+                    break
+                budget.spend(pending.size)
+                values[pending] = roll_array(pending.size, self.sides, generator)
+                pending = pending[compare(values[pending], self.reroll[1])]
+        
+        if self.explode:
+            compare = COMPARATORS[self.explode[0]]
+            batches = [values]
+            exploding = int(compare(values, self.explode[1]).sum())
+            for _ in range(MAX_EXPLOSIONS):
+                if not exploding:
+                    break
+                budget.spend(exploding)
+                batch = roll_array(exploding, self.sides, generator)
+                batches.append(batch)
+                exploding = int(compare(batch, self.explode[1]).sum())
+            values = np.concatenate(batches) if len(batches) > 1 else values
+        
+        if not self.keep:
+            return values, values
+        
+        mode, count = self.keep
+        if mode in ('dh', 'dl'):
+            count = len(values) - count
+            mode = 'kl' if mode == 'dh' else 'kh'
+        count = max(0, min(count, len(values)))
+        if count == len(values):
+            return values, values
+        if count == 0:
+            return values, values[:0]
+        
+        # partition é O(n): não precisa ordenar pools enormes
+        if mode == 'kh':
+            kept = np.partition(values, len(values) - count)[len(values) - count:]
+        else:
+            kept = np.partition(values, count - 1)[:count]
+        return values, kept
+    
+    def sample(self, trials, generator):
+        """Soma mantida do termo em `trials` rolagens independentes (um valor por rolagem)"""
+        values = roll_array(trials * self.quantity, self.sides, generator).reshape(trials, self.quantity)
+        
+        if self.reroll:
+            compare = COMPARATORS[self.reroll[0]]
+            pending = compare(values, self.reroll[1])
+            for _ in range(1 if self.reroll_once else MAX_REROLLS):
+                count = int(pending.sum())
+                if not count:
+                    break
+                values[pending] = roll_array(count, self.sides, generator)
+                pending &= compare(values, self.reroll[1])
+        
+        if self.keep:
+            if self.explode:
+                raise DiceSyntaxError('Amostragem em lote não suporta keep/drop com explosão')
+            mode, count = self.keep
+            if mode in ('dh', 'dl'):
+                count = self.quantity - count
+                mode = 'kl' if mode == 'dh' else 'kh'
+            count = max(0, min(count, self.quantity))
+            values = np.sort(values, axis=1)
+            values = values[:, self.quantity - count:] if mode == 'kh' else values[:, :count]
+        
+        totals = values.sum(axis=1)
+        if self.explode:
+            # Sem keep/drop só a soma importa: cada dado que explode soma uma nova rolagem
+            compare = COMPARATORS[self.explode[0]]
+            exploding = compare(values, self.explode[1]).sum(axis=1)
+            for _ in range(MAX_EXPLOSIONS):
+                count = int(exploding.sum())
+                if not count:
+                    break
+                owners = np.repeat(np.arange(trials), exploding)
+                batch = roll_array(count, self.sides, generator)
+                totals += np.bincount(owners, weights=batch, minlength=trials).astype(np.int64)
+                exploding = np.bincount(owners, weights=compare(batch, self.explode[1]), minlength=trials).astype(np.int64)
+        return totals
+    
+    def evaluate(self, generator, summary, budget):
+        if self.is_plain:
+            budget.spend(self.quantity)
+            result = roll_dice(self.quantity, self.sides, summary, generator)
+            term = {'quantity': self.quantity, 'sides': self.sides, 'sum': result['sum']}
+            if 'rolls' in result:
+                term['rolls'] = result['rolls']
+                term['kept'] = result['rolls']
+            else:
+                term['summary'] = result['summary']
+            return term
+        
+        values, kept = self.roll_pool(generator, budget)
+        term = {'quantity': self.quantity, 'sides': self.sides, 'sum': int(kept.sum())}
+        if not summary and len(values) <= SUMMARY_THRESHOLD:
+            term['rolls'] = values.tolist()
+            term['kept'] = sorted(kept.tolist(), reverse=True)
+        else:
+            term['summary'] = summarize(kept, self.sides)
+        return term
+
+class DicePlan:
+    """Expressão compilada: termos de dados, constante e comparação opcional"""
+    
+    def __init__(self, notation, terms, modifier, comparison):
+        self.notation = notation
+        self.terms = terms
+        self.modifier = modifier
+        self.comparison = comparison    # (operador, alvo) ou None
+    
+    @property
+    def dice_count(self):
+        return sum(term.quantity for term in self.terms)
+    
+    @property
+    def single_term(self):
+        return self.terms[0] if len(self.terms) == 1 else None
+    
+    def sample_dice(self, trials, generator=None):
+        """Soma dos dados (com sinal, sem a constante) em `trials` rolagens vetorizadas"""
+        generator = generator or get_generator()
+        totals = np.zeros(trials, dtype=np.int64)
+        for term in self.terms:
+            totals += term.sign * term.sample(trials, generator)
+        return totals
+    
+    def evaluate(self, generator=None, summary=False, budget=None):
+        """
+        Rola a expressão; rolagens individuais só voltam quando couberem na resposta
+        Todos os dados gerados (inclusive explosões e rerrolagens) saem de `budget`, compartilhável entre planos
+        """
+        generator = generator or get_generator()
+        budget = budget or DiceBudget()
+        term_results = []
+        dice_total = 0
+        for term in self.terms:
+            result = term.evaluate(generator, summary, budget)
+            result['sign'] = term.sign
+            dice_total += term.sign * result['sum']
+            term_results.append(result)
+        
+        total = dice_total + self.modifier
+        evaluation = {
+            'notation': self.notation,
+            'terms': term_results,
+            'dice_total': dice_total,
+            'modifier': self.modifier,
+            'total': total
+        }
+        if all('kept' in result for result in term_results):
+            evaluation['rolls'] = [roll for result in term_results for roll in result['kept']]
+        
+        if self.comparison:
+            operator, target = self.comparison
+            evaluation['comparison'] = {
+                'operator': operator,
+                'target': target,
+                'success': bool(COMPARATORS[operator](total, target))
+            }
+        return evaluation
+
+def parse_modifiers(notation, pos, sides):
+    """Lê os modificadores depois de XdY: keep/drop, explosão e rerrolagem"""
+    modifiers = {}
+    while pos < len(notation):
+        match = KEEP_RE.match(notation, pos)
+        if match and 'keep' not in modifiers:
+            mode = 'kh' if match.group(1) == 'k' else match.group(1)
+            modifiers['keep'] = (mode, int(match.group(2)))
+            pos = match.end()
+            continue
+        
+        match = EXPLODE_RE.match(notation, pos)
+        if match and 'explode' not in modifiers:
+            # '!' sozinho explode no valor máximo do dado
+            value = int(match.group(2)) if match.group(2) is not None else sides
+            modifiers['explode'] = (match.group(1) or '=', value)
+            pos = match.end()
+            continue
+        
+        match = REROLL_RE.match(notation, pos)
+        if match and 'reroll' not in modifiers:
+            modifiers['reroll'] = (match.group(2) or '=', int(match.group(3)))
+            modifiers['reroll_once'] = match.group(1) == 'ro'
+            pos = match.end()
+            continue
+        
+        break
+    return modifiers, pos
+
+def parse_notation(notation):
+    """Compila a notação normalizada num DicePlan; levanta DiceSyntaxError se for inválida"""
+    if not notation:
+        raise DiceSyntaxError('Notação de dados vazia')
+    
+    terms = []
+    modifier = 0
+    comparison = None
+    pos = 0
+    sign = 1
+    if notation[0] in '+-':
+        sign = -1 if notation[0] == '-' else 1
+        pos = 1
+    
+    while True:
+        match = DICE_RE.match(notation, pos)
+        if match:
+            quantity = int(match.group(1)) if match.group(1) else 1
+            sides = 100 if match.group(2) == '%' else int(match.group(2))
+            if quantity <= 0 or sides <= 0:
+                raise DiceSyntaxError('Quantidade e lados devem ser positivos')
+            if sides > MAX_SIDES:
+                raise DiceSyntaxError(f'Máximo de {MAX_SIDES} lados por dado')
+            
+            modifiers, pos = parse_modifiers(notation, match.end(), sides)
+            term = DiceTerm(sign, quantity, sides, **modifiers)
+            if term.explode and faces_matching(sides, term.explode) == sides:
+                raise DiceSyntaxError('A explosão vale para todas as faces e nunca terminaria')
+            if term.reroll and not term.reroll_once and faces_matching(sides, term.reroll) == sides:
+                raise DiceSyntaxError('A rerrolagem vale para todas as faces e nunca terminaria')
+            terms.append(term)
+        else:
+            match = NUMBER_RE.match(notation, pos)
+            if not match:
+                raise DiceSyntaxError(f"Notação inválida perto de '{notation[pos:] or notation}'")
+            modifier += sign * int(match.group())
+            pos = match.end()
+        
+        if len(terms) > MAX_TERMS:
+            raise DiceSyntaxError(f'Máximo de {MAX_TERMS} termos de dados por expressão')
+        
+        if pos == len(notation):
+            break
+        
+        if notation[pos] in '+-':
+            sign = -1 if notation[pos] == '-' else 1
+            pos += 1
+            continue
+        
+        match = COMPARE_RE.match(notation, pos)
+        target = re.fullmatch(r'[+-]?\d+', notation[match.end():]) if match else None
+        if not target:
+            raise DiceSyntaxError(f"Notação inválida perto de '{notation[pos:]}'")
+        comparison = (match.group(1), int(target.group()))
+        break
+    
+    if not terms:
+        raise DiceSyntaxError('A expressão precisa de pelo menos um dado (ex: 1d20)')
+    
+    plan = DicePlan(notation, tuple(terms), modifier, comparison)
+    if plan.dice_count > MAX_DICE_PER_REQUEST:
+        raise DiceSyntaxError(f'Máximo de {MAX_DICE_PER_REQUEST} dados por rolagem')
+    return plan
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_normalized(notation):
+    return parse_notation(notation)
+
+# Planos fixados (presets): nunca saem do cache nem são compilados de novo
+pinned_plans = {}
+
+def compile_notation(notation):
+    """Retorna o plano compilado da notação, usando os planos fixados e o cache LRU"""
+    normalized = normalize_notation(notation)
+    plan = pinned_plans.get(normalized)
+    if plan is None:
+        plan = compile_normalized(normalized)
+    return plan
+
+def pin_notation(notation):
+    """Compila a notação e a fixa fora do LRU (para presets usados o tempo todo)"""
+    normalized = normalize_notation(notation)
+    pinned_plans[normalized] = parse_notation(normalized)
+    return pinned_plans[normalized]
+
+def plan_cache_stats():
+    info = compile_normalized.cache_info()
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'maxsize': info.maxsize,
+        'pinned': len(pinned_plans)
+    }
@@ -0,0 +1,189 @@
+"""
+Gerador procedural de itens para as lojas
+Tabelas de raridade, afixos e escala por nível; a mesma semente (localização, tipo de loja, dia)
+sempre produz a mesma loja
+"""
+
+import hashlib
+import random
+from datetime import datetime
+from itertools import accumulate
+
+# (raridade, peso base, multiplicador de preço, número de afixos, bônus de poder)
+RARITY_TABLE = [
+    ('common', 60, 1.0, 0, 0),
+    ('uncommon', 25, 1.8, 1, 1),
+    ('rare', 10, 3.5, 1, 2),
+    ('epic', 4, 7.0, 2, 3),
+    ('legendary', 1, 15.0, 2, 4),
+]
+
+# Peso extra das raridades acima de comum a cada nível do personagem
+RARITY_LEVEL_SHIFT = 0.08
+
+# Itens base por tipo: nome, descrição, preço base e propriedades ({bonus} e {die} escalam com nível/raridade)
+BASE_ITEMS = {
+    'weapon': [
+        ('Espada Curta', 'Uma lâmina equilibrada, fácil de manejar.', 40, {'damage': '1d6+{bonus}'}),
+        ('Machado de Batalha', 'Um machado pesado de cabo reforçado.', 55, {'damage': '1d8+{bonus}'}),
+        ('Arco Longo', 'Um arco de teixo com corda encerada.', 50, {'damage': '1d8+{bonus}', 'range': '45 metros'}),
+        ('Adaga', 'Uma lâmina curta, ideal para golpes rápidos.', 20, {'damage': '1d4+{bonus}'}),
+        ('Maça', 'Uma cabeça de ferro presa a um cabo de carvalho.', 35, {'damage': '1d6+{bonus}'}),
+        ('Lança', 'Uma haste longa com ponta de aço.', 30, {'damage': '1d8+{bonus}', 'reach': 'Longo'}),
+    ],
+    'armor': [
+        ('Armadura de Couro', 'Couro curtido que protege sem pesar.', 45, {'defense': '+{bonus}', 'weight': 'Leve'}),
+        ('Cota de Malha', 'Anéis de ferro entrelaçados com cuidado.', 90, {'defense': '+{bonus}', 'weight': 'Médio'}),
+        ('Escudo de Madeira', 'Tábuas de carvalho cintadas com ferro.', 25, {'defense': '+{bonus}'}),
+        ('Elmo de Ferro', 'Um elmo simples que protege a cabeça.', 30, {'defense': '+{bonus}'}),
+    ],
+    'potion': [
+        ('Poção de Cura', 'Um líquido vermelho que fecha ferimentos.', 25, {'healing': '{die}d8+{bonus}', 'uses': '1'}),
+        ('Poção de Mana', 'Um líquido azul que restaura a energia mágica.', 30, {'mana': '{die}d6+{bonus}', 'uses': '1'}),
+        ('Antídoto', 'Um frasco amargo que neutraliza venenos.', 20, {'cure': 'Veneno', 'uses': '1'}),
+        ('Elixir de Força', 'Uma mistura espessa que enrijece os músculos.', 40, {'strength': '+{bonus}', 'duration': '1 hora'}),
+    ],
+    'scroll': [
+        ('Pergaminho de Luz', 'Um pergaminho que emite uma luz suave quando lido.', 30, {'spell': 'Luz', 'duration': '1 hora'}),
+        ('Pergaminho de Bola de Fogo', 'Runas que ardem ao toque.', 80, {'spell': 'Bola de Fogo', 'damage': '{die}d6'}),
+        ('Pergaminho de Proteção', 'Um selo que repele ataques menores.', 45, {'spell': 'Proteção', 'defense': '+{bonus}'}),
+        ('Pergaminho de Teleporte', 'Um mapa estelar com coordenadas arcanas.', 120, {'spell': 'Teleporte', 'range': '1 km'}),
+    ],
+    'accessory': [
+        ('Anel de Prata', 'Um anel simples com uma pedra polida.', 60, {'magic_resistance': '{bonus}%'}),
+        ('Amuleto', 'Um pingente preso a uma corrente fina.', 70, {'wisdom': '+{bonus}'}),
+        ('Capa de Viagem', 'Uma capa grossa que protege do frio e da chuva.', 35, {'defense': '+{bonus}'}),
+        ('Botas de Couro', 'Botas macias e resistentes.', 30, {'dexterity': '+{bonus}'}),
+    ],
+    'misc': [
+        ('Corda de Cânhamo', 'Quinze metros de corda resistente.', 10, {'length': '15 metros'}),
+        ('Tocha', 'Um bastão envolto em pano embebido em óleo.', 2, {'duration': '1 hora'}),
+        ('Kit de Escalada', 'Grampos, pitons e uma corda curta.', 25, {'climbing': '+{bonus}'}),
+        ('Ração de Viagem', 'Carne seca, pão duro e frutas secas para um dia.', 5, {'meals': '1'}),
+        ('Caneca de Cerveja', 'A cerveja da casa, espumante e amarga.', 1, {'morale': '+1'}),
+        ('Ensopado Quente', 'Um prato fumegante de carne e legumes.', 3, {'healing': '1d4'}),
+        ('Água Benta', 'Um frasco abençoado pelos sacerdotes.', 25, {'holy_damage': '{die}d6'}),
+        ('Símbolo Sagrado', 'Um emblema de prata consagrado.', 40, {'divine_focus': '+{bonus}'}),
+    ],
+}
+
+# Peso de cada tipo de item por tipo de loja
+SHOP_TYPE_POOLS = {
+    'general': {'weapon': 2, 'armor': 2, 'potion': 2, 'scroll': 1, 'accessory': 1, 'misc': 4},
+    'blacksmith': {'weapon': 6, 'armor': 5, 'misc': 1},
+    'alchemist': {'potion': 7, 'scroll': 2, 'misc': 1},
+    'magic_shop': {'scroll': 5, 'accessory': 4, 'potion': 2},
+    'tavern': {'misc': 6, 'potion': 1},
+    'temple': {'potion': 4, 'scroll': 2, 'accessory': 2, 'misc': 2},
+}
+
+# Afixos: (texto no nome, tipos aceitos, propriedade, valor, multiplicador de preço, frase da descrição)
+AFFIXES = [
+    ('Superior', None, 'quality', 'Superior', 1.3, 'O acabamento é impecável.'),
+    ('Leve', ('weapon', 'armor', 'accessory'), 'weight', 'Leve', 1.2, 'Pesa quase nada.'),
+    ('Resistente', ('weapon', 'armor', 'accessory', 'misc'), 'durability', 'Alta', 1.2, 'Parece capaz de durar gerações.'),
+    ('Veloz', ('weapon', 'accessory'), 'initiative', '+{bonus}', 1.4, 'Move-se mais rápido do que deveria.'),
+    ('do Fogo', ('weapon', 'accessory', 'scroll'), 'fire_damage', '1d{die_size}', 1.6, 'Está sempre morno ao toque.'),
+    ('do Gelo', ('weapon', 'accessory', 'scroll'), 'cold_damage', '1d{die_size}', 1.6, 'Uma fina camada de geada o cobre.'),
+    ('da Proteção', ('armor', 'accessory'), 'defense_bonus', '+{bonus}', 1.5, 'Runas de proteção brilham em sua superfície.'),
+    ('da Vitalidade', ('potion', 'accessory', 'armor'), 'healing_bonus', '+{bonus}', 1.5, 'Emana um calor reconfortante.'),
+    ('das Sombras', ('weapon', 'armor', 'accessory'), 'stealth', '+{bonus}', 1.5, 'Parece absorver a luz ao redor.'),
+    ('Potente', ('potion',), 'potency', 'x2', 1.7, 'A mistura é mais espessa que o normal.'),
+    ('dos Magos', ('scroll', 'accessory'), 'spell_power', '+{bonus}', 1.6, 'Símbolos arcanos percorrem sua superfície.'),
+]
+
+# Modificador de preço pela localização
+LOCATION_PRICE_MODIFIERS = {
+    'vila': 0.8,
+    'cidade': 1.0,
+    'capital': 1.5,
+    'torre': 1.3,
+    'dungeon': 1.2,
+    'floresta': 0.9
+}
+
+SHOP_ITEM_COUNT = (8, 12)
+
+# Pesos acumulados calculados uma vez (random.choices com cum_weights não refaz a soma)
+SHOP_TYPE_CUM_WEIGHTS = {
+    shop_type: (list(pool), list(accumulate(pool.values())))
+    for shop_type, pool in SHOP_TYPE_POOLS.items()
+}
+AFFIXES_BY_TYPE = {
+    item_type: [affix for affix in AFFIXES if affix[1] is None or item_type in affix[1]]
+    for item_type in BASE_ITEMS
+}
+
+def shop_seed(location_key, shop_type, day=None):
+    """Semente estável para (localização, tipo de loja, dia)"""
+    day = day or datetime.utcnow().date()
+    identity = f'{location_key}|{shop_type}|{day.isoformat()}'
+    return int.from_bytes(hashlib.sha256(identity.encode('utf-8')).digest()[:8], 'big')
+
+def rarity_cum_weights(level):
+    """Pesos acumulados das raridades; níveis altos deslocam o sorteio para itens raros"""
+    shift = 1 + RARITY_LEVEL_SHIFT * (max(level, 1) - 1)
+    weights = [weight if rarity == 'common' else weight * shift
+               for rarity, weight, _, _, _ in RARITY_TABLE]
+    return list(accumulate(weights))
+
+def location_price_modifier(location_key):
+    for location_word, modifier in LOCATION_PRICE_MODIFIERS.items():
+        if location_word in location_key:
+            return modifier
+    return 1.0
+
+def fill_template(value, bonus, die):
+    return value.format(bonus=bonus, die=die, die_size=4 + 2 * min(die, 4))
+
+def generate_item(rng, level, item_type, cum_rarity_weights, price_modifier=1.0):
+    """Gera um item do tipo pedido usando o gerador `rng`"""
+    rarity, _, rarity_multiplier, affix_count, power = rng.choices(RARITY_TABLE, cum_weights=cum_rarity_weights)[0]
+    name, description, base_price, base_properties = rng.choice(BASE_ITEMS[item_type])
+    
+    bonus = 1 + (level - 1) // 4 + power
+    die = 1 + (level - 1) // 5 + power // 2
+    properties = {key: fill_template(value, bonus, die) for key, value in base_properties.items()}
+    
+    price_multiplier = rarity_multiplier
+    name_parts = [name]
+    sentences = [description]
+    for affix_name, _, key, value, multiplier, sentence in rng.sample(AFFIXES_BY_TYPE[item_type], affix_count):
+        name_parts.append(affix_name)
+        sentences.append(sentence)
+        properties[key] = fill_template(value, bonus, die)
+        price_multiplier *= multiplier
+    
+    level_multiplier = 1 + 0.15 * (level - 1)
+    return {
+        'name': ' '.join(name_parts),
+        'description': ' '.join(sentences),
+        'type': item_type,
+        'price': max(1, int(base_price * price_multiplier * level_multiplier * price_modifier)),
+        'rarity': rarity,
+        'properties': properties
+    }
+
+def generate_items(location_key, shop_type, level, day=None, count=None):
+    """Gera os itens de uma loja; reprodutível para a mesma localização, tipo e dia"""
+    rng = random.Random(shop_seed(location_key, shop_type, day))
+    level = max(level or 1, 1)
+    item_types, cum_type_weights = SHOP_TYPE_CUM_WEIGHTS.get(shop_type, SHOP_TYPE_CUM_WEIGHTS['general'])
+    cum_rarity_weights = rarity_cum_weights(level)
+    price_modifier = location_price_modifier(location_key)
+    count = count or rng.randint(*SHOP_ITEM_COUNT)
+    
+    items = []
+    names = set()
+    # Limite de tentativas para não girar à toa em pools pequenos
+    for _ in range(count * 3):
+        item_type = rng.choices(item_types, cum_weights=cum_type_weights)[0]
+        item = generate_item(rng, level, item_type, cum_rarity_weights, price_modifier)
+        if item['name'] in names:
+            continue
+        names.add(item['name'])
+        items.append(item)
+        if len(items) == count:
+            break
+    
+    return {'items': items}
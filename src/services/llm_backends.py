@@ -0,0 +1,213 @@
+"""
+Backends de IA intercambiáveis
+O adaptador HTTP fala com qualquer servidor compatível com a OpenAI (a API real ou um stub local);
+o backend falso roda no processo, com latência, cadência de streaming e taxa de falhas configuráveis,
+para testes de carga sem chamadas reais
+"""
+
+import math
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+from src.ai_config import AI_CLIENT_SETTINGS, AI_FAKE_BACKEND_SETTINGS
+from src.services.token_usage import token_usage
+
+# Erros transitórios que valem uma nova tentativa
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+class AIClientError(Exception):
+    """Falha definitiva ao chamar o modelo"""
+
+class LLMBackend(ABC):
+    """
+    Interface dos backends de IA usados pelas rotas
+    Os parâmetros seguem a API de chat da OpenAI (model, messages, max_tokens, temperature);
+    `deadline` é o instante (time.monotonic) em que a chamada desiste, retentativas incluídas;
+    falhas definitivas sobem como AIClientError e os tokens entram na conta de `route`
+    """
+    
+    name = None
+    
+    @abstractmethod
+    def chat(self, route=None, deadline=None, **request):
+        """Devolve o texto completo da resposta"""
+    
+    @abstractmethod
+    def stream_chat(self, route=None, deadline=None, **request):
+        """Gera os pedaços da resposta à medida que chegam"""
+    
+    def close(self):
+        pass
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Cliente de qualquer servidor compatível com a API da OpenAI, com pool de conexões, timeouts e retentativas com jitter"""
+    
+    name = 'openai'
+    
+    def __init__(self, settings=None):
+        self.settings = dict(AI_CLIENT_SETTINGS, **(settings or {}))
+        
+        self.http_client = httpx.Client(
+            timeout=httpx.Timeout(self.settings['read_timeout'], connect=self.settings['connect_timeout']),
+            limits=httpx.Limits(
+                max_connections=self.settings['max_connections'],
+                max_keepalive_connections=self.settings['max_connections'],
+                keepalive_expiry=self.settings['keepalive_expiry']
+            )
+        )
+        
+        # As retentativas ficam a cargo deste cliente, não da biblioteca
+        self.openai = openai.OpenAI(
+            api_key=self.settings['api_key'] or 'not-set',
+            base_url=self.settings['base_url'],
+            http_client=self.http_client,
+            max_retries=0
+        )
+    
+    def backoff_delay(self, attempt):
+        """Tempo de espera antes da próxima tentativa (backoff exponencial com full jitter)"""
+        ceiling = min(self.settings['backoff_max'], self.settings['backoff_base'] * (2 ** attempt))
+        return random.uniform(0, ceiling)
+    
+    def attempt_timeout(self, deadline):
+        """Timeout de uma tentativa: o de leitura, nunca além do orçamento restante"""
+        read = min(self.settings['read_timeout'], deadline - time.monotonic())
+        return httpx.Timeout(read, connect=min(self.settings['connect_timeout'], read))
+    
+    def call_with_retries(self, call, deadline=None):
+        """
+        Executa a chamada respeitando o número máximo de tentativas e o orçamento total
+        O orçamento termina em total_timeout ou no `deadline` de quem chamou, o que vier antes;
+        `call` recebe o timeout da tentativa e nenhuma tentativa começa com o orçamento esgotado
+        """
+        budget_end = time.monotonic() + self.settings['total_timeout']
+        deadline = budget_end if deadline is None else min(deadline, budget_end)
+        attempts = self.settings['max_retries'] + 1
+        last_error = None
+        
+        for attempt in range(attempts):
+            if time.monotonic() >= deadline:
+                break
+            try:
+                return call(self.attempt_timeout(deadline))
+            except RETRYABLE_ERRORS as e:
+                last_error = e
+                delay = self.backoff_delay(attempt)
+                if attempt == attempts - 1 or time.monotonic() + delay >= deadline:
+                    break
+                time.sleep(delay)
+            except openai.OpenAIError as e:
+                raise AIClientError(str(e)) from e
+        
+        if last_error is None:
+            raise AIClientError('Orçamento de tempo da chamada esgotado')
+        raise AIClientError(str(last_error)) from last_error
+    
+    def chat(self, route=None, deadline=None, **request):
+        """Executa uma chamada de chat e devolve o texto da resposta; os tokens entram na conta de `route`"""
+        response = self.call_with_retries(
+            lambda attempt_timeout: self.openai.chat.completions.create(timeout=attempt_timeout, **request),
+            deadline
+        )
+        token_usage.record(route, response.usage)
+        return response.choices[0].message.content.strip()
+    
+    def stream_chat(self, route=None, deadline=None, **request):
+        """Executa uma chamada de chat em streaming, entregando os tokens à medida que chegam"""
+        # O último pedaço do stream traz o uso de tokens (sem choices)
+        request.setdefault('stream_options', {'include_usage': True})
+        
+        # Só a abertura do stream é repetida; depois do primeiro token não há retentativa
+        stream = self.call_with_retries(
+            lambda attempt_timeout: self.openai.chat.completions.create(stream=True, timeout=attempt_timeout, **request),
+            deadline
+        )
+        
+        usage = None
+        for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        token_usage.record(route, usage)
+    
+    def close(self):
+        self.http_client.close()
+
+# Palavras da resposta falsa (o conteúdo não importa, só o tamanho e o ritmo)
+FAKE_WORDS = (
+    'a', 'névoa', 'cobre', 'a', 'estrada', 'enquanto', 'o', 'vento', 'traz', 'vozes', 'da', 'taverna',
+    'e', 'uma', 'sombra', 'se', 'move', 'entre', 'as', 'árvores', 'perto', 'do', 'velho', 'moinho'
+)
+
+class FakeBackend(LLMBackend):
+    """
+    Backend falso e determinístico para testes de carga
+    Latência log-normal, pedaços de streaming em intervalo fixo e falhas sorteadas, tudo a partir
+    de uma semente; respeita o `deadline` da chamada como o cliente real faria
+    """
+    
+    name = 'fake'
+    
+    def __init__(self, settings=None):
+        self.settings = dict(AI_FAKE_BACKEND_SETTINGS, **(settings or {}))
+        self.random = random.Random(self.settings['seed'])
+        self.lock = threading.Lock()
+    
+    def draw(self, deadline):
+        """Sorteia (latência até o primeiro token, falha) de uma chamada"""
+        with self.lock:
+            latency = self.random.lognormvariate(math.log(self.settings['latency_median']),
+                                                 self.settings['latency_sigma'])
+            failed = self.random.random() < self.settings['failure_rate']
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise AIClientError('Tempo limite da chamada excedido (backend falso)')
+        time.sleep(latency)
+        if failed:
+            raise AIClientError('Falha simulada do backend falso')
+    
+    def response_words(self, request):
+        count = min(self.settings['response_words'], request.get('max_tokens') or self.settings['response_words'])
+        return [FAKE_WORDS[i % len(FAKE_WORDS)] for i in range(count)]
+    
+    def usage(self, request, words):
+        prompt_chars = sum(len(message['content']) for message in request.get('messages', ()))
+        return SimpleNamespace(prompt_tokens=prompt_chars // 4, completion_tokens=len(words),
+                               prompt_tokens_details=None)
+    
+    def chat(self, route=None, deadline=None, **request):
+        self.draw(deadline)
+        words = self.response_words(request)
+        token_usage.record(route, self.usage(request, words))
+        return ' '.join(words)
+    
+    def stream_chat(self, route=None, deadline=None, **request):
+        self.draw(deadline)
+        words = self.response_words(request)
+        chunk_words = self.settings['chunk_words']
+        for start in range(0, len(words), chunk_words):
+            if start:
+                time.sleep(self.settings['chunk_interval'])
+            yield ' '.join(words[start:start + chunk_words]) + ' '
+        token_usage.record(route, self.usage(request, words))
+
+BACKENDS = {backend.name: backend for backend in (OpenAICompatibleBackend, FakeBackend)}
+
+def create_backend(name):
+    """Instancia o backend pelo nome (AI_BACKEND)"""
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de IA desconhecido: {name} (opções: {', '.join(sorted(BACKENDS))})")
+    return BACKENDS[name]()
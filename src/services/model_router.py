@@ -0,0 +1,130 @@
+"""
+Roteamento das chamadas de IA entre camadas de modelo
+Cada tipo de resposta tem camada, prazo e reserva (AI_ROUTING); o prazo é um só para a chamada,
+somando a camada principal e a reserva; a latência observada de cada camada
+é uma média móvel exponencial e, quando a camada principal degrada, o tráfego vai para a reserva
+"""
+
+import threading
+import time
+from src.ai_config import (
+    AI_MODEL_TIERS, AI_ROUTING, AI_LATENCY_EWMA_ALPHA, AI_DEGRADED_RATIO, AI_TIER_PROBE_INTERVAL
+)
+from src.services.llm_backends import AIClientError
+
+class TierStats:
+    """Latência média e contadores de uma camada"""
+    
+    def __init__(self):
+        self.latency = None       # Média móvel exponencial, em segundos (None = sem medição)
+        self.calls = 0
+        self.failures = 0
+        self.degraded_calls = 0   # Chamadas que encontraram a camada degradada
+        self.rerouted = 0         # Chamadas desviadas desta camada para a reserva
+
+class ModelRouter:
+    """Escolhe a camada de cada chamada e mede a latência das camadas, seguro entre threads"""
+    
+    def __init__(self, tiers=AI_MODEL_TIERS, routing=AI_ROUTING, alpha=AI_LATENCY_EWMA_ALPHA,
+                 degraded_ratio=AI_DEGRADED_RATIO, probe_interval=AI_TIER_PROBE_INTERVAL):
+        self.tiers = tiers
+        self.routing = routing
+        self.alpha = alpha
+        self.degraded_ratio = degraded_ratio
+        self.probe_interval = probe_interval
+        self.lock = threading.Lock()
+        self.stats_by_tier = {tier: TierStats() for tier in tiers}
+    
+    def route_for(self, response_type):
+        return self.routing.get(response_type, self.routing['medium_response'])
+    
+    def plan(self, response_type):
+        """Camadas a tentar, em ordem, e o prazo total da chamada (segundos, para todas as camadas)"""
+        route = self.route_for(response_type)
+        primary, fallback = route['tier'], route['fallback']
+        if fallback is None:
+            return [primary], route['deadline']
+        
+        with self.lock:
+            primary_stats = self.stats_by_tier[primary]
+            fallback_latency = self.stats_by_tier[fallback].latency
+            degraded = (primary_stats.latency is not None and
+                        primary_stats.latency > route['deadline'] * self.degraded_ratio and
+                        (fallback_latency is None or fallback_latency < primary_stats.latency))
+            if degraded:
+                primary_stats.degraded_calls += 1
+                # Sem chamadas a camada degradada nunca mostraria a recuperação: algumas seguem indo para ela
+                if primary_stats.degraded_calls % self.probe_interval:
+                    primary_stats.rerouted += 1
+                    return [fallback, primary], route['deadline']
+        return [primary, fallback], route['deadline']
+    
+    def observe(self, tier, elapsed, ok=True):
+        """Registra a duração de uma chamada; falhas contam como o prazo inteiro, no mínimo"""
+        with self.lock:
+            stats = self.stats_by_tier[tier]
+            stats.calls += 1
+            if not ok:
+                stats.failures += 1
+            stats.latency = elapsed if stats.latency is None else (
+                self.alpha * elapsed + (1 - self.alpha) * stats.latency
+            )
+    
+    def call_deadline(self, budget, deadline=None):
+        """Instante (time.monotonic) em que a chamada desiste: o prazo da rota, ou antes se `deadline` vier antes"""
+        route_deadline = time.monotonic() + budget
+        return route_deadline if deadline is None else min(deadline, route_deadline)
+    
+    def complete(self, response_type, fn, deadline=None, **request):
+        """Executa `fn(**request)` na camada escolhida; se ela falhar, tenta a reserva dentro do mesmo prazo"""
+        tiers, budget = self.plan(response_type)
+        deadline = self.call_deadline(budget, deadline)
+        if time.monotonic() >= deadline:
+            raise AIClientError('Prazo da chamada esgotado antes de começar')
+        for position, tier in enumerate(tiers):
+            started = time.monotonic()
+            try:
+                result = fn(**dict(request, model=self.tiers[tier], deadline=deadline))
+            except Exception:
+                self.observe(tier, max(time.monotonic() - started, budget), ok=False)
+                if position == len(tiers) - 1 or time.monotonic() >= deadline:
+                    raise
+                continue
+            self.observe(tier, time.monotonic() - started)
+            return result
+    
+    def stream(self, response_type, fn, deadline=None, **request):
+        """Versão em streaming de `complete`; a reserva só entra se nenhum token tiver sido entregue"""
+        tiers, budget = self.plan(response_type)
+        deadline = self.call_deadline(budget, deadline)
+        if time.monotonic() >= deadline:
+            raise AIClientError('Prazo da chamada esgotado antes de começar')
+        for position, tier in enumerate(tiers):
+            started = time.monotonic()
+            delivered = False
+            try:
+                for token in fn(**dict(request, model=self.tiers[tier], deadline=deadline)):
+                    delivered = True
+                    yield token
+            except Exception:
+                self.observe(tier, max(time.monotonic() - started, budget), ok=False)
+                if delivered or position == len(tiers) - 1 or time.monotonic() >= deadline:
+                    raise
+                continue
+            self.observe(tier, time.monotonic() - started)
+            return
+    
+    def stats(self):
+        with self.lock:
+            return {
+                tier: {
+                    'model': self.tiers[tier],
+                    'latency_ms': None if stats.latency is None else round(stats.latency * 1000, 1),
+                    'calls': stats.calls,
+                    'failures': stats.failures,
+                    'rerouted': stats.rerouted
+                }
+                for tier, stats in self.stats_by_tier.items()
+            }
+
+model_router = ModelRouter()
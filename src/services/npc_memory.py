@@ -0,0 +1,176 @@
+"""
+Índice local de recuperação sobre as memórias dos NPCs
+TF-IDF com hashing de termos em NumPy, um índice por sessão em memória (sem serviço externo);
+memórias novas entram de forma incremental e cada consulta devolve só as top-k relevantes
+"""
+
+import re
+import threading
+import unicodedata
+import zlib
+import numpy as np
+from src.services.cache import TTLCache
+
+HASH_DIM = 2 ** 15             # Baldes do hashing de termos (colisões raras com o vocabulário de uma sessão)
+MEMORY_TOP_K = 5
+RECENCY_WEIGHT = 0.05          # Desempate a favor das memórias mais novas
+MEMORY_INDEX_CACHE_SIZE = 128  # Sessões com índice em memória por worker
+MEMORY_INDEX_TTL = 1800        # Segundos até o índice da sessão ser reconstruído a partir do banco
+
+TOKEN_RE = re.compile(r'\w{3,}')
+STOPWORDS = frozenset('''
+    que com para por uma uns umas dos das nos nas num numa pelo pela pelos pelas seu sua seus suas
+    ele ela eles elas isso isto esse essa este esta aquele aquela mas mais como quando onde muito
+    entre sobre ate sem tem ter foi era sao ser esta estao voce voces ainda apos acao autonoma
+    the and for with
+'''.split())
+
+def tokenize(text):
+    """Termos normalizados (minúsculas, sem acentos, sem palavras vazias)"""
+    text = unicodedata.normalize('NFKD', text.lower()).encode('ascii', 'ignore').decode('ascii')
+    return [token for token in TOKEN_RE.findall(text) if token not in STOPWORDS]
+
+def hash_terms(text):
+    """Baldes e frequências dos termos do texto"""
+    buckets = [zlib.crc32(token.encode('ascii')) % HASH_DIM for token in tokenize(text)]
+    if not buckets:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    unique, counts = np.unique(np.array(buckets, dtype=np.int64), return_counts=True)
+    # TF sublinear: repetir uma palavra não domina a memória
+    return unique, (1 + np.log(counts)).astype(np.float32)
+
+def memory_text(entry, key):
+    value = entry.get(key, '') if isinstance(entry, dict) else entry
+    return value if isinstance(value, str) else str(value)
+
+def memory_timestamp(entry):
+    return entry.get('timestamp') if isinstance(entry, dict) else None
+
+class NPCMemories:
+    """Memórias indexadas de um NPC em formato COO (documento, balde, tf)"""
+    
+    def __init__(self):
+        self.memories = []              # {'kind', 'text', 'timestamp'} na ordem de chegada
+        self.indexed = {'memory': 0, 'interaction': 0}
+        self.chunks = []                # (documentos, baldes, tf) ainda não consolidados
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.buckets = np.zeros(0, dtype=np.int64)
+        self.tf = np.zeros(0, dtype=np.float32)
+    
+    def add(self, kind, text, timestamp):
+        """Adiciona uma memória; retorna os baldes distintos para o DF da sessão"""
+        buckets, tf = hash_terms(text)
+        doc_id = len(self.memories)
+        self.memories.append({'kind': kind, 'text': text, 'timestamp': timestamp})
+        if len(buckets):
+            self.chunks.append((np.full(len(buckets), doc_id, dtype=np.int64), buckets, tf))
+        return buckets
+    
+    def consolidate(self):
+        if not self.chunks:
+            return
+        doc_ids, buckets, tf = zip(*self.chunks)
+        self.doc_ids = np.concatenate((self.doc_ids,) + doc_ids)
+        self.buckets = np.concatenate((self.buckets,) + buckets)
+        self.tf = np.concatenate((self.tf,) + tf)
+        self.chunks = []
+
+class SessionMemoryIndex:
+    """Índice TF-IDF das memórias de todos os NPCs de uma sessão"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.npcs = {}                                  # npc_id -> NPCMemories
+        self.document_frequency = np.zeros(HASH_DIM, dtype=np.float32)
+        self.documents = 0
+    
+    def add_memory(self, memories, kind, text, timestamp):
+        buckets = memories.add(kind, text, timestamp)
+        self.document_frequency[buckets] += 1
+        self.documents += 1
+    
+    def remove_npc(self, npc_id):
+        memories = self.npcs.pop(npc_id, None)
+        if memories is None:
+            return
+        memories.consolidate()
+        # Cada par (documento, balde) é único, então o DF cai exatamente uma vez por memória
+        np.subtract.at(self.document_frequency, memories.buckets, 1)
+        self.documents -= len(memories.memories)
+    
+    def sync_npc(self, npc):
+        """Indexa só as memórias e interações novas do NPC (os logs só crescem)"""
+        memory_log = npc.get_memory_log()
+        interactions = npc.get_interaction_history()
+        with self.lock:
+            memories = self.npcs.get(npc.id)
+            if memories is not None and (memories.indexed['memory'] > len(memory_log) or
+                                         memories.indexed['interaction'] > len(interactions)):
+                # Log reescrito por fora: reindexa o NPC do zero
+                self.remove_npc(npc.id)
+                memories = None
+            if memories is None:
+                memories = self.npcs[npc.id] = NPCMemories()
+            
+            for entry in memory_log[memories.indexed['memory']:]:
+                self.add_memory(memories, 'memory', memory_text(entry, 'event'), memory_timestamp(entry))
+            for entry in interactions[memories.indexed['interaction']:]:
+                self.add_memory(memories, 'interaction', memory_text(entry, 'interaction'), memory_timestamp(entry))
+            memories.indexed['memory'] = len(memory_log)
+            memories.indexed['interaction'] = len(interactions)
+    
+    def search(self, query, npc_ids=None, k=MEMORY_TOP_K):
+        """Top-k memórias por similaridade de cosseno com a consulta (toda a sessão ou só `npc_ids`)"""
+        query_buckets, query_tf = hash_terms(query)
+        if not len(query_buckets):
+            return []
+        
+        with self.lock:
+            idf = np.log((1 + self.documents) / (1 + self.document_frequency)) + 1
+            query_vector = np.zeros(HASH_DIM, dtype=np.float32)
+            query_vector[query_buckets] = query_tf * idf[query_buckets]
+            query_vector /= np.linalg.norm(query_vector)
+            
+            results = []
+            for npc_id in (self.npcs if npc_ids is None else npc_ids):
+                memories = self.npcs.get(npc_id)
+                if memories is None or not memories.memories:
+                    continue
+                memories.consolidate()
+                count = len(memories.memories)
+                weights = memories.tf * idf[memories.buckets]
+                norms = np.sqrt(np.bincount(memories.doc_ids, weights=weights ** 2, minlength=count))
+                dots = np.bincount(memories.doc_ids, weights=weights * query_vector[memories.buckets], minlength=count)
+                scores = np.divide(dots, norms, out=np.zeros(count), where=norms > 0)
+                
+                matched = np.flatnonzero(scores > 0)
+                if not matched.size:
+                    continue
+                scores = scores[matched] + RECENCY_WEIGHT * (matched + 1) / count
+                for position in np.argsort(-scores)[:k]:
+                    memory = memories.memories[matched[position]]
+                    results.append(dict(memory, npc_id=npc_id, score=round(float(scores[position]), 4)))
+        
+        results.sort(key=lambda memory: memory['score'], reverse=True)
+        return results[:k]
+
+# Índices por sessão; uma sessão que volta depois de expirar é reindexada a partir do banco
+memory_indexes = TTLCache(maxsize=MEMORY_INDEX_CACHE_SIZE, ttl=MEMORY_INDEX_TTL)
+memory_indexes_lock = threading.Lock()
+
+def get_session_index(session_id):
+    index = memory_indexes.get(session_id)
+    if index is None:
+        with memory_indexes_lock:
+            index = memory_indexes.get(session_id)
+            if index is None:
+                index = SessionMemoryIndex()
+                memory_indexes.set(session_id, index)
+    return index
+
+def relevant_memories(session_id, npcs, query, k=MEMORY_TOP_K):
+    """Sincroniza o índice com os NPCs informados e devolve as top-k memórias deles para a consulta"""
+    index = get_session_index(session_id)
+    for npc in npcs:
+        index.sync_npc(npc)
+    return index.search(query, [npc.id for npc in npcs], k)
@@ -0,0 +1,34 @@
+"""
+Tarefas periódicas em segundo plano, fora do caminho das requisições
+Cada worker roda a sua própria thread; tarefas que não podem rodar em dobro se coordenam pelo banco
+"""
+
+import threading
+
+class PeriodicTask:
+    """Executa `fn` a cada `interval` segundos numa thread daemon, dentro do app context"""
+    
+    def __init__(self, name, interval, fn):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.stop_event = threading.Event()
+        self.thread = None
+    
+    def start(self, app):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, args=(app,), name=self.name, daemon=True)
+        self.thread.start()
+    
+    def run(self, app):
+        while not self.stop_event.wait(self.interval):
+            with app.app_context():
+                try:
+                    self.fn()
+                except Exception as e:
+                    print(f"Erro na tarefa {self.name}: {e}")
+    
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,82 @@
+"""
+Fluxos de números aleatórios por sessão de jogo
+Cada (semente da sessão, turno) deriva um gerador NumPy independente; os sorteios do turno são
+anotados para o log de rolagens e podem ser reproduzidos depois a partir da semente
+"""
+
+import secrets
+import numpy as np
+from src.services.dice_expression import compile_notation
+
+def new_session_seed():
+    """Semente nova para uma sessão (cabe num INTEGER de 64 bits com sinal)"""
+    return secrets.randbits(63)
+
+def turn_generator(seed, turn):
+    """Gerador do turno: o mesmo par (semente, turno) sempre produz a mesma sequência"""
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(turn,))))
+
+class TurnRandom:
+    """Aleatoriedade de um turno; cada sorteio vira um registro do log de rolagens"""
+    
+    def __init__(self, seed, turn, context):
+        self.seed = seed
+        self.turn = turn
+        self.context = context          # 'player_action', 'npc_update', 'dice'...
+        self.generator = turn_generator(seed, turn)
+        self.records = []
+    
+    def record(self, kind, label, params, result):
+        self.records.append({
+            'seq': len(self.records) + 1,
+            'kind': kind,
+            'label': label,
+            'params': params,
+            'result': result
+        })
+    
+    def chance(self, probability, label=None):
+        """True com a probabilidade informada"""
+        draw = float(self.generator.random())
+        hit = draw < probability
+        self.record('chance', label, {'p': probability}, {'draw': draw, 'hit': hit})
+        return hit
+    
+    def choice(self, options, label=None):
+        """Sorteia um elemento da lista"""
+        index = int(self.generator.integers(len(options)))
+        self.record('choice', label, {'options': list(options)}, {'index': index})
+        return options[index]
+    
+    def roll(self, notation, label=None):
+        """Rola uma notação de dados com o gerador do turno"""
+        evaluation = compile_notation(notation).evaluate(generator=self.generator)
+        result = {'total': evaluation['total']}
+        if 'rolls' in evaluation:
+            result['rolls'] = evaluation['rolls']
+        self.record('roll', label, {'notation': notation}, result)
+        return evaluation
+
+def replay_turn(seed, turn, context, records):
+    """Refaz os sorteios registrados de um turno e compara com o que foi gravado"""
+    turn_random = TurnRandom(seed, turn, context)
+    for record in records:
+        params = record['params']
+        if record['kind'] == 'chance':
+            turn_random.chance(params['p'], record['label'])
+        elif record['kind'] == 'choice':
+            turn_random.choice(params['options'], record['label'])
+        else:
+            turn_random.roll(params['notation'], record['label'])
+    
+    replayed = []
+    for record, replay in zip(records, turn_random.records):
+        replayed.append({
+            'seq': record['seq'],
+            'kind': record['kind'],
+            'label': record['label'],
+            'recorded': record['result'],
+            'replayed': replay['result'],
+            'matches': record['result'] == replay['result']
+        })
+    return replayed
@@ -0,0 +1,68 @@
+"""
+Coalescência de chamadas idênticas em andamento (single-flight)
+Chamadores concorrentes com a mesma chave esperam uma única execução e compartilham o resultado
+"""
+
+import hashlib
+import json
+import threading
+
+class InFlightCall:
+    """Chamada em andamento compartilhada pelos chamadores de uma mesma chave"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Executa no máximo uma chamada por chave ao mesmo tempo dentro do worker"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.coalesced = 0
+    
+    def do(self, key, fn, *args, **kwargs):
+        """Executa `fn` ou espera a execução em andamento com a mesma chave"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = InFlightCall()
+                self.calls[key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # A chave sai do mapa antes de liberar os seguidores; novas chamadas executam de novo
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'in_flight': len(self.calls),
+                'executed': self.executed,
+                'coalesced': self.coalesced
+            }
+
+def request_key(payload):
+    """Gera uma chave estável para os parâmetros de uma requisição"""
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
@@ -0,0 +1,93 @@
+"""
+Montagem do contexto da narração com orçamento de tokens
+O histórico antigo vive num resumo contínuo (atualizado a cada poucos turnos, fora da requisição);
+cada turno usa o resumo, a cena atual e as entradas recentes até o limite de tokens
+"""
+
+from src.ai_config import (
+    STORY_CONTEXT_TOKEN_BUDGET, STORY_SUMMARY_TOKEN_BUDGET, STORY_SCENE_TOKEN_BUDGET,
+    STORY_MEMORY_TOKEN_BUDGET, STORY_SUMMARY_INTERVAL, STORY_RECENT_ENTRIES
+)
+
+CHARS_PER_TOKEN = 4       # Estimativa média para texto em português nos modelos GPT
+
+def estimate_tokens(text):
+    """Estimativa barata de tokens (sem tokenizador): ~4 caracteres por token"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+def truncate_to_tokens(text, budget, keep='start'):
+    """Corta o texto para caber em `budget` tokens, mantendo o início ou o fim"""
+    text = text or ''
+    limit = budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    if limit <= 3:
+        return ''
+    return text[:limit - 3] + '...' if keep == 'start' else '...' + text[len(text) - limit + 3:]
+
+def format_entry(entry):
+    speaker = entry['character'] or entry['type']
+    return f"[{entry['seq']}] {speaker}: {entry['content']}"
+
+def fit_lines(lines, budget):
+    """Primeiras linhas (em ordem de prioridade) que cabem no orçamento"""
+    selected = []
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if cost > budget:
+            break
+        selected.append(line)
+        budget -= cost
+    return selected
+
+def build_story_context(game_session, recent_entries, memories=(), budget=STORY_CONTEXT_TOKEN_BUDGET):
+    """
+    Monta o contexto do turno dentro do orçamento de tokens
+    Ordem de prioridade: localização e contexto fixo, cena atual, resumo, memórias de NPCs
+    (já ordenadas por relevância) e entradas recentes (as mais novas primeiro)
+    """
+    header = [
+        f"Contexto da história: {game_session.story_context or ''}",
+        f"Localização: {game_session.current_location or ''}"
+    ]
+    header_text = '\n'.join(header)
+    remaining = budget - estimate_tokens(header_text)
+    
+    scene = truncate_to_tokens(game_session.current_scene, min(STORY_SCENE_TOKEN_BUDGET, max(remaining, 0)), keep='end')
+    remaining -= estimate_tokens(scene)
+    
+    summary = truncate_to_tokens(game_session.story_summary, min(STORY_SUMMARY_TOKEN_BUDGET, max(remaining, 0)))
+    remaining -= estimate_tokens(summary)
+    
+    memory_lines = fit_lines(memories, min(STORY_MEMORY_TOKEN_BUDGET, max(remaining, 0)))
+    remaining -= sum(estimate_tokens(line) + 1 for line in memory_lines)
+    
+    # Entradas recentes da mais nova para a mais antiga, até acabar o orçamento
+    lines = fit_lines([format_entry(entry) for entry in reversed(recent_entries)], remaining)
+    lines.reverse()
+    
+    sections = [header_text]
+    if summary:
+        sections.append(f"Resumo da aventura até aqui: {summary}")
+    sections.append(f"Cena atual: {scene}")
+    if memory_lines:
+        sections.append("Memórias relevantes dos NPCs:\n" + '\n'.join(memory_lines))
+    if lines:
+        sections.append("Últimas entradas do log:\n" + '\n'.join(lines))
+    return '\n'.join(sections)
+
+def summary_due(game_session):
+    """O resumo precisa ser atualizado quando há entradas antigas suficientes fora dele"""
+    pending = (game_session.story_seq or 0) - STORY_RECENT_ENTRIES - (game_session.summary_seq or 0)
+    return pending >= STORY_SUMMARY_INTERVAL
+
+# Instruções fixas do resumo (prefixo estável entre chamadas)
+SUMMARY_INSTRUCTIONS = f"""Atualize o resumo de uma aventura de RPG incorporando os novos acontecimentos.
+Escreva um único parágrafo com no máximo {STORY_SUMMARY_TOKEN_BUDGET * CHARS_PER_TOKEN // 6} palavras. Preserve nomes de personagens e lugares,
+promessas, dívidas, inimigos, objetivos em aberto e consequências que ainda importam.
+Descarte detalhes que não afetam o que vem a seguir."""
+
+def build_summary_prompt(summary, entries):
+    """Prompt com o resumo atual e as entradas novas (as instruções vão em SUMMARY_INSTRUCTIONS)"""
+    new_events = '\n'.join(format_entry(entry) for entry in entries)
+    return f"Resumo atual: {summary or '(a aventura acabou de começar)'}\n\nNovos acontecimentos:\n{new_events}"
@@ -0,0 +1,52 @@
+"""
+Contabilidade de tokens das chamadas de IA por rota
+Cada worker soma os tokens de prompt (incluindo os servidos do cache de prompt) e de resposta
+"""
+
+import threading
+
+class TokenUsage:
+    """Contadores de tokens por rota, seguros entre threads"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+    
+    def record(self, route, usage):
+        """Soma o `usage` devolvido pela API (None quando o servidor não informa)"""
+        route = route or 'unknown'
+        with self.lock:
+            counters = self.routes.setdefault(route, {
+                'calls': 0,
+                'prompt_tokens': 0,
+                'cached_prompt_tokens': 0,
+                'completion_tokens': 0,
+                'calls_without_usage': 0
+            })
+            counters['calls'] += 1
+            if usage is None:
+                counters['calls_without_usage'] += 1
+                return
+            counters['prompt_tokens'] += usage.prompt_tokens or 0
+            counters['completion_tokens'] += usage.completion_tokens or 0
+            details = getattr(usage, 'prompt_tokens_details', None)
+            counters['cached_prompt_tokens'] += getattr(details, 'cached_tokens', None) or 0
+    
+    def snapshot(self):
+        """Totais por rota com médias por chamada e a fração do prompt que veio do cache"""
+        with self.lock:
+            routes = {route: dict(counters) for route, counters in self.routes.items()}
+        
+        for counters in routes.values():
+            measured = counters['calls'] - counters['calls_without_usage']
+            counters['avg_prompt_tokens'] = round(counters['prompt_tokens'] / measured, 1) if measured else None
+            counters['avg_completion_tokens'] = round(counters['completion_tokens'] / measured, 1) if measured else None
+            counters['cached_prompt_ratio'] = (round(counters['cached_prompt_tokens'] / counters['prompt_tokens'], 4)
+                                               if counters['prompt_tokens'] else 0.0)
+        return routes
+    
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+token_usage = TokenUsage()